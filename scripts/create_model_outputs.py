@@ -23,122 +23,216 @@
 # SOFTWARE.
 
 import os
-from itu_p1203.p1203Pv import P1203Pv
-from itu_p1203.p1203Pq import P1203Pq
+from itu_p1203 import pqbatch
+from itu_p1203 import vectorized
+from itu_p1203 import featurestore
 import pandas as pd
 import yaml
 import argparse
 import json
+import multiprocessing
 import numpy as np
 from tqdm import tqdm
 
-tqdm.pandas()
-
 DB_IDS = ['TR04', 'TR06', 'VL04', 'VL13']
+MODES = ['mode0', 'mode1', 'mode2', 'mode3']
+VALID_FRAME_TYPES = ["I", "P", "B", "Non-I"]
+DEVICES = ['mobile', 'pc']
+
+# columns of the mode 2/3 feature CSVs that hold one list per sample
+MODE2_LIST_COLUMNS = ["types", "sizes", "BS_TwoPercentQP1"]
+MODE3_LIST_COLUMNS = ["types", "BS_Av_QPBB"]
+# list columns whose unparseable cells mark a sample without bitstream data
+MODE2_LENIENT_COLUMNS = ["BS_TwoPercentQP1"]
+
+# number of O46 results to collect before writing their JSON files
+WRITE_BATCH_SIZE = 256
+# maximum number of sessions integrated together with pqbatch
+PQ_BATCH_SIZE = 256
 
 ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
 
 
-def parse_mode3_features(pvs_id, features_mode3_path):
-    pvs_features = pd.read_csv(
-        os.path.join(
-            features_mode3_path,
-            pvs_id + '.csv')
-        )
-    return pvs_features
-
-
-def calc_mode0_O22(row):
-    pvs_features = (int(row["coding_res"]),
-                    int(row["display_res"]),
-                    float(row["bitrate_kbps_segment_size"]),
-                    int(row["framerate"]))
-
-    return P1203Pv.video_model_function_mode0(*pvs_features)
-
-
-def calc_mode1_O22(row):
-    pvs_features = (int(row["coding_res"]),
-                    int(row["display_res"]),
-                    float(row["bitrate_kbps_segment_size"]),
-                    int(row["framerate"]),
-                    [],
-                    float(row["iframe_ratio"]))
-
-    return P1203Pv.video_model_function_mode1(*pvs_features)
-
-
-def calc_mode2_O22(row):
-    # check if fallback is needed
-    has_bitstream_data = "BS_TwoPercentQP1" in row.keys() and isinstance(row["BS_TwoPercentQP1"], str)
-
-    try:
-        avg_qp = eval(row["BS_TwoPercentQP1"])
-    except Exception as e:
-        has_bitstream_data = False
-
-    if has_bitstream_data:
-        frame_types = eval(row["types"])
-        frames = []
-        for ftyp, qp_values in zip(frame_types, avg_qp):
-            frames.append({
-                'type': ftyp,
-                'qpValues': [qp_values]
-            })
-
-        pvs_features = (
-            int(row["coding_res"]),
-            int(row["display_res"]),
-            int(row["framerate"]),
-            frames,
-            None,
-            []
-        )
+def read_features(features_path, pvss, list_columns, lenient_columns=()):
+    """
+    Read the per-PVS feature CSVs of a mode from the feature store next to
+    the folder (features_modeX.npz); the store is created from the CSVs if
+    it does not exist yet
+    """
+    store_path = features_path + '.npz'
+    if os.path.isfile(store_path):
+        store = featurestore.read_feature_store(store_path)
+        if set(np.unique(store["pvs_id"])) >= set(pvss):
+            return store
+        print('Feature store {} does not contain all PVSes, recreating it'.format(store_path))
+    print('Converting {} to {} (only needed once) ...'.format(features_path, store_path))
+    csv_files = [os.path.join(features_path, pvs_id + '.csv') for pvs_id in pvss]
+    return featurestore.convert_csv_files(tqdm(csv_files), store_path, list_columns, lenient_columns)
+
+
+def features_table(store, columns):
+    """
+    Data frame of the given scalar columns of a feature store (columns that are
+    not in the store are left out)
+    """
+    scalars = store.scalar_columns()
+    return pd.DataFrame({name: scalars[name] for name in columns if name in scalars})
+
+
+def frame_qp_arrays(store, qp_column):
+    """
+    I-frame flags and QP values of the frames of all samples, plus offsets per sample.
+    Like zip() on the per-sample lists, frames without QP values (or types) are ignored.
+    """
+    types = store["types"]
+    invalid = set(types.categories or []) - set(VALID_FRAME_TYPES)
+    if invalid:
+        raise ValueError("frame type " + str(sorted(invalid)[0]) + " not valid; must be I/P/B or I/Non-I")
+    qp_values = store[qp_column]
+    lengths = np.minimum(types.lengths(), qp_values.lengths())
+    if not np.array_equal(lengths, types.lengths()):
+        types = types.truncate(lengths)
+    if not np.array_equal(lengths, qp_values.lengths()):
+        qp_values = qp_values.truncate(lengths)
+    return types.equals("I"), qp_values.values, qp_values.offsets
+
+
+def calc_mode0_O22(features):
+    return vectorized.video_model_function_mode0(
+        features["coding_res"].astype(int),
+        features["display_res"].astype(int),
+        features["bitrate_kbps_segment_size"].astype(float),
+        features["framerate"].astype(int)
+    )
 
-        return P1203Pv.video_model_function_mode2(*pvs_features)
-    else:
-        # tqdm.write("Switching back to Mode 1 for PVS {}, sample index {}".format(row["pvs_id"], row["sample_index"]))
-        return None
-
-
-def calc_mode3_O22(row):
-    frame_types = eval(row["types"])
-    avg_qp = eval(row["BS_Av_QPBB"])
-
-    frames = []
-    for ftyp, qp_values in zip(frame_types, avg_qp):
-        frames.append({
-            'type': ftyp,
-            'qpValues': [qp_values]
-        })
-
-    pvs_features = (
-        int(row["coding_res"]),
-        int(row["display_res"]),
-        float(row["framerate"]),
-        frames,
-        None,
-        []
+
+def calc_mode1_O22(features):
+    return vectorized.video_model_function_mode1(
+        features["coding_res"].astype(int),
+        features["display_res"].astype(int),
+        features["bitrate_kbps_segment_size"].astype(float),
+        features["framerate"].astype(int),
+        features["iframe_ratio"].astype(float)
     )
 
-    return P1203Pv.video_model_function_mode3(*pvs_features)
 
+def calc_mode2_O22(store, features, mode1_features):
+    """
+    Mode 2 scores, falling back to the mode 1 score of the same sample
+    where no (usable) bitstream data is available
+    """
+    qp_column = store["BS_TwoPercentQP1"]
+    has_bitstream_data = qp_column.valid & qp_column.finite_rows()
+    avg_qp = vectorized.avg_noni_qp(*frame_qp_arrays(store, "BS_TwoPercentQP1"), mode=2)
+
+    O22 = vectorized.video_model_function_quant(
+        features["coding_res"].astype(int),
+        features["display_res"].astype(int),
+        features["framerate"].astype(int),
+        avg_qp / 51.0
+    )
+
+    fallback = features.loc[~has_bitstream_data, ["pvs_id", "sample_index"]].merge(
+        mode1_features[["pvs_id", "sample_index", "O22"]],
+        on=["pvs_id", "sample_index"],
+        how="left"
+    )
+    O22[~has_bitstream_data] = fallback["O22"].values
+    return O22
 
-def calc_O46(O21, O22, device, stall_vec=[]):
-    l_buff = []
-    p_buff = []
-    if stall_vec:
-        for l, p in stall_vec:
-            l_buff.append(l)
-            p_buff.append(p)
 
-    pq_fun = P1203Pq(O21, O22, l_buff, p_buff, device)
-    return pq_fun.calculate()
+def calc_mode3_O22(store, features):
+    avg_qp = vectorized.avg_noni_qp(*frame_qp_arrays(store, "BS_Av_QPBB"), mode=3)
 
+    return vectorized.video_model_function_quant(
+        features["coding_res"].astype(int),
+        features["display_res"].astype(int),
+        features["framerate"].astype(float),
+        avg_qp / 51.0
+    )
 
-def main(args):
 
-    db_data = pd.DataFrame()
+def scores_per_pvs(data, column):
+    """
+    Return dict of pvs_id -> list of values of the column, ordered by sample index
+    """
+    data = data.sort_values(by=['pvs_id', 'sample_index'], kind='mergesort')
+    return {pvs_id: group[column].tolist() for pvs_id, group in data.groupby('pvs_id', sort=False)}
+
+
+def calc_O46_outputs(tasks):
+    """
+    Run Pq for a list of (pvs_id, mode_id, device, O21, O22, I23) tasks at once;
+    called in the worker processes
+
+    Returns:
+        list -- tuples of pvs_id, mode_id, device and the data of the O46 JSON file
+    """
+    O46_vals = pqbatch.calculate_batch(
+        [task[3] for task in tasks],
+        [task[4] for task in tasks],
+        [[l for l, p in task[5] or []] for task in tasks],
+        [[p for l, p in task[5] or []] for task in tasks],
+    )
+
+    results = []
+    for i, (pvs_id, mode_id, device, O21, O22, I23) in enumerate(tasks):
+        # O21, O22, O23, O34, O35, O46, mode
+        O46_output_data = {}
+        O46_output_data['O23'] = float(O46_vals['O23'][i])
+        O46_output_data['O34'] = O46_vals['O34'][i].tolist()
+        O46_output_data['O35'] = float(O46_vals['O35'][i])
+        O46_output_data['O46'] = float(O46_vals['O46'][i])
+        O46_output_data['O22'] = O22
+        O46_output_data['O21'] = O21
+        O46_output_data['mode'] = mode_id[-1]
+        results.append((pvs_id, mode_id, device, O46_output_data))
+    return results
+
+
+def write_O46_files(results):
+    for pvs_id, mode_id, device, O46_output_data in results:
+        #- `data/mode0/O46-TR01_SRCxxx_HRCxxx-pc.json`
+        json_filename = os.path.join(
+            ROOT_PATH,
+            'data',
+            mode_id,
+            "046-{pvs_id}-{device}.json".format(**locals())
+        )
+        with open(json_filename, 'w') as outfile:
+            json.dump(O46_output_data, outfile)
+
+
+def iter_O46_outputs(tasks, cpu_count):
+    """
+    Yield the results of calc_O46_outputs in the order of the tasks, using
+    a process pool if more than one CPU is requested
+    """
+    batch_size = min(PQ_BATCH_SIZE, max(1, len(tasks) // (cpu_count * 4)))
+    batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+    if cpu_count == 1:
+        for batch in batches:
+            for result in calc_O46_outputs(batch):
+                yield result
+        return
+    with multiprocessing.Pool(processes=cpu_count) as pool:
+        for results in pool.imap(calc_O46_outputs, batches):
+            for result in results:
+                yield result
+
+
+def output_path(filename, databases):
+    """
+    Path of a CSV output; if only some databases are processed, their IDs are
+    appended to the file name so that the complete files are not overwritten
+    """
+    if sorted(databases) != sorted(DB_IDS):
+        base, ext = os.path.splitext(filename)
+        filename = base + '-' + '-'.join(databases) + ext
+    return os.path.join(ROOT_PATH, 'data', filename)
+
+
+def main(args):
 
     O21_path = os.path.join(ROOT_PATH, 'data', 'O21.csv')
     stalling_dir_path = os.path.join(ROOT_PATH, 'data', 'test_configs')
@@ -154,8 +248,8 @@ def main(args):
     # stalling
     yaml_per_db = {}
     for db_id in DB_IDS:
-        yaml_per_db[db_id] = yaml.load(
-            open(os.path.join(stalling_dir_path, db_id + '-config.yaml')))
+        with open(os.path.join(stalling_dir_path, db_id + '-config.yaml')) as f:
+            yaml_per_db[db_id] = yaml.safe_load(f)
 
     # read in from hdf-files if they exist, otherwise run pv-calc
     if args.create_hdfs:
@@ -170,69 +264,33 @@ def main(args):
         mode1_features = pd.read_csv(features_mode1_path)
 
         # mode2 features
-        print('Reading mode 2 features (may take a while) ...')
+        print('Reading mode 2 features ...')
         pvss = mode1_features["pvs_id"].unique()
-        list_of_dataframes_for_mode2 = []
-        for pvs_id in tqdm(pvss):
-            pvs_data_all = pd.read_csv(os.path.join(features_mode2_path, pvs_id + '.csv'))
-            if "BS_TwoPercentQP1" in pvs_data_all.keys():
-                list_of_dataframes_for_mode2.append(
-                    pvs_data_all[[
-                        "pvs_id", "sample_index", "framerate", "types", "sizes", "quant", "coding_res", "display_res", "BS_TwoPercentQP1"
-                    ]].copy()
-                )
-            else:
-                # no bitstream data available
-                list_of_dataframes_for_mode2.append(
-                    pvs_data_all[[
-                        "pvs_id", "sample_index", "framerate", "types", "sizes", "coding_res", "display_res"
-                    ]].copy()
-                )
-        mode2_features = pd.concat(list_of_dataframes_for_mode2, ignore_index=True)
+        mode2_store = read_features(features_mode2_path, pvss, MODE2_LIST_COLUMNS, MODE2_LENIENT_COLUMNS)
+        mode2_features = features_table(mode2_store, [
+            "pvs_id", "sample_index", "framerate", "quant", "coding_res", "display_res"
+        ])
 
         # mode3 features
-        print('Reading mode 3 features (may take a while) ...')
-        pvss = mode1_features["pvs_id"].unique()
-        list_of_dataframes_for_mode3 = []
-        for pvs_id in tqdm(pvss):
-            pvs_data_all = pd.read_csv(os.path.join(features_mode3_path, pvs_id + '.csv'))
-            list_of_dataframes_for_mode3.append(
-                pvs_data_all[[
-                    "pvs_id", "sample_index", "framerate", "types", "quant", "coding_res", "display_res", "BS_Av_QPBB"
-                ]].copy()
-            )
-        mode3_features = pd.concat(list_of_dataframes_for_mode3, ignore_index=True)
+        print('Reading mode 3 features ...')
+        mode3_store = read_features(features_mode3_path, pvss, MODE3_LIST_COLUMNS)
+        mode3_features = features_table(mode3_store, [
+            "pvs_id", "sample_index", "framerate", "quant", "coding_res", "display_res"
+        ])
 
         # calc Pv
-        # mode0
         print('Calculating mode 0 Pv')
-        mode0_features['O22'] = mode0_features.progress_apply(calc_mode0_O22, axis=1)
+        mode0_features['O22'] = calc_mode0_O22(mode0_features)
 
-        # mode1
         print('Calculating mode 1 Pv')
-        mode1_features['O22'] = mode1_features.progress_apply(calc_mode1_O22, axis=1)
+        mode1_features['O22'] = calc_mode1_O22(mode1_features)
 
-        # mode2
+        # samples without bitstream data get the mode 1 score
         print('Calculating mode 2 Pv')
-        mode2_features['O22'] = mode2_features.progress_apply(calc_mode2_O22, axis=1)
-
-        missing_values_indices = np.where(pd.isnull(mode2_features.O22))[0]
-        # go through each sample index that has no value yet
-        print('Re-calculating mode 2 Pv missing values')
-        for idx in tqdm(missing_values_indices):
-            # get required features from mode 1, ...
-            pvs_id = mode2_features.iloc[idx]['pvs_id']
-            sample_index = mode2_features.iloc[idx]['sample_index']
-            row = mode1_features.loc[(mode1_features["pvs_id"] == pvs_id) & (mode1_features["sample_index"] == sample_index)]
-            # and calculate Mode 1 score instead
-            mode1_O22 = calc_mode1_O22(row)
-            # overwrite data in Mode 2 data frame
-            # https://stackoverflow.com/a/43968774/435093
-            mode2_features.iat[idx, mode2_features.columns.get_loc("O22")] = mode1_O22
-
-        # mode3
+        mode2_features['O22'] = calc_mode2_O22(mode2_store, mode2_features, mode1_features)
+
         print('Calculating mode 3 Pv')
-        mode3_features['O22'] = mode3_features.progress_apply(calc_mode3_O22, axis=1)
+        mode3_features['O22'] = calc_mode3_O22(mode3_store, mode3_features)
 
         mode0_features.to_hdf(os.path.join(ROOT_PATH, "data_original", "save.h5"), key='mode0')
         mode1_features.to_hdf(os.path.join(ROOT_PATH, "data_original", "save.h5"), key='mode1')
@@ -262,33 +320,28 @@ def main(args):
             stalling_per_hrc[hrc_id] = buff_events
 
     pvss = mode1_features["pvs_id"].unique()
-    per_pvs_data = {}
+    for pvs_id in pvss:
+        if pvs_id.split('_')[0] not in DB_IDS:
+            print("WARNING: Saved PVS {} not in required DBs".format(pvs_id))
+    pvss = [pvs_id for pvs_id in pvss if pvs_id.split('_')[0] in args.databases]
 
-    print('Creating O21/22-json files ...')
-    O22_tocsv = pd.DataFrame(columns=['pvs_id', 'mode', 'sample_index', 'O22'])
-    list_to_concat = []
-    for pvs_id in tqdm(pvss):
+    # group every table once instead of filtering it for each PVS
+    O21_per_pvs = scores_per_pvs(O21_data, 'O21')
+    O22_per_pvs = {
+        mode_id: scores_per_pvs(features, 'O22')
+        for mode_id, features in zip(MODES, [mode0_features, mode1_features, mode2_features, mode3_features])
+    }
+
+    per_pvs_data = {}
+    for pvs_id in pvss:
         database_id = pvs_id.split('_')[0]
-        if database_id not in DB_IDS:
-            print("WARNING: Saved PVS {} not in required DBs".format(pvs_id))
-            continue
-        src_id = pvs_id.split('_')[1]
         hrc_id = pvs_id.split('_')[2]
 
         per_pvs_data[pvs_id] = {}
-        per_pvs_data[pvs_id]['O21'] = O21_data[O21_data["pvs_id"] ==
-                                               pvs_id].sort_values(by=['sample_index'])["O21"].tolist()
-
-        per_pvs_data[pvs_id]['O22'] = {}
-        per_pvs_data[pvs_id]['O22']['mode0'] = \
-            mode0_features[mode0_features["pvs_id"] == pvs_id].sort_values(by=['sample_index'])["O22"].tolist()
-        per_pvs_data[pvs_id]['O22']['mode1'] = \
-            mode1_features[mode1_features["pvs_id"] == pvs_id].sort_values(by=['sample_index'])["O22"].tolist()
-        per_pvs_data[pvs_id]['O22']['mode2'] = \
-            mode2_features[mode2_features["pvs_id"] == pvs_id].sort_values(by=['sample_index'])["O22"].tolist()
-        per_pvs_data[pvs_id]['O22']['mode3'] = \
-            mode3_features[mode3_features["pvs_id"] == pvs_id].sort_values(by=['sample_index'])["O22"].tolist()
-
+        per_pvs_data[pvs_id]['O21'] = O21_per_pvs.get(pvs_id, [])
+        per_pvs_data[pvs_id]['O22'] = {
+            mode_id: O22_per_pvs[mode_id].get(pvs_id, []) for mode_id in MODES
+        }
         per_pvs_data[pvs_id]['I23'] = stalling_per_hrc[hrc_id]
 
         per_pvs_data[pvs_id]['IGen'] = {}
@@ -298,18 +351,27 @@ def main(args):
         # this should be inserted below when producing the o46 scores
         per_pvs_data[pvs_id]['IGen']['device'] = ''
 
-        # write .json outputs from pv (O21, O22, i23, igen)
-        for mode_id in ['mode0', 'mode1', 'mode2', 'mode3']:
-            csv_index = 0
-
-            for o22_sample in per_pvs_data[pvs_id]['O22'][mode_id]:
-                csv_row = {
-                    'pvs_id': pvs_id, 'mode': mode_id[-1], 'sample_index': csv_index, 'O22': o22_sample}
-                csv_row_df = pd.DataFrame(csv_row, index=[0])
-                list_to_concat.append(csv_row_df)
-                csv_index += 1
+    print('Writing O22 CSV file ...')
+    O22_columns = {'pvs_id': [], 'mode': [], 'sample_index': [], 'O22': []}
+    for pvs_id in pvss:
+        for mode_id in MODES:
+            scores = per_pvs_data[pvs_id]['O22'][mode_id]
+            O22_columns['pvs_id'].extend([pvs_id] * len(scores))
+            O22_columns['mode'].extend([mode_id[-1]] * len(scores))
+            O22_columns['sample_index'].extend(range(len(scores)))
+            O22_columns['O22'].extend(scores)
+    pd.DataFrame(O22_columns).to_csv(
+        output_path('O22.csv', args.databases),
+        columns=['pvs_id', 'mode', 'sample_index', 'O22'],
+        index=False
+    )
 
-            os.makedirs(os.path.join(ROOT_PATH, 'data', mode_id), exist_ok=True)
+    # write .json outputs from pv (O21, O22, i23, igen)
+    print('Creating O21/22-json files ...')
+    for mode_id in MODES:
+        os.makedirs(os.path.join(ROOT_PATH, 'data', mode_id), exist_ok=True)
+    for pvs_id in tqdm(pvss):
+        for mode_id in MODES:
             json_filename = os.path.join(
                 ROOT_PATH,
                 'data',
@@ -322,63 +384,31 @@ def main(args):
             with open(json_filename, 'w') as outfile:
                 json.dump(data_to_write, outfile)
 
-    print('Writing O22 CSV file ...')
-    O22_tocsv = pd.concat(list_to_concat, ignore_index=True)
-    O22_tocsv.to_csv(
-        os.path.join(ROOT_PATH, 'data', 'O22.csv'),
-        columns=['pvs_id', 'mode', 'sample_index', 'O22'],
-        index=False
-    )
-
     # calc pq for each .json.
     print('Calculating Pq-scores ...')
-    O46_tocsv = pd.DataFrame(columns=['pvs_id', 'mode', 'context', 'O46'])
-    list_to_concat = []
-    for pvs_id in tqdm(pvss):
+    tasks = []
+    for pvs_id in pvss:
         pvs_data = per_pvs_data[pvs_id]
-        for device in ['mobile', 'pc']:
-            for curr_mode in pvs_data['O22']:
-                O46_vals = calc_O46(
-                    pvs_data['O21'], pvs_data['O22'][curr_mode], device, pvs_data['I23'])
-
-                # O21, O22, O23, O34, O35, O46, mode
-                O46_output_data = {}
-                O46_output_data['O23'] = O46_vals['O23']
-                O46_output_data['O34'] = O46_vals['O34']
-                O46_output_data['O35'] = O46_vals['O35']
-                O46_output_data['O46'] = O46_vals['O46']
-                O46_output_data['O22'] = pvs_data['O22'][curr_mode]
-                O46_output_data['O21'] = pvs_data['O21']
-                O46_output_data['mode'] = curr_mode[-1]
-
-                # write o46-jsons
-                #- `data/mode0/O46-TR01_SRCxxx_HRCxxx-pc.json`
-
-                csv_row = {
-                    'pvs_id': pvs_id,
-                    'mode': curr_mode[-1],
-                    'context': device,
-                    'O46': O46_vals['O46']
-                }
-                csv_row_df = pd.DataFrame(csv_row, index=[0])
-                list_to_concat.append(csv_row_df)
-
-                json_filename = os.path.join(
-                    ROOT_PATH,
-                    'data',
-                    curr_mode,
-                    "046-{pvs_id}-{device}.json".format(**locals())
-                )
-                with open(json_filename, 'w') as outfile:
-                    json.dump(O46_output_data, outfile)
+        for device in DEVICES:
+            for curr_mode in MODES:
+                tasks.append((pvs_id, curr_mode, device, pvs_data['O21'], pvs_data['O22'][curr_mode], pvs_data['I23']))
+
+    O46_rows = []
+    batch = []
+    for result in tqdm(iter_O46_outputs(tasks, args.cpu_count), total=len(tasks)):
+        pvs_id, curr_mode, device, O46_output_data = result
+        O46_rows.append((pvs_id, curr_mode[-1], device, O46_output_data['O46']))
+        batch.append(result)
+        if len(batch) >= WRITE_BATCH_SIZE:
+            write_O46_files(batch)
+            batch = []
+    write_O46_files(batch)
 
     print('Writing O46 CSV file ...')
-    O46_tocsv = pd.concat(list_to_concat, ignore_index=True)
-    outfile = os.path.join(ROOT_PATH, 'data', 'O46.csv')
+    outfile = output_path('O46.csv', args.databases)
     print('Writing to {}'.format(outfile))
-    O46_tocsv.to_csv(
+    pd.DataFrame(O46_rows, columns=['pvs_id', 'mode', 'context', 'O46']).to_csv(
         outfile,
-        columns=['pvs_id', 'mode', 'context', 'O46'],
         index=False
     )
 
@@ -391,5 +421,20 @@ if __name__ == '__main__':
         action='store_true',
         help='Create a temporary h5 file for O22-data'
     )
+    parser.add_argument(
+        '-d', '--databases',
+        nargs='+',
+        choices=DB_IDS,
+        default=DB_IDS,
+        help='only create outputs for the PVSes of these databases; the CSV files then get the database IDs as suffix'
+    )
+    parser.add_argument(
+        '--cpu-count',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='number of processes for calculating the O46 scores'
+    )
     args = parser.parse_args()
+    if args.cpu_count < 1:
+        parser.error("--cpu-count must be at least 1")
     main(args)
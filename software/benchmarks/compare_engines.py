@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Compare the Python and the compiled (jit) Pv engines on the dataset.
+
+For each mode, runs every session through both engines, checks that the O22
+scores are the same and reports the throughput of each engine. The first
+session is run once before timing, so that compiling the kernels is not
+counted. Without Numba, the jit kernels run as plain Python, which only
+checks the results and is slower than the Python engine.
+
+Usage:
+    python3 benchmarks/compare_engines.py
+    python3 benchmarks/compare_engines.py --modes 1 3 --limit 20
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+SOFTWARE_PATH = os.path.abspath(os.path.join(BENCHMARK_PATH, ".."))
+sys.path.insert(0, SOFTWARE_PATH)
+
+import datasets  # noqa: E402
+
+
+def compare_mode(mode, args):
+    from itu_p1203 import P1203Pv
+    from itu_p1203 import jitengine
+
+    sessions = samples = mismatches = fallbacks = 0
+    elapsed = {"python": 0.0, "jit": 0.0}
+    warmed_up = False
+    for pvs_id, report in datasets.iter_sessions(mode, args.data_dir, args.limit, qp_fraction=args.qp_fraction):
+        segments = report["I13"]["segments"]
+        display_res = report["IGen"]["displaySize"]
+        if not warmed_up:
+            jitengine.calculate_o22(segments, mode, display_res)
+            warmed_up = True
+
+        start = time.perf_counter()
+        expected = P1203Pv(segments, display_res, mode=mode, engine="python").calculate()["video"]["O22"]
+        elapsed["python"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        o22 = jitengine.calculate_o22(segments, mode, display_res)
+        elapsed["jit"] += time.perf_counter() - start
+
+        sessions += 1
+        samples += len(expected)
+        if o22 is None:
+            fallbacks += 1
+        elif o22 != expected:
+            mismatches += 1
+            print("O22 of {} in mode {} differs between the engines".format(pvs_id, mode), file=sys.stderr)
+    return sessions, samples, elapsed, mismatches, fallbacks
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the Python and jit Pv engines on the P.NATS databases",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--modes",
+        type=int,
+        nargs="+",
+        choices=[0, 1, 3],
+        default=[0, 1, 3],
+        help="modes to compare"
+    )
+    parser.add_argument(
+        "-l", "--limit",
+        type=int,
+        default=None,
+        help="only use the first N sessions per mode"
+    )
+    parser.add_argument(
+        "--qp-fraction",
+        type=float,
+        default=0.1,
+        help="share of macroblocks that get a QP value in generated mode 3 reports"
+    )
+    parser.add_argument(
+        "--data-dir",
+        type=str,
+        default=datasets.DATA_PATH,
+        help="path to the dataset"
+    )
+    args = parser.parse_args()
+
+    from itu_p1203 import log
+    from itu_p1203 import jitengine
+    log.setup_custom_logger('main').setLevel(logging.ERROR)
+
+    if not jitengine.HAVE_NUMBA:
+        print("Numba is not installed, the jit kernels run uncompiled", file=sys.stderr)
+
+    failed = False
+    print("{:<6} {:>9} {:>16} {:>16} {:>8} {:>10} {:>10}".format(
+        "mode", "sessions", "python samples/s", "jit samples/s", "speedup", "mismatches", "fallbacks"))
+    for mode in args.modes:
+        sessions, samples, elapsed, mismatches, fallbacks = compare_mode(mode, args)
+        failed = failed or mismatches > 0
+        print("{:<6} {:>9} {:>16.0f} {:>16.0f} {:>7.1f}x {:>10} {:>10}".format(
+            mode, sessions, samples / elapsed["python"], samples / elapsed["jit"],
+            elapsed["python"] / elapsed["jit"], mismatches, fallbacks))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Loaders that turn the bundled P.NATS open dataset (the `data` folder next to
+this software) into benchmark inputs.
+
+The dataset ships per-second features (`data/features/features_mode{0,1}.csv`)
+and O21/O22 scores (`data/mode*/O21O22-*.json`), not the original input
+reports. Input reports are therefore rebuilt from the features:
+
+- one video segment per output second, with the bitrate, resolution and frame
+  rate of that second, and a representation ID for the quality level
+- one audio segment per output second, with the audio bitrate of the quality
+  level as given in `data/test_configs/*-config.yaml`
+- for mode 1, one frame per 1/fps seconds with I-frames every `gop_length`
+  seconds, sized after the average I/non-I frame sizes of that second
+- for mode 3, additionally a list of QP values per frame, derived
+  deterministically from the bits per pixel of that second
+- stalling events as stored in the O21O22 files
+"""
+
+import csv
+import glob
+import json
+import math
+import os
+import random
+from collections import OrderedDict
+
+DATA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+
+DB_IDS = ["TR04", "TR06", "VL04", "VL13"]
+
+DEFAULT_AUDIO_BITRATE = 128
+
+
+def read_features(mode, data_path=DATA_PATH):
+    """
+    Read a feature CSV and return an OrderedDict of {pvs_id: [rows]}, rows
+    sorted by sample index
+    """
+    per_pvs = OrderedDict()
+    features_path = os.path.join(data_path, "features", "features_mode{}.csv".format(mode))
+    with open(features_path) as in_f:
+        for row in csv.DictReader(in_f):
+            per_pvs.setdefault(row["pvs_id"], []).append(row)
+    for rows in per_pvs.values():
+        rows.sort(key=lambda row: int(row["sample_index"]))
+    return per_pvs
+
+
+def read_audio_bitrates(data_path=DATA_PATH):
+    """
+    Return a dict of {(db_id, coding height, video target bitrate): audio bitrate}
+    from the audiovisual quality levels of each test config
+    """
+    import yaml
+
+    audio_bitrates = {}
+    for db_id in DB_IDS:
+        config_path = os.path.join(data_path, "test_configs", db_id + "-config.yaml")
+        if not os.path.isfile(config_path):
+            continue
+        with open(config_path) as in_f:
+            config = yaml.safe_load(in_f)
+        for height, video_bitrate, _, audio_bitrate in config["audioVisualQualityLevels"]:
+            audio_bitrates[(db_id, int(height), int(video_bitrate))] = float(audio_bitrate)
+    return audio_bitrates
+
+
+def read_score_files(data_path=DATA_PATH, modes=(0, 1, 2, 3)):
+    """
+    Return a list of (path, data) of all O21O22 files of the given modes
+    """
+    score_files = []
+    for mode in modes:
+        pattern = os.path.join(data_path, "mode{}".format(mode), "O21O22-*.json")
+        for path in sorted(glob.glob(pattern)):
+            with open(path) as in_f:
+                score_files.append((path, json.load(in_f)))
+    return score_files
+
+
+def read_stalling(data_path=DATA_PATH):
+    """
+    Return a dict of {pvs_id: [[start, duration], ...]} from the mode 0 score files
+    """
+    stalling = {}
+    for path, data in read_score_files(data_path, modes=(0,)):
+        pvs_id = os.path.basename(path)[len("O21O22-"):-len(".json")]
+        stalling[pvs_id] = data.get("I23", [])
+    return stalling
+
+
+def _representation(row):
+    return "{}p{}".format(int(float(row["coding_height"])), int(float(row["bitrate_kbps_target"])))
+
+
+def _resolution(row):
+    return "{}x{}".format(int(float(row["coding_width"])), int(float(row["coding_height"])))
+
+
+def _frames_for_second(row, second_index, fps, qp_fraction, rng):
+    """
+    Generate the frame list for one second of a PVS
+    """
+    num_frames = int(1.0 * fps)
+    gop_frames = max(1, int(round(float(row.get("gop_length") or 1) * fps)))
+    i_size = int(float(row.get("i_sizes_average") or 0))
+    noni_size = int(float(row.get("noni_sizes_average") or 0))
+    if not i_size or not noni_size:
+        # mode 0 features only: spread the bitrate over 1 I-frame and the rest
+        total_bytes = float(row["bitrate_kbps_segment_size"]) * 1000 / 8
+        noni_size = int(total_bytes / (num_frames + 7))
+        i_size = 8 * noni_size
+
+    coding_res = int(float(row["coding_res"]))
+    bits_per_pixel = float(row["bitrate_kbps_segment_size"]) * 1000 / (coding_res * fps)
+    base_qp = int(min(max(round(30 - 6 * math.log2(max(bits_per_pixel, 1e-6) / 0.1)), 10), 51))
+    num_qps = max(1, int(coding_res / 256 * qp_fraction)) if qp_fraction else 0
+
+    frames = []
+    for i in range(num_frames):
+        frame_index = second_index * num_frames + i
+        is_iframe = frame_index % gop_frames == 0
+        frame = {
+            "frameType": "I" if is_iframe else rng.choice(["P", "B", "B"]),
+            "frameSize": i_size if is_iframe else noni_size,
+        }
+        if num_qps:
+            qp = base_qp - 3 if is_iframe else base_qp
+            frame["qpValues"] = [min(max(qp + rng.randint(-3, 3), 0), 51) for _ in range(num_qps)]
+        frames.append(frame)
+    return frames
+
+
+def build_session(pvs_id, rows, mode=0, audio_bitrates=None, stalling=None, qp_fraction=0.1, device="pc"):
+    """
+    Build an input report in the format of the README from the per-second
+    feature rows of one PVS
+
+    Arguments:
+        pvs_id {str} -- PVS ID
+        rows {list} -- per-second feature rows, see read_features()
+        mode {int} -- 0, 1 or 3, frame information to generate
+        audio_bitrates {dict} -- see read_audio_bitrates()
+        stalling {list} -- stalling events as [[start, duration], ...]
+        qp_fraction {float} -- share of QP values per macroblock for mode 3
+        device {str} -- pc or mobile
+    """
+    db_id = pvs_id.split("_")[0]
+    rng = random.Random(pvs_id)
+    audio_bitrates = audio_bitrates or {}
+
+    video_segments = []
+    audio_segments = []
+    for second_index, row in enumerate(rows):
+        fps = float(row["framerate"])
+        segment = {
+            "codec": "h264",
+            "start": float(second_index),
+            "duration": 1.0,
+            "resolution": _resolution(row),
+            "bitrate": float(row["bitrate_kbps_segment_size"]),
+            "fps": fps,
+            "representation": _representation(row),
+        }
+        if mode in (1, 3):
+            segment["frames"] = _frames_for_second(row, second_index, fps, qp_fraction if mode == 3 else 0, rng)
+        video_segments.append(segment)
+
+        audio_key = (db_id, int(float(row["coding_height"])), int(float(row["bitrate_kbps_target"])))
+        audio_segments.append({
+            "codec": "aaclc",
+            "start": float(second_index),
+            "duration": 1.0,
+            "bitrate": audio_bitrates.get(audio_key, DEFAULT_AUDIO_BITRATE),
+        })
+
+    first_row = rows[0]
+    return {
+        "IGen": {
+            "displaySize": "{}x{}".format(int(float(first_row["display_width"])), int(float(first_row["display_height"]))),
+            "device": device,
+        },
+        "I11": {"streamId": 42, "segments": audio_segments},
+        "I13": {"streamId": 42, "segments": video_segments},
+        "I23": {"streamId": 42, "stalling": stalling or []},
+    }
+
+
+def iter_sessions(mode=0, data_path=DATA_PATH, limit=None, qp_fraction=0.1, device="pc"):
+    """
+    Yield (pvs_id, input report) for all PVSes of the dataset, see build_session()
+    """
+    features = read_features(1 if mode in (1, 3) else 0, data_path)
+    audio_bitrates = read_audio_bitrates(data_path)
+    stalling = read_stalling(data_path)
+    for index, (pvs_id, rows) in enumerate(features.items()):
+        if limit is not None and index >= limit:
+            break
+        yield pvs_id, build_session(
+            pvs_id, rows, mode=mode, audio_bitrates=audio_bitrates,
+            stalling=stalling.get(pvs_id, []), qp_fraction=qp_fraction, device=device
+        )
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Track the import time of the itu_p1203 package with `python -X importtime`.
+
+Runs a fresh interpreter for each import target, parses the cumulative
+import time that Python reports for the target module and compares it
+against a budget in milliseconds. Exits with status 1 if any target
+exceeds its budget, so it can be used in CI.
+
+Usage:
+    python3 benchmarks/importtime.py
+    python3 benchmarks/importtime.py --repeat 10 --top 15
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+SOFTWARE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# import target -> budget in milliseconds (median over all runs)
+DEFAULT_BUDGETS = {
+    "itu_p1203": 50,
+    "itu_p1203.__main__": 100,
+    "itu_p1203.itu_p1203": 500,
+}
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)\s*$")
+
+
+def measure(module):
+    """
+    Import a module in a fresh interpreter and return a dict of
+    {module name: (self time in us, cumulative time in us)}
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SOFTWARE_PATH + os.pathsep + env.get("PYTHONPATH", "")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        universal_newlines=True,
+        check=True,
+    )
+    timings = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return timings
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import time benchmark for the P.1203 package",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        default=sorted(DEFAULT_BUDGETS.keys()),
+        help="modules to import"
+    )
+    parser.add_argument(
+        "-r", "--repeat",
+        type=int,
+        default=5,
+        help="number of fresh interpreters per module"
+    )
+    parser.add_argument(
+        "-b", "--budget",
+        type=float,
+        default=None,
+        help="budget in ms for all modules, overrides the built-in budgets"
+    )
+    parser.add_argument(
+        "-t", "--top",
+        type=int,
+        default=10,
+        help="print the N most expensive imports per module"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print results as JSON"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    over_budget = False
+    for module in args.modules:
+        runs = [measure(module) for _ in range(args.repeat)]
+        cumulative = [run[module][1] / 1000.0 for run in runs if module in run]
+        if not cumulative:
+            # already imported by the interpreter itself, nothing to measure
+            cumulative = [0.0]
+        budget = args.budget if args.budget is not None else DEFAULT_BUDGETS.get(module)
+        total_ms = median(cumulative)
+        top = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        results[module] = {
+            "median_ms": round(total_ms, 2),
+            "min_ms": round(min(cumulative), 2),
+            "budget_ms": budget,
+            "top_self_ms": [(name, round(self_us / 1000.0, 2)) for name, (self_us, _) in top],
+        }
+        if budget is not None and total_ms > budget:
+            over_budget = True
+
+    if args.json:
+        print(json.dumps(results, indent=True, sort_keys=True))
+    else:
+        for module, result in results.items():
+            status = ""
+            if result["budget_ms"] is not None:
+                status = "OK" if result["median_ms"] <= result["budget_ms"] else "OVER BUDGET"
+                status = "(budget {} ms) {}".format(result["budget_ms"], status)
+            print("{:<24} median {:>9.2f} ms  min {:>9.2f} ms  {}".format(
+                module, result["median_ms"], result["min_ms"], status))
+            for name, self_ms in result["top_self_ms"]:
+                print("    {:<40} {:>9.2f} ms".format(name, self_ms))
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the P.1203 software over the bundled P.NATS databases.
+
+Times the Pa, Pv (mode 0, 1, 3 and the bare model functions), Pq, and
+random forest stages as well as the end-to-end CLI, reports throughput
+(sessions/s, output samples/s) and the peak RSS of each stage, and compares
+the results against a stored baseline.
+
+Every stage runs in its own interpreter so that peak RSS is attributable to
+the stage. See datasets.py for how the input reports are built.
+
+Usage:
+    python3 benchmarks/run_benchmarks.py
+    python3 benchmarks/run_benchmarks.py --stages pv_mode0 pq --limit 20
+    python3 benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+SOFTWARE_PATH = os.path.abspath(os.path.join(BENCHMARK_PATH, ".."))
+sys.path.insert(0, SOFTWARE_PATH)
+
+import datasets  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_PATH, "baseline.json")
+
+
+def _quiet():
+    from itu_p1203 import log
+    log.setup_custom_logger('main').setLevel(logging.ERROR)
+
+
+def _stalling_buffers(stalling):
+    l_buff = [s[1] for s in stalling]
+    p_buff = [s[0] - stalling[0][0] for s in stalling]
+    return l_buff, p_buff
+
+
+def stage_pa(args):
+    from itu_p1203 import P1203Pa
+    sessions = samples = 0
+    elapsed = 0.0
+    for _, report in datasets.iter_sessions(0, args.data_dir, args.limit):
+        start = time.perf_counter()
+        result = P1203Pa(report["I11"]["segments"]).calculate()
+        elapsed += time.perf_counter() - start
+        sessions += 1
+        samples += len(result["audio"]["O21"])
+    return sessions, samples, elapsed
+
+
+def _stage_pv(args, mode):
+    from itu_p1203 import P1203Pv
+    sessions = samples = 0
+    elapsed = 0.0
+    for _, report in datasets.iter_sessions(mode, args.data_dir, args.limit, qp_fraction=args.qp_fraction):
+        start = time.perf_counter()
+        result = P1203Pv(report["I13"]["segments"], report["IGen"]["displaySize"]).calculate()
+        elapsed += time.perf_counter() - start
+        sessions += 1
+        samples += len(result["video"]["O22"])
+    return sessions, samples, elapsed
+
+
+def stage_pv_mode0(args):
+    return _stage_pv(args, 0)
+
+
+def stage_pv_mode1(args):
+    return _stage_pv(args, 1)
+
+
+def stage_pv_mode3(args):
+    return _stage_pv(args, 3)
+
+
+def stage_pv_functions(args):
+    """
+    Per-second model functions for modes 0 and 1 on the stored features,
+    as done by scripts/create_model_outputs.py
+    """
+    from itu_p1203 import P1203Pv
+    sessions = samples = 0
+    elapsed = 0.0
+    for mode in (0, 1):
+        features = datasets.read_features(mode, args.data_dir)
+        for index, rows in enumerate(features.values()):
+            if args.limit is not None and index >= args.limit:
+                break
+            start = time.perf_counter()
+            for row in rows:
+                if mode == 0:
+                    P1203Pv.video_model_function_mode0(
+                        int(row["coding_res"]), int(row["display_res"]),
+                        float(row["bitrate_kbps_segment_size"]), int(float(row["framerate"]))
+                    )
+                else:
+                    P1203Pv.video_model_function_mode1(
+                        int(row["coding_res"]), int(row["display_res"]),
+                        float(row["bitrate_kbps_segment_size"]), int(float(row["framerate"])),
+                        [], float(row["iframe_ratio"])
+                    )
+            elapsed += time.perf_counter() - start
+            sessions += 1
+            samples += len(rows)
+    return sessions, samples, elapsed
+
+
+def _score_files(args):
+    score_files = datasets.read_score_files(args.data_dir)
+    if args.limit is not None:
+        score_files = score_files[:args.limit]
+    return score_files
+
+
+def stage_pq(args):
+    from itu_p1203 import P1203Pq
+    sessions = samples = 0
+    elapsed = 0.0
+    for _, data in _score_files(args):
+        l_buff, p_buff = _stalling_buffers(data["I23"])
+        start = time.perf_counter()
+        P1203Pq(data["O21"], data["O22"], l_buff, p_buff, "pc").calculate()
+        elapsed += time.perf_counter() - start
+        sessions += 1
+        samples += min(len(data["O21"]), len(data["O22"]))
+    return sessions, samples, elapsed
+
+
+def stage_rfmodel(args):
+    import numpy as np
+    from itu_p1203 import rfmodel
+    sessions = samples = 0
+    elapsed = 0.0
+    for _, data in _score_files(args):
+        l_buff, p_buff = _stalling_buffers(data["I23"])
+        duration = min(len(data["O21"]), len(data["O22"]))
+        start = time.perf_counter()
+        rfmodel.calculate(np.array(data["O21"]), np.array(data["O22"]), l_buff, p_buff, duration)
+        elapsed += time.perf_counter() - start
+        sessions += 1
+        samples += duration
+    return sessions, samples, elapsed
+
+
+def stage_cli(args):
+    """
+    End-to-end run of the CLI on mode 0 reports written to a temporary folder
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_files = []
+        for pvs_id, report in datasets.iter_sessions(0, args.data_dir, args.limit):
+            input_file = os.path.join(tmp_dir, pvs_id + ".json")
+            with open(input_file, "w") as out_f:
+                json.dump(report, out_f)
+            input_files.append(input_file)
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = SOFTWARE_PATH + os.pathsep + env.get("PYTHONPATH", "")
+        cmd = [sys.executable, "-m", "itu_p1203", "--cpu-count", str(args.cpu_count)] + input_files
+        start = time.perf_counter()
+        output = subprocess.check_output(cmd, env=env, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+
+    results = json.loads(output.decode("utf-8"))
+    samples = sum(len(result["O34"]) for result in results.values())
+    return len(results), samples, elapsed
+
+
+STAGES = OrderedDict([
+    ("pa", stage_pa),
+    ("pv_mode0", stage_pv_mode0),
+    ("pv_mode1", stage_pv_mode1),
+    ("pv_mode3", stage_pv_mode3),
+    ("pv_functions", stage_pv_functions),
+    ("pq", stage_pq),
+    ("rfmodel", stage_rfmodel),
+    ("cli", stage_cli),
+])
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """
+    Peak resident set size in MB (ru_maxrss is in bytes on macOS, KB elsewhere)
+    """
+    maxrss = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        return maxrss / 1024.0 / 1024.0
+    return maxrss / 1024.0
+
+
+def run_stage_in_process(name, args):
+    """
+    Run one stage in this process and print the result as JSON
+    """
+    _quiet()
+    sessions, samples, elapsed = STAGES[name](args)
+    rss = peak_rss_mb()
+    if name == "cli":
+        rss = max(rss, peak_rss_mb(resource.RUSAGE_CHILDREN))
+    print(json.dumps({
+        "sessions": sessions,
+        "samples": samples,
+        "seconds": elapsed,
+        "peak_rss_mb": rss,
+    }))
+
+
+def run_stage(name, args):
+    """
+    Run one stage in a fresh interpreter, best of args.repeat runs
+    """
+    cmd = [
+        sys.executable, os.path.abspath(__file__),
+        "--run-stage", name,
+        "--qp-fraction", str(args.qp_fraction),
+        "--cpu-count", str(args.cpu_count),
+        "--data-dir", args.data_dir,
+    ]
+    if args.limit is not None:
+        cmd += ["--limit", str(args.limit)]
+
+    best = None
+    for _ in range(args.repeat):
+        run = json.loads(subprocess.check_output(cmd).decode("utf-8").strip().splitlines()[-1])
+        if best is None or run["seconds"] < best["seconds"]:
+            best = run
+    seconds = max(best["seconds"], 1e-9)
+    best["sessions_per_s"] = best["sessions"] / seconds
+    best["samples_per_s"] = best["samples"] / seconds
+    return best
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results against a baseline, return a list of regression messages
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if (result["sessions"], result["samples"]) != (base["sessions"], base["samples"]):
+            # different workload, e.g. due to --limit, throughput is not comparable
+            continue
+        if result["samples_per_s"] < base["samples_per_s"] * (1 - tolerance):
+            regressions.append("{}: throughput {:.1f} samples/s, baseline {:.1f} samples/s".format(
+                name, result["samples_per_s"], base["samples_per_s"]))
+        if result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append("{}: peak RSS {:.1f} MB, baseline {:.1f} MB".format(
+                name, result["peak_rss_mb"], base["peak_rss_mb"]))
+    return regressions
+
+
+def print_table(results, baseline):
+    print("{:<14} {:>9} {:>10} {:>10} {:>12} {:>14} {:>10} {:>9}".format(
+        "stage", "sessions", "samples", "time [s]", "sessions/s", "samples/s", "RSS [MB]", "speedup"))
+    for name, result in results.items():
+        speedup = ""
+        if name in baseline and baseline[name]["samples"] == result["samples"]:
+            speedup = "{:.2f}x".format(result["samples_per_s"] / baseline[name]["samples_per_s"])
+        print("{:<14} {:>9} {:>10} {:>10.3f} {:>12.1f} {:>14.1f} {:>10.1f} {:>9}".format(
+            name, result["sessions"], result["samples"], result["seconds"],
+            result["sessions_per_s"], result["samples_per_s"], result["peak_rss_mb"], speedup))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark suite for the P.1203 software on the P.NATS databases",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=list(STAGES.keys()),
+        default=list(STAGES.keys()),
+        help="stages to run"
+    )
+    parser.add_argument(
+        "-l", "--limit",
+        type=int,
+        default=None,
+        help="only use the first N sessions per stage"
+    )
+    parser.add_argument(
+        "-r", "--repeat",
+        type=int,
+        default=1,
+        help="run each stage N times and keep the fastest run"
+    )
+    parser.add_argument(
+        "--qp-fraction",
+        type=float,
+        default=0.1,
+        help="share of macroblocks that get a QP value in generated mode 3 reports"
+    )
+    parser.add_argument(
+        "--cpu-count",
+        type=int,
+        default=1,
+        help="CPU count passed to the CLI stage"
+    )
+    parser.add_argument(
+        "--data-dir",
+        type=str,
+        default=datasets.DATA_PATH,
+        help="path to the dataset"
+    )
+    parser.add_argument(
+        "-b", "--baseline",
+        type=str,
+        default=DEFAULT_BASELINE,
+        help="baseline JSON file to compare against"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        type=str,
+        default=None,
+        help="write the results to this JSON file"
+    )
+    parser.add_argument(
+        "-t", "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative slowdown (or RSS increase) that counts as regression"
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="exit with status 1 if a regression was found"
+    )
+    parser.add_argument(
+        "--run-stage",
+        type=str,
+        default=None,
+        help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_stage_in_process(args.run_stage, args)
+        return
+
+    results = OrderedDict()
+    for name in args.stages:
+        print("Running stage {} ...".format(name), file=sys.stderr)
+        results[name] = run_stage(name, args)
+
+    baseline = {}
+    if args.baseline and os.path.isfile(args.baseline):
+        with open(args.baseline) as in_f:
+            baseline = json.load(in_f)
+
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as out_f:
+            json.dump(results, out_f, indent=True, sort_keys=True)
+        print("Baseline written to {}".format(args.save_baseline))
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION: " + regression)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
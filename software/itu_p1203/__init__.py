@@ -1,6 +1,46 @@
+import sys
+
 __version__ = "1.1.10"
 
-from .p1203Pa import P1203Pa
-from .p1203Pv import P1203Pv
-from .p1203Pq import P1203Pq
-from .itu_p1203 import P1203Standalone
\ No newline at end of file
+# The model classes are imported on first access, so that importing the
+# package (e.g. to read the version or run the CLI argument parser) does not
+# pull in numpy and the model code.
+_LAZY_ATTRIBUTES = {
+    "P1203Pa": ".p1203Pa",
+    "P1203Pv": ".p1203Pv",
+    "P1203Pq": ".p1203Pq",
+    "P1203Standalone": ".itu_p1203",
+    "Metrics": ".metrics",
+    "Trace": ".trace",
+    "ScoringBudget": ".budget",
+    "LadderTable": ".ladder",
+    "ResultCache": ".resultcache",
+}
+
+__all__ = ["__version__"] + list(_LAZY_ATTRIBUTES.keys())
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        from importlib import import_module
+        value = getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY_ATTRIBUTES.keys()))
+
+
+if sys.version_info < (3, 7):
+    # module-level __getattr__ (PEP 562) is not available, import eagerly
+    from .p1203Pa import P1203Pa
+    from .p1203Pv import P1203Pv
+    from .p1203Pq import P1203Pq
+    from .itu_p1203 import P1203Standalone
+    from .metrics import Metrics
+    from .trace import Trace
+    from .budget import ScoringBudget
+    from .ladder import LadderTable
+    from .resultcache import ResultCache
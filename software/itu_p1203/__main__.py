@@ -24,55 +24,107 @@ SOFTWARE.
 """
 
 import os
-import argparse
 import logging
 import sys
-import multiprocessing
 import json
-from multiprocessing import Pool
 
 from . import log
-from . import utils
-from .itu_p1203 import P1203Standalone
-from .extractor import Extractor
 from .errors import P1203StandaloneError
 
 logger = log.setup_custom_logger('main')
 
+VALID_VIDEO_EXTS = ["avi", "mp4", "mkv", "nut", "mpeg", "mpg"]
 
-def extract_from_single_file(input_file, mode, debug=False, only_pa=False, only_pv=False, print_intermediate=False, modules={}):
+
+def read_input_report(input_file, mode):
     """
-    Extract the report based on a single input file (JSON or video)
+    Read the input report of a single input file, extracting it from the file
+    in case of a video
 
     Arguments:
         input_file {str} -- input file (JSON or video file)
-        mode {int} -- 0, 1, 2, 3 depending on extraction mode wanted
-        debug {bool} -- whether to run in debug mode
-        only_pa {bool} -- only run Pa module
-        only_pv {bool} -- only run Pv module
-        print_intermediate {bool} -- print intermediate O.21/O.22 values
-        modules: you can specify Pa, Pv, Pq classnames, that will be used, default are the P1203 modules
-            e.g. modules={"Pa": OtherPaModule}
+        mode {int} -- extraction mode for video files (None: mode 1)
+
+    Returns:
+        dict -- input report
     """
+    from . import utils
+
     if not os.path.isfile(input_file):
         raise P1203StandaloneError("No such file: {input_file}".format(input_file=input_file))
 
     file_ext = os.path.splitext(input_file)[1].lower()[1:]
-    valid_video_exts = ["avi", "mp4", "mkv", "nut", "mpeg", "mpg"]
 
     # normal case, handle JSON files
     if file_ext == "json":
-        input_report = utils.read_json_without_comments(input_file)
+        return utils.read_json_without_comments(input_file)
     # convert input video to required format
-    elif file_ext in valid_video_exts:
+    elif file_ext in VALID_VIDEO_EXTS:
         logger.debug("Running extract_from_segment_files to get input report: {} mode {}".format(input_file, mode))
+        from .extractor import Extractor
         try:
-            input_report = Extractor([input_file], mode).extract()
+            return Extractor([input_file], mode if mode is not None else 1).extract()
         except Exception as e:
             raise P1203StandaloneError("Could not auto-generate input report, error: {e.output}".format(e=e))
     else:
         raise P1203StandaloneError("Could not guess what kind of input file this is: {input_file}".format(input_file=input_file))
 
+
+def _module_names(modules):
+    """
+    Return the full class names of the Pa, Pv and Pq modules used, for the result cache key
+    """
+    names = {}
+    for name in ["Pa", "Pv", "Pq"]:
+        module = modules.get(name, None)
+        if module is None:
+            names[name] = "itu_p1203.p1203{name}.P1203{name}".format(name=name)
+        else:
+            names[name] = module.__module__ + "." + module.__qualname__
+    return names
+
+
+def _cache_key(cache, input_report, mode, debug, only_pa, only_pv, print_intermediate, modules, collect_metrics, budget):
+    """
+    Return the result cache key of an input report, or None if the run must not use the cache
+    """
+    # runs with a budget, metrics or debug output are never served from the cache
+    if cache is None or budget is not None or collect_metrics or debug:
+        return None
+    return cache.key(
+        input_report,
+        mode=mode,
+        only_pa=only_pa,
+        only_pv=only_pv,
+        print_intermediate=print_intermediate,
+        modules=_module_names(modules),
+    )
+
+
+def score_input_report(input_file, input_report, mode, debug=False, only_pa=False, only_pv=False, print_intermediate=False, modules={}, collect_metrics=False, budget=None, engine=None, cache=None, cache_key=None):
+    """
+    Score an input report read by read_input_report(), see extract_from_single_file()
+    for the arguments. If cache_key is given, the caller computed the key before (e.g.
+    before the report was moved to shared memory) and found no cached result; the
+    output is stored under that key.
+
+    Returns:
+        tuple -- input file and output
+    """
+    key = cache_key
+    if key is None and cache is not None:
+        key = _cache_key(cache, input_report, mode, debug, only_pa, only_pv, print_intermediate, modules, collect_metrics, budget)
+        output = cache.get(key) if key is not None else None
+        if output is not None:
+            logger.debug("Using cached result for {}".format(input_file))
+            return (input_file, output)
+
+    # model code (and numpy) is only loaded once there is something to score
+    from .itu_p1203 import P1203Standalone
+    from .metrics import Metrics
+
+    metrics = Metrics() if collect_metrics else None
+
     # create model ...
     itu_p1203 = P1203Standalone(
         input_report,
@@ -80,6 +132,10 @@ def extract_from_single_file(input_file, mode, debug=False, only_pa=False, only_
         Pa=modules.get("Pa", None),
         Pv=modules.get("Pv", None),
         Pq=modules.get("Pq", None),
+        metrics=metrics,
+        mode=mode,
+        budget=budget,
+        engine=engine,
     )
 
     # ... and run it
@@ -90,9 +146,87 @@ def extract_from_single_file(input_file, mode, debug=False, only_pa=False, only_
     else:
         output = itu_p1203.calculate_complete(print_intermediate)
 
+    if metrics is not None:
+        from . import modelcache
+        output["metrics"] = metrics.as_dict()
+        # cumulative for all sessions scored by this process so far
+        output["metrics"]["model_cache"] = modelcache.cache_stats()
+
+    if key is not None:
+        cache.put(key, output)
+
     return (input_file, output)
 
 
+def extract_from_single_file(input_file, mode, debug=False, only_pa=False, only_pv=False, print_intermediate=False, modules={}, collect_metrics=False, budget=None, engine=None, cache=None):
+    """
+    Extract the report based on a single input file (JSON or video)
+
+    Arguments:
+        input_file {str} -- input file (JSON or video file)
+        mode {int} -- 0, 1, 2, 3: for video files the extraction mode (None: mode 1),
+                     for JSON reports the video mode to run (None: highest mode the report allows)
+        debug {bool} -- whether to run in debug mode
+        only_pa {bool} -- only run Pa module
+        only_pv {bool} -- only run Pv module
+        print_intermediate {bool} -- print intermediate O.21/O.22 values
+        modules: you can specify Pa, Pv, Pq classnames, that will be used, default are the P1203 modules
+            e.g. modules={"Pa": OtherPaModule}
+        collect_metrics {bool} -- add timings and counters of the model run to the output
+        budget {ScoringBudget} -- time budget that may lower the video mode
+        engine {str} -- Pv engine, "auto", "python" or "jit" (None: default of the Pv module)
+        cache {ResultCache} -- cache of previous outputs (default: {None}, no caching)
+    """
+    input_report = read_input_report(input_file, mode)
+    return score_input_report(input_file, input_report, mode, debug, only_pa, only_pv, print_intermediate, modules, collect_metrics, budget, engine, cache)
+
+
+def _score_pipeline_item(mode, debug, only_pa, only_pv, print_intermediate, modules, collect_metrics, engine, cache, item, payload):
+    """
+    Scoring stage of the pipeline; item is a tuple of input file and budget (a copy
+    from ScoringBudget.for_worker() or None), payload is None to read the report here,
+    or a tuple of the report (or a handle to it in shared memory) and its result cache key
+
+    Returns:
+        tuple -- result as returned by score_input_report(), and the budget to merge
+    """
+    from .sharedreport import SharedReportHandle, open_shared_report
+
+    input_file, budget = item
+    input_report, key = payload if payload is not None else (read_input_report(input_file, mode), None)
+    if key is not None:
+        output = cache.get(key)
+        if output is not None:
+            logger.debug("Using cached result for {}".format(input_file))
+            return (input_file, output), budget
+    if isinstance(input_report, SharedReportHandle):
+        with open_shared_report(input_report) as report:
+            result = score_input_report(input_file, report, mode, debug, only_pa, only_pv, print_intermediate, modules, collect_metrics, budget, engine, cache, key)
+    else:
+        result = score_input_report(input_file, input_report, mode, debug, only_pa, only_pv, print_intermediate, modules, collect_metrics, budget, engine, cache, key)
+    if budget is not None:
+        budget.finish()
+    return result, budget
+
+
+def _budget_for_worker(item):
+    """
+    Give the item a copy of the shared budget when it is handed to a worker
+    """
+    input_file, budget = item
+    return (input_file, budget.for_worker() if budget is not None else None)
+
+
+def _merge_budget(item, scored):
+    """
+    Take over the measurements of a worker into the shared budget, return the result
+    """
+    result, worker_budget = scored
+    if worker_budget is not None:
+        item[1].merge(worker_budget)
+    return result
+
+
 def main(modules={}):
     """
     Runs standalone P.1203 version,
@@ -100,7 +234,12 @@ def main(modules={}):
     you can specify other Pa, Pv, Pq modules, e.g.
         modules = {"Pa": myownPaModule}
     """
+    import argparse
+    import functools
+    import multiprocessing
+    from multiprocessing import Pool
     from . import __version__
+    from .budget import ScoringBudget
 
     # argument parsing
     parser = argparse.ArgumentParser(
@@ -118,8 +257,9 @@ def main(modules={}):
         '-m', '--mode',
         type=int,
         choices=[0, 1, 2, 3],
-        default=1,
-        help="mode to run for extraction in case video files are loaded"
+        default=None,
+        help="mode to run; for video files the extraction mode (1 if not set), for JSON reports "
+             "at most the mode the report allows (highest available if not set)"
     )
     parser.add_argument(
         '--debug',
@@ -141,12 +281,72 @@ def main(modules={}):
         action='store_true',
         help="print intermediate O.21/O.22 values"
     )
+    parser.add_argument(
+        '--metrics',
+        action='store_true',
+        help="add timings of each stage and model counters to the output"
+    )
+    parser.add_argument(
+        '--time-budget',
+        type=float,
+        help="seconds available for scoring all inputs; the video mode of a session "
+             "is lowered (3, 1, 0) if it would not fit"
+    )
+    parser.add_argument(
+        '--budget-cpu-time',
+        action='store_true',
+        help="count CPU time instead of wall time for --time-budget"
+    )
+    parser.add_argument(
+        '--engine',
+        choices=["auto", "python", "jit"],
+        default=None,
+        help="Pv engine: the compiled array engine (jit, requires Numba), the Python engine, "
+             "or auto to use the compiled one if Numba is installed (auto if not set)"
+    )
+    parser.add_argument(
+        '--shard',
+        type=str,
+        default=None,
+        help="only score the inputs of shard i out of N (i/N, e.g. 1/4), assigned by a hash of the input path; "
+             "merge the outputs of all shards with python3 -m itu_p1203.shards merge"
+    )
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=None,
+        help="directory of a result cache; inputs scored before with the same options are not scored again"
+    )
+    parser.add_argument(
+        '--cache-max-size',
+        type=float,
+        default=None,
+        help="maximum size of the result cache in MB; least recently used results are removed first"
+    )
+    parser.add_argument(
+        '--cache-max-entries',
+        type=int,
+        default=None,
+        help="maximum number of results in the result cache"
+    )
     parser.add_argument(
         '--cpu-count',
         type=int,
         default=multiprocessing.cpu_count(),
         help='thread/CPU count'
     )
+    parser.add_argument(
+        '--extract-workers',
+        type=int,
+        default=None,
+        help="number of video files extracted at the same time while others are scored; CPU count if not set"
+    )
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=None,
+        help="number of extracted video reports that may wait for scoring; twice the CPU count if not set"
+    )
     parser.add_argument(
         '--version',
         action='version',
@@ -160,24 +360,120 @@ def main(modules={}):
 
     output_results = []
 
+    if argsdict["time_budget"] is not None and argsdict["time_budget"] <= 0:
+        parser.error("--time-budget must be positive")
+
+    if argsdict["extract_workers"] is not None and argsdict["extract_workers"] < 1:
+        parser.error("--extract-workers must be at least 1")
+    if argsdict["queue_size"] is not None and argsdict["queue_size"] < 1:
+        parser.error("--queue-size must be at least 1")
+
+    if argsdict["shard"] is not None:
+        from . import shards
+        try:
+            shard_index, shard_count = shards.parse_shard(argsdict["shard"])
+        except P1203StandaloneError as e:
+            parser.error(str(e))
+        argsdict["input"] = shards.select_shard(argsdict["input"], shard_index, shard_count)
+        logger.debug("Shard {}/{}: {} inputs".format(shard_index, shard_count, len(argsdict["input"])))
+        if not argsdict["input"]:
+            print(json.dumps({}))
+            return
+
+    cache = None
+    if argsdict["cache_dir"] is not None:
+        from .resultcache import ResultCache
+        if argsdict["cache_max_size"] is not None and argsdict["cache_max_size"] <= 0:
+            parser.error("--cache-max-size must be positive")
+        if argsdict["cache_max_entries"] is not None and argsdict["cache_max_entries"] < 1:
+            parser.error("--cache-max-entries must be at least 1")
+        cache = ResultCache(
+            argsdict["cache_dir"],
+            max_bytes=int(argsdict["cache_max_size"] * 1024 * 1024) if argsdict["cache_max_size"] is not None else None,
+            max_entries=argsdict["cache_max_entries"],
+        )
+
     if argsdict["debug"] or argsdict["cpu_count"] == 1:
         use_multiprocessing = False
     else:
         use_multiprocessing = True
 
+    has_videos = any(os.path.splitext(input_file)[1].lower()[1:] in VALID_VIDEO_EXTS for input_file in argsdict["input"])
+
     if use_multiprocessing:
-        pool = Pool(processes=argsdict["cpu_count"])
-        params = [(input_file, argsdict["mode"], argsdict["debug"], argsdict["only_pa"], argsdict["only_pv"], argsdict["print_intermediate"], modules) for input_file in argsdict["input"]]
-        try:
-            output_results = pool.starmap(extract_from_single_file, params)
-        except Exception as e:
-            logger.error("Error during processing, exiting")
-            sys.exit(1)
+        # one budget for all workers: each session gets a copy with the current
+        # estimates when it is handed to a worker, and its measurements come back
+        budget = None
+        if argsdict["time_budget"] is not None:
+            budget = ScoringBudget(
+                argsdict["time_budget"], sessions=len(argsdict["input"]),
+                cpu_time=argsdict["budget_cpu_time"], workers=min(argsdict["cpu_count"], len(argsdict["input"]))
+            )
+        if has_videos or budget is not None:
+            # score in processes, handing out sessions only when a worker is free;
+            # video files are extracted in threads meanwhile
+            from .pipeline import run_pipeline
+            from . import sharedreport
+
+            share = has_videos and sharedreport.shared_memory_available()
+
+            if has_videos:
+                def extract(item):
+                    input_report = read_input_report(item[0], argsdict["mode"])
+                    # the cache key is computed here, so that workers do not have to
+                    # turn reports in shared memory back into dicts for hashing
+                    key = _cache_key(
+                        cache, input_report, argsdict["mode"], argsdict["debug"], argsdict["only_pa"],
+                        argsdict["only_pv"], argsdict["print_intermediate"], modules, argsdict["metrics"], item[1]
+                    )
+                    # extracted reports are passed to the scoring processes through shared memory
+                    return (sharedreport.share_report(input_report) if share else input_report, key)
+            else:
+                def extract(item):
+                    # JSON reports are read by the workers
+                    return None
+
+            if share:
+                def release(payload):
+                    sharedreport.release_report(payload[0])
+            else:
+                release = None
+
+            score = functools.partial(
+                _score_pipeline_item, argsdict["mode"], argsdict["debug"], argsdict["only_pa"], argsdict["only_pv"],
+                argsdict["print_intermediate"], modules, argsdict["metrics"], argsdict["engine"], cache
+            )
+            try:
+                output_results = run_pipeline(
+                    [(input_file, budget) for input_file in argsdict["input"]],
+                    extract,
+                    score,
+                    extract_workers=argsdict["extract_workers"] or argsdict["cpu_count"],
+                    score_workers=argsdict["cpu_count"],
+                    queue_size=argsdict["queue_size"],
+                    release=release,
+                    before_score=_budget_for_worker,
+                    after_score=_merge_budget,
+                )
+            except Exception as e:
+                logger.error("Error during processing, exiting")
+                sys.exit(1)
+        else:
+            pool = Pool(processes=argsdict["cpu_count"])
+            params = [(input_file, argsdict["mode"], argsdict["debug"], argsdict["only_pa"], argsdict["only_pv"], argsdict["print_intermediate"], modules, argsdict["metrics"], None, argsdict["engine"], cache) for input_file in argsdict["input"]]
+            try:
+                output_results = pool.starmap(extract_from_single_file, params)
+            except Exception as e:
+                logger.error("Error during processing, exiting")
+                sys.exit(1)
     else:
+        budget = None
+        if argsdict["time_budget"] is not None:
+            budget = ScoringBudget(argsdict["time_budget"], sessions=len(argsdict["input"]), cpu_time=argsdict["budget_cpu_time"])
         # iterate over input files
         for input_file in argsdict["input"]:
             try:
-                result = extract_from_single_file(input_file, argsdict["mode"], argsdict["debug"], argsdict["only_pa"], argsdict["only_pv"], argsdict["print_intermediate"], modules)
+                result = extract_from_single_file(input_file, argsdict["mode"], argsdict["debug"], argsdict["only_pa"], argsdict["only_pv"], argsdict["print_intermediate"], modules, argsdict["metrics"], budget, argsdict["engine"], cache)
             except Exception as e:
                 logger.error("Error during processing, exiting")
                 sys.exit(1)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import copy
+import time
+
+from . import log
+
+logger = log.setup_custom_logger('main')
+
+
+class ScoringBudget:
+    """
+    Time budget for scoring a number of sessions.
+
+    Pass an instance to P1203Standalone to pick the highest video mode per
+    session (3, then 1, then 0) whose estimated cost fits into an equal share
+    of the remaining time. Lower modes skip the frame data (QP values in mode 1,
+    all frames in mode 0) and are considerably cheaper for long sessions. The
+    cost per frame of each mode is estimated from the sessions scored so far.
+    The mode that was used is reported in the output "mode" field.
+
+    To share one budget between worker processes, send each session a copy
+    from for_worker() when it is handed to a worker, and pass the copy that
+    comes back with the result to merge(). Wall time budgets end at the same
+    time for all workers; CPU time budgets count the CPU time of all workers.
+    """
+
+    # initial estimates of the Pv cost per frame in seconds, per mode
+    DEFAULT_FRAME_COSTS = {0: 5e-6, 1: 7e-6, 2: 1e-5, 3: 1e-5}
+
+    # weight of a new measurement in the cost estimates
+    SMOOTHING = 0.5
+
+    def __init__(self, seconds, sessions=1, cpu_time=False, workers=1):
+        """
+        Arguments:
+            seconds {float} -- time available for all sessions, counted from the first session
+            sessions {int} -- number of sessions that will be scored with this budget (default: {1})
+            cpu_time {bool} -- measure CPU time of the process instead of wall time (default: {False})
+            workers {int} -- number of sessions scored at the same time (default: {1})
+        """
+        if seconds <= 0:
+            raise ValueError("Budget must be positive")
+        if sessions < 1:
+            raise ValueError("Budget must be for at least one session")
+        if workers < 1:
+            raise ValueError("Budget must be for at least one worker")
+        self.seconds = seconds
+        self.sessions_left = sessions
+        self.cpu_time = cpu_time
+        self.workers = workers
+        self.frame_costs = dict(ScoringBudget.DEFAULT_FRAME_COSTS)
+        self.recorded = []  # (mode, number of frames, seconds) of the sessions scored with this instance
+        self.cpu_used = None  # CPU time used by a worker copy, see finish()
+        self._deadline = None  # time.time() at which a wall time budget ends
+        self._cpu_start = None  # process time at which a CPU time budget started
+        self._cpu_spent = 0.0  # CPU time reported by workers
+
+    def clock(self):
+        """
+        Current time of the clock that the Pv cost is measured with
+        """
+        return time.process_time() if self.cpu_time else time.perf_counter()
+
+    def start(self):
+        """
+        Start the budget, unless it was started before
+        """
+        if self.cpu_time:
+            if self._cpu_start is None:
+                self._cpu_start = time.process_time()
+        elif self._deadline is None:
+            # wall clock, so that the deadline is the same in other processes
+            self._deadline = time.time() + self.seconds
+
+    def remaining(self):
+        """
+        Seconds left in the budget; the budget starts on the first call
+        """
+        self.start()
+        if self.cpu_time:
+            return self.seconds - self._cpu_spent - (time.process_time() - self._cpu_start)
+        return self._deadline - time.time()
+
+    @staticmethod
+    def count_frames(segments, mode):
+        """
+        Number of frames that Pv processes for the segments in the given mode
+        """
+        if mode == 0:
+            return sum(int(segment["duration"] * segment["fps"]) for segment in segments)
+        return sum(len(segment["frames"]) for segment in segments)
+
+    def select_mode(self, segments, available_mode):
+        """
+        Select the highest mode up to available_mode whose estimated cost fits
+        into the share of the remaining budget of the next session; mode 0 if
+        none fits
+
+        Arguments:
+            segments {list} -- video segments of the session
+            available_mode {int} -- highest mode that may be used
+
+        Returns:
+            int -- the selected mode
+        """
+        share = self.remaining() / self.sessions_left
+        if not self.cpu_time:
+            # the wall time is used by several sessions at once
+            share *= min(self.workers, self.sessions_left)
+        candidates = [available_mode] + [mode for mode in [1, 0] if mode < available_mode]
+        for mode in candidates:
+            estimate = self.frame_costs[mode] * ScoringBudget.count_frames(segments, mode)
+            if estimate <= share:
+                break
+        if mode != available_mode:
+            logger.info("Using mode {} instead of {} to stay within the budget".format(mode, available_mode))
+        return mode
+
+    def _update_estimate(self, mode, num_frames, seconds):
+        if num_frames:
+            cost = seconds / num_frames
+            self.frame_costs[mode] += ScoringBudget.SMOOTHING * (cost - self.frame_costs[mode])
+        if self.sessions_left > 1:
+            self.sessions_left -= 1
+
+    def record(self, segments, mode, seconds):
+        """
+        Update the cost estimate of a mode after a session was scored in it
+
+        Arguments:
+            segments {list} -- video segments of the session
+            mode {int} -- mode that was used
+            seconds {float} -- time taken by Pv
+        """
+        num_frames = ScoringBudget.count_frames(segments, mode)
+        self.recorded.append((mode, num_frames, seconds))
+        self._update_estimate(mode, num_frames, seconds)
+
+    def for_worker(self):
+        """
+        Return a copy of the budget to send with the next session to a worker
+        process, with the current estimates and the same deadline; starts the budget
+        """
+        self.start()
+        budget = copy.copy(self)
+        budget.frame_costs = dict(self.frame_costs)
+        budget.recorded = []
+        if self.cpu_time:
+            # the worker counts its own CPU time against what is left
+            budget.seconds = self.remaining()
+            budget._cpu_start = None
+            budget._cpu_spent = 0.0
+        return budget
+
+    def finish(self):
+        """
+        Called in the worker after the session was scored with a copy from for_worker()
+        """
+        if self.cpu_time:
+            self.cpu_used = self.seconds - self.remaining()
+
+    def merge(self, worker_budget):
+        """
+        Take over the measurements of a session that was scored with a copy
+        from for_worker(); call once per session
+
+        Arguments:
+            worker_budget {ScoringBudget} -- the copy, after finish() was called in the worker
+        """
+        for mode, num_frames, seconds in worker_budget.recorded:
+            self._update_estimate(mode, num_frames, seconds)
+        if not worker_budget.recorded and self.sessions_left > 1:
+            # no video was scored
+            self.sessions_left -= 1
+        if self.cpu_time and worker_budget.cpu_used is not None:
+            self._cpu_spent += worker_budget.cpu_used
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from collections import deque
+
+import numpy as np
+
+from . import utils
+from .errors import P1203StandaloneError
+
+
+class QPRun:
+    """
+    QP values of the non-I frames between two I frames (or between the start
+    of the chunk and its first I frame)
+    """
+    __slots__ = ["count", "sum", "last", "second_last", "ended_by_iframe"]
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0
+        self.last = None
+        self.second_last = None
+        self.ended_by_iframe = False
+
+    def add(self, qp_values, qp_sum):
+        self.count += len(qp_values)
+        self.sum += qp_sum
+        if len(qp_values) >= 2:
+            self.second_last, self.last = qp_values[-2], qp_values[-1]
+        elif qp_values:
+            self.second_last, self.last = self.last, qp_values[0]
+
+
+class Chunk:
+    """
+    Running sums over the frames of one quality level run (consecutive
+    frames with the same chunk hash) that are currently in the measurement window
+    """
+
+    def __init__(self, first_index):
+        self.first_index = first_index  # stream index of the first frame still in the window
+        self.num_frames = 0
+        self.duration = None  # common frame duration, None if durations differ
+        self.bitrate = None  # common segment bitrate, None if bitrates differ
+        self.size_sum = 0
+        self.i_size_sum = 0
+        self.i_count = 0
+        self.noni_size_sum = 0
+        self.noni_count = 0
+        self.qp_sum = 0  # QP values of non-I frames
+        self.qp_count = 0
+        self.qp_runs = deque()
+
+    def iframe_ratio(self):
+        """
+        Ratio of average I frame size to average non-I frame size, as in
+        P1203Pv.video_model_function_mode1; 0 if there are not both kinds of frames
+        """
+        if self.i_count and self.noni_count:
+            return (float(self.i_size_sum) / self.i_count) / (float(self.noni_size_sum) / self.noni_count)
+        return 0
+
+    def avg_qp(self, mode):
+        """
+        Average QP of the non-I frames, as in P1203Pv.video_model_function_mode2/3;
+        NaN if there are no non-I frames.
+
+        In mode 3, the QP of the last non-I frame before an I frame is replaced by
+        the one before it, or dropped if it is the only QP value collected so far.
+        This only needs to look at one entry per I frame.
+        """
+        qp_sum = self.qp_sum
+        qp_count = self.qp_count
+        if mode == 3:
+            dropping = True  # no QP values were kept so far
+            last_kept = None
+            for run in self.qp_runs:
+                if not run.ended_by_iframe:
+                    break
+                if run.count == 0:
+                    continue
+                if dropping and run.count == 1:
+                    qp_sum -= run.sum
+                    qp_count -= 1
+                    continue
+                dropping = False
+                if run.count >= 2:
+                    qp_sum += run.second_last - run.last
+                    last_kept = run.second_last
+                else:
+                    qp_sum += last_kept - run.last
+        if not qp_count:
+            return float("nan")
+        return float(qp_sum) / qp_count
+
+
+class ChunkStats:
+    """
+    Keeps per-chunk statistics of the frames in the measurement window up to
+    date as frames are added and leave the window, so that the Pv model
+    callback does not have to look at every frame of the chunk.
+
+    Frames have to be passed to add_frame() in the same order as to the
+    measurement window, and sync_window() has to be called with the current
+    number of frames in the window before reading statistics.
+    """
+
+    def __init__(self):
+        # (chunk, is_iframe, compensated size, QP run, number and sum of QP values) per frame in the window
+        self._frames = deque()
+        self._num_added = 0
+        self._last_hash = None
+        self._last_chunk = None
+        self._duration_sums = {}
+        self._bitrate_means = {}
+        # the QP averages are only exact (and equal to np.mean) for integer QPs
+        self.integer_qps = True
+
+    def add_frame(self, frame):
+        """
+        Add a frames.Frame; frames without size (mode 0) are only counted
+        """
+        segment = frame.segment
+        chunk_hash = segment.chunk_hashes["video"]
+        if self._last_chunk is None or chunk_hash != self._last_hash:
+            self._last_chunk = Chunk(self._num_added)
+            self._last_hash = chunk_hash
+        chunk = self._last_chunk
+
+        if chunk.num_frames == 0:
+            chunk.duration = frame.duration
+            chunk.bitrate = segment.bitrate
+        else:
+            if chunk.duration is not None and frame.duration != chunk.duration:
+                chunk.duration = None
+            if chunk.bitrate is not None and segment.bitrate != chunk.bitrate:
+                chunk.bitrate = None
+
+        if frame.size is None:
+            # mode 0 frames only have segment information
+            chunk.num_frames += 1
+            self._frames.append((chunk, False, 0, None, 0, 0))
+            self._num_added += 1
+            return
+
+        frame_type = frame.type
+        size = utils.calculate_compensated_size(frame_type, frame.size, frame.dts)
+        is_iframe = frame_type == "I"
+        chunk.num_frames += 1
+        chunk.size_sum += size
+        if is_iframe:
+            chunk.i_size_sum += size
+            chunk.i_count += 1
+        else:
+            chunk.noni_size_sum += size
+            chunk.noni_count += 1
+
+        run = None
+        qp_count = 0
+        qp_sum = 0
+        qp_values = frame.qpValues
+        if qp_values is not None:
+            if frame_type not in ["I", "P", "B", "Non-I"]:
+                raise P1203StandaloneError("frame type " + str(frame_type) + " not valid; must be I/P/B or I/Non-I")
+            if not chunk.qp_runs or chunk.qp_runs[-1].ended_by_iframe:
+                chunk.qp_runs.append(QPRun())
+            run = chunk.qp_runs[-1]
+            if is_iframe:
+                run.ended_by_iframe = True
+            else:
+                if self.integer_qps and not all(type(qp) is int for qp in qp_values):
+                    self.integer_qps = False
+                qp_count = len(qp_values)
+                qp_sum = sum(qp_values)
+                run.add(qp_values, qp_sum)
+                chunk.qp_sum += qp_sum
+                chunk.qp_count += qp_count
+
+        self._frames.append((chunk, is_iframe, size, run, qp_count, qp_sum))
+        self._num_added += 1
+
+    def sync_window(self, window_length):
+        """
+        Remove the oldest frames until only the given number of frames is left
+        """
+        while len(self._frames) > window_length:
+            chunk, is_iframe, size, run, qp_count, qp_sum = self._frames.popleft()
+            chunk.first_index += 1
+            chunk.num_frames -= 1
+            chunk.size_sum -= size
+            if is_iframe:
+                chunk.i_size_sum -= size
+                chunk.i_count -= 1
+            else:
+                chunk.noni_size_sum -= size
+                chunk.noni_count -= 1
+            if run is not None:
+                # frames leave from the front, so this is the chunk's first run;
+                # its last two QP values stay the same until it is empty
+                if is_iframe:
+                    chunk.qp_runs.popleft()
+                else:
+                    run.count -= qp_count
+                    run.sum -= qp_sum
+                    chunk.qp_sum -= qp_sum
+                    chunk.qp_count -= qp_count
+
+    def chunk_at(self, window_index):
+        """
+        Return the chunk of the frame at the given index in the window, and the
+        window index of the chunk's first frame
+        """
+        chunk = self._frames[window_index][0]
+        window_start = self._num_added - len(self._frames)
+        return chunk, chunk.first_index - window_start
+
+    def chunk_duration(self, chunk, frames):
+        """
+        Summed duration of the chunk's frames, computed as np.sum() over the
+        frame durations so that the result is the same to the last bit
+
+        Arguments:
+            chunk {Chunk} -- chunk returned by chunk_at()
+            frames {list} -- frames in the window, used if the frame durations differ
+        """
+        if chunk.duration is None:
+            window_start = self._num_added - len(self._frames)
+            first = chunk.first_index - window_start
+            return np.sum([f.duration for f in frames[first:first + chunk.num_frames]])
+        key = (chunk.num_frames, chunk.duration)
+        duration = self._duration_sums.get(key)
+        if duration is None:
+            duration = np.sum(np.full(chunk.num_frames, chunk.duration))
+            self._duration_sums[key] = duration
+        return duration
+
+    def chunk_mean_bitrate(self, chunk, frames):
+        """
+        Mean segment bitrate of the chunk's frames, computed as np.mean() over the
+        frame bitrates so that the result is the same to the last bit
+
+        Arguments:
+            chunk {Chunk} -- chunk returned by chunk_at()
+            frames {list} -- frames in the window, used if the bitrates differ
+        """
+        if chunk.bitrate is None:
+            window_start = self._num_added - len(self._frames)
+            first = chunk.first_index - window_start
+            return np.mean([f.bitrate for f in frames[first:first + chunk.num_frames]])
+        key = (chunk.num_frames, chunk.bitrate)
+        bitrate = self._bitrate_means.get(key)
+        if bitrate is None:
+            bitrate = np.mean(np.full(chunk.num_frames, chunk.bitrate))
+            self._bitrate_means[key] = bitrate
+        return bitrate
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Typed columnar storage for per-sample features.
+
+A feature store is an uncompressed .npz file with one array per scalar
+column. Columns that hold a list per sample (e.g. frame types or QP values
+per frame) are stored as ragged columns: all values concatenated, plus
+offsets so that the values of sample i are values[offsets[i]:offsets[i + 1]].
+String values are stored as integer codes into a list of categories. No
+pickled objects are stored, so loading a store never runs code.
+"""
+
+import ast
+import math
+
+import numpy as np
+
+from .errors import P1203StandaloneError
+
+FORMAT_VERSION = 1
+
+
+class RaggedColumn:
+    """
+    A column with a variable number of values per row
+    """
+
+    def __init__(self, values, offsets, valid=None, categories=None):
+        """
+        Arguments:
+            values {np.array} -- values of all rows, concatenated
+            offsets {np.array} -- start of each row in values, plus the total length
+            valid {np.array} -- False for rows without data [default: all rows valid]
+            categories {list} -- if given, values are codes into this list of strings
+        """
+        self.values = np.asarray(values)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if self.offsets.ndim != 1 or len(self.offsets) < 1 or self.offsets[-1] != len(self.values):
+            raise P1203StandaloneError("Offsets do not match the number of values")
+        if valid is None:
+            valid = np.ones(len(self.offsets) - 1, dtype=bool)
+        self.valid = np.asarray(valid, dtype=bool)
+        self.categories = list(categories) if categories is not None else None
+
+    @classmethod
+    def from_lists(cls, rows):
+        """
+        Create a column from a list of lists; None marks rows without data.
+        Rows of strings are encoded as categories.
+        """
+        valid = np.array([row is not None for row in rows], dtype=bool)
+        rows = [row if row is not None else [] for row in rows]
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        flat = [value for row in rows for value in row]
+
+        if flat and all(isinstance(value, str) for value in flat):
+            categories, codes = np.unique(np.array(flat), return_inverse=True)
+            return cls(codes.astype(np.uint8 if len(categories) <= 256 else np.int32), offsets, valid, categories.tolist())
+        if flat and all(isinstance(value, int) for value in flat):
+            return cls(np.array(flat, dtype=np.int64), offsets, valid)
+        return cls(np.array(flat, dtype=np.float64), offsets, valid)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        """
+        Return the values of one row (a view, not a copy)
+        """
+        return self.values[self.offsets[index]:self.offsets[index + 1]]
+
+    def lengths(self):
+        """
+        Number of values per row
+        """
+        return np.diff(self.offsets)
+
+    def finite_rows(self):
+        """
+        False for rows with a NaN or infinite value; rows without values are finite
+        """
+        if not np.issubdtype(self.values.dtype, np.floating):
+            return np.ones(len(self), dtype=bool)
+        non_finite = np.bincount(self.row_ids(), weights=~np.isfinite(self.values), minlength=len(self))
+        return non_finite == 0
+
+    def row_ids(self):
+        """
+        Row index for each value
+        """
+        return np.repeat(np.arange(len(self), dtype=np.int64), self.lengths())
+
+    def equals(self, category):
+        """
+        Boolean mask over the values that are equal to the given category
+        """
+        if self.categories is None:
+            raise P1203StandaloneError("Column has no categories")
+        if category not in self.categories:
+            return np.zeros(len(self.values), dtype=bool)
+        return self.values == self.categories.index(category)
+
+    def truncate(self, lengths):
+        """
+        Return a column with only the first lengths[i] values of each row
+        """
+        lengths = np.minimum(np.asarray(lengths, dtype=np.int64), self.lengths())
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        index = np.arange(offsets[-1], dtype=np.int64) + np.repeat(self.offsets[:-1] - offsets[:-1], lengths)
+        return RaggedColumn(self.values[index], offsets, self.valid, self.categories)
+
+    def take(self, rows):
+        """
+        Return a column with the given rows only, in the given order
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.lengths()[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        index = np.arange(offsets[-1], dtype=np.int64) + np.repeat(self.offsets[rows] - offsets[:-1], lengths)
+        return RaggedColumn(self.values[index], offsets, self.valid[rows], self.categories)
+
+
+class FeatureStore:
+    """
+    Columns of a feature store, as returned by read_feature_store()
+    """
+
+    def __init__(self, columns):
+        """
+        Arguments:
+            columns {dict} -- column name -> np.array or RaggedColumn, all of the same length
+        """
+        lengths = set(len(column) for column in columns.values())
+        if len(lengths) > 1:
+            raise P1203StandaloneError("Columns of a feature store must have the same length")
+        self._columns = dict(columns)
+        self._length = lengths.pop() if lengths else 0
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def columns(self):
+        return list(self._columns.keys())
+
+    def scalar_columns(self):
+        """
+        Return dict of name -> np.array of all columns that are not ragged
+        """
+        return {
+            name: column for name, column in self._columns.items()
+            if not isinstance(column, RaggedColumn)
+        }
+
+    def take(self, rows):
+        """
+        Return a store with the given rows only
+        """
+        return FeatureStore({name: column[rows] if not isinstance(column, RaggedColumn) else column.take(rows)
+                             for name, column in self._columns.items()})
+
+
+def write_feature_store(path, columns):
+    """
+    Write columns to a feature store file.
+
+    Arguments:
+        path {str} -- output file, should end with .npz
+        columns {dict or FeatureStore} -- column name -> array-like or RaggedColumn
+    """
+    if isinstance(columns, FeatureStore):
+        columns = {name: columns[name] for name in columns.columns()}
+    arrays = {"__format__": np.array([FORMAT_VERSION])}
+    length = None
+    for name, column in columns.items():
+        if "." in name or name.startswith("__"):
+            raise P1203StandaloneError("Invalid column name {}".format(name))
+        if length is not None and len(column) != length:
+            raise P1203StandaloneError("Column {} has {} rows, expected {}".format(name, len(column), length))
+        length = len(column)
+        if isinstance(column, RaggedColumn):
+            arrays[name + ".values"] = column.values
+            arrays[name + ".offsets"] = column.offsets
+            if not column.valid.all():
+                arrays[name + ".valid"] = column.valid
+            if column.categories is not None:
+                arrays[name + ".categories"] = np.array(column.categories, dtype=str)
+        else:
+            column = np.asarray(column)
+            if column.dtype == object:
+                column = column.astype(str)
+            arrays[name] = column
+    np.savez(path, **arrays)
+
+
+def read_feature_store(path):
+    """
+    Read a feature store file written by write_feature_store()
+
+    Returns:
+        FeatureStore
+    """
+    columns = {}
+    with np.load(path, allow_pickle=False) as data:
+        if "__format__" not in data.files or int(data["__format__"][0]) != FORMAT_VERSION:
+            raise P1203StandaloneError("{} is not a feature store of version {}".format(path, FORMAT_VERSION))
+        for key in data.files:
+            if key == "__format__":
+                continue
+            name, _, part = key.partition(".")
+            if not part:
+                columns[name] = data[key]
+            elif part == "values":
+                columns[name] = RaggedColumn(
+                    data[key],
+                    data[name + ".offsets"],
+                    data[name + ".valid"] if name + ".valid" in data.files else None,
+                    data[name + ".categories"].tolist() if name + ".categories" in data.files else None,
+                )
+    return FeatureStore(columns)
+
+
+class _FloatNames(ast.NodeTransformer):
+    """
+    Replace the names nan and inf, as written by Python for float lists, by their values
+    """
+
+    def visit_Name(self, node):
+        if node.id in ["nan", "inf"]:
+            return ast.copy_location(ast.Constant(float(node.id)), node)
+        return node
+
+
+def _literal_list(value):
+    """
+    Parse a list literal string, see parse_list()
+
+    Raises:
+        ValueError -- if the value is not a list or tuple literal
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if not isinstance(value, str):
+        raise ValueError("Expected a list, got {!r}".format(value))
+    try:
+        tree = _FloatNames().visit(ast.parse(value.strip(), mode="eval"))
+        parsed = ast.literal_eval(tree)
+    except (SyntaxError, ValueError, TypeError, MemoryError, RecursionError) as e:
+        raise ValueError("Could not parse list {!r}: {}".format(value, e))
+    if not isinstance(parsed, (list, tuple)):
+        raise ValueError("Expected a list, got {!r}".format(value))
+    return list(parsed)
+
+
+def parse_list(value):
+    """
+    Parse a list stored as Python literal string, e.g. "['I', 'P']", "[31.5, nan]"
+    or "(1, 2)"; returns None for empty cells (None or NaN)
+
+    Raises:
+        P1203StandaloneError -- if the value is not a list or tuple literal
+    """
+    try:
+        return _literal_list(value)
+    except ValueError as e:
+        raise P1203StandaloneError(str(e))
+
+
+def _parse_list_or_invalid(value):
+    """
+    parse_list(), returning None (an invalid row) for values that cannot be parsed
+    """
+    try:
+        return _literal_list(value)
+    except ValueError:
+        return None
+
+
+def convert_csv_files(csv_files, path, list_columns, lenient_columns=()):
+    """
+    Convert feature CSV files, where list columns are stored as Python literal
+    strings, into one feature store file. Rows are stored in the order of the files.
+
+    Arguments:
+        csv_files {list} -- input CSV files
+        path {str} -- output .npz file
+        list_columns {list} -- names of the columns holding lists; they are stored
+                               as ragged columns, files without such a column get
+                               invalid rows
+        lenient_columns {list} -- list columns in which cells that cannot be parsed
+                                  become invalid rows instead of raising an error
+
+    Returns:
+        FeatureStore -- the written columns
+    """
+    import pandas as pd
+
+    data = pd.concat([pd.read_csv(csv_file) for csv_file in csv_files], ignore_index=True, sort=False)
+    columns = {}
+    for name in data.columns:
+        if name in list_columns:
+            parse = _parse_list_or_invalid if name in lenient_columns else parse_list
+            columns[name] = RaggedColumn.from_lists([parse(value) for value in data[name]])
+        else:
+            columns[name] = data[name].values
+    for name in list_columns:
+        if name not in columns:
+            columns[name] = RaggedColumn.from_lists([None] * len(data))
+
+    write_feature_store(path, columns)
+    return FeatureStore(columns)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Compact frame records for the measurement window.
+
+Pa and Pv create one record per (real or generated) frame. Instead of a dict
+per frame that copies the segment's codec, bitrate, frame rate, resolution and
+representation, a Frame only stores its own DTS, duration, size, type and QP
+values, and refers to one SegmentInfo shared by all frames of its segment.
+The chunk hash (see utils.get_chunk_hash) is computed once per segment.
+
+The measurement window and the model callbacks read the fields as attributes
+(frame.dts). Frames can also be read like dicts (frame["dts"], "size" in frame),
+so that code written for frame dicts, e.g. the P1203Pv model functions, works
+with both.
+"""
+
+from operator import attrgetter
+
+from . import utils
+
+
+class SegmentInfo:
+    """
+    Fields that are the same for all frames of a segment
+    """
+    __slots__ = ["index", "frame_duration", "bitrate", "codec", "fps", "resolution", "representation", "chunk_hashes"]
+
+    def __init__(self, index, segment, frame_duration):
+        """
+        Arguments:
+            index {int} -- index of the segment in the session
+            segment {dict} -- input segment with at least "bitrate" and "codec"
+            frame_duration {float} -- duration of each frame of the segment
+        """
+        self.index = index
+        self.frame_duration = frame_duration
+        self.bitrate = segment["bitrate"]
+        self.codec = segment["codec"]
+        self.fps = segment.get("fps")
+        self.resolution = segment.get("resolution")
+        self.representation = segment.get("representation")
+
+        fields = {"bitrate": self.bitrate, "codec": self.codec, "fps": self.fps}
+        if "representation" in segment:
+            fields["representation"] = self.representation
+        self.chunk_hashes = {
+            "video": utils.get_chunk_hash(fields, "video"),
+            "audio": utils.get_chunk_hash(fields, "audio"),
+        }
+
+
+class Frame:
+    """
+    One frame in the measurement window; segment-level fields are read from its SegmentInfo
+    """
+    __slots__ = ["segment", "dts", "duration", "size", "type", "qpValues"]
+
+    KEYS = ["duration", "dts", "bitrate", "codec", "fps", "resolution", "representation", "size", "type", "qpValues"]
+    KEY_SET = frozenset(KEYS)
+
+    bitrate = property(attrgetter("segment.bitrate"))
+    codec = property(attrgetter("segment.codec"))
+    fps = property(attrgetter("segment.fps"))
+    resolution = property(attrgetter("segment.resolution"))
+    representation = property(attrgetter("segment.representation"))
+
+    def __init__(self, segment, dts, size=None, type=None, qp_values=None):
+        """
+        Arguments:
+            segment {SegmentInfo} -- segment of the frame
+            dts {float} -- decoding timestamp
+            size {int} -- frame size, None for generated frames without frame information
+            type {str} -- frame type
+            qp_values {list} -- QP values of the frame, if available
+        """
+        self.segment = segment
+        self.dts = dts
+        self.duration = segment.frame_duration
+        self.size = size
+        self.type = type
+        self.qpValues = qp_values
+
+    def __getitem__(self, key):
+        """
+        Dict-style access to the fields in KEYS; unlike in a dict, fields without
+        a value are None instead of missing
+        """
+        if key not in Frame.KEY_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in Frame.KEY_SET and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key) if key in Frame.KEY_SET else None
+        return value if value is not None else default
+
+    def keys(self):
+        return [key for key in Frame.KEYS if getattr(self, key) is not None]
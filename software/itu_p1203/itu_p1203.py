@@ -27,6 +27,7 @@ import json
 import datetime
 
 from . import log
+from . import metrics as p1203metrics
 from .p1203Pa import P1203Pa
 from .p1203Pv import P1203Pv
 from .p1203Pq import P1203Pq
@@ -41,7 +42,7 @@ class P1203Standalone:
     Class for calculating P1203 based on JSON input files
     """
 
-    def __init__(self, input_report, debug=False, Pa=P1203Pa, Pv=P1203Pv, Pq=P1203Pq):
+    def __init__(self, input_report, debug=False, Pa=P1203Pa, Pv=P1203Pv, Pq=P1203Pq, metrics=None, mode=None, budget=None, engine=None):
         """
         Initialize a standalone model run based on JSON input files
 
@@ -53,6 +54,13 @@ class P1203Standalone:
             Pa -- used short time audio quality estimation module (default P1203Pa)
             Pv -- used short time video quality estimation module (default P1203Pv)
             Pq -- used audio visual integration module (default P1203Pq)
+            metrics {Metrics} -- optional metrics object that records the wall time of each
+                                 stage and counters of the modules (default: {None})
+            mode {int} -- video mode to run, at most the mode the input report allows
+                          (default: {None}, the highest available mode)
+            budget {ScoringBudget} -- optional time budget; the video mode is lowered
+                                      if the session would not fit into it (default: {None})
+            engine {str} -- Pv engine, "auto", "python" or "jit" (default: {None}, the default of the Pv module)
 
         """
         self.input_report = input_report
@@ -65,6 +73,19 @@ class P1203Standalone:
         self.Pa = Pa if Pa is not None else P1203Pa
         self.Pv = Pv if Pv is not None else P1203Pv
         self.Pq = Pq if Pq is not None else P1203Pq
+        self.metrics = metrics
+        self.mode = mode
+        self.budget = budget
+        self.engine = engine
+
+    def _module_kwargs(self):
+        """
+        Keyword arguments passed to the Pa, Pv, Pq modules; metrics are only
+        passed when enabled, so that other modules do not need to support them
+        """
+        if self.metrics is None:
+            return {}
+        return {"metrics": self.metrics}
 
     def calculate_pa(self):
         """
@@ -72,33 +93,34 @@ class P1203Standalone:
         """
         logger.debug("Calculating audio scores ...")
 
-        # estimate quality from segments
-        if 'I11' in self.input_report.keys():
-            segments = []
-            if 'segments' not in self.input_report['I11']:
-                logger.warning("No audio segments specified")
-            else:
-                segments = self.input_report['I11']["segments"]
-
-            stream_id = None
-            try:
-                stream_id = self.input_report["I11"]["streamId"]
-            except Exception:
-                logger.warning("No stream ID specified")
-
-            self.audio = self.Pa(segments, stream_id).calculate()
-
-        # use existing O21 scores
-        elif 'O21' in self.input_report.keys():
-            self.audio = {
-                "audio": {
-                    "streamId": -1,
-                    "O21": self.input_report['O21']
+        with p1203metrics.measure(self.metrics, "Pa"):
+            # estimate quality from segments
+            if 'I11' in self.input_report.keys():
+                segments = []
+                if 'segments' not in self.input_report['I11']:
+                    logger.warning("No audio segments specified")
+                else:
+                    segments = self.input_report['I11']["segments"]
+
+                stream_id = None
+                try:
+                    stream_id = self.input_report["I11"]["streamId"]
+                except Exception:
+                    logger.warning("No stream ID specified")
+
+                self.audio = self.Pa(segments, stream_id, **self._module_kwargs()).calculate()
+
+            # use existing O21 scores
+            elif 'O21' in self.input_report.keys():
+                self.audio = {
+                    "audio": {
+                        "streamId": -1,
+                        "O21": self.input_report['O21']
+                    }
                 }
-            }
 
-        else:
-            raise P1203StandaloneError("No 'I11' or 'O21' found in input report")
+            else:
+                raise P1203StandaloneError("No 'I11' or 'O21' found in input report")
 
         if self.debug:
             print(json.dumps(self.audio, indent=True, sort_keys=True))
@@ -111,42 +133,66 @@ class P1203Standalone:
         """
         logger.debug("Calculating video scores ...")
 
-        # estimate quality from segments
-        if 'I13' in self.input_report.keys():
-            if 'segments' not in self.input_report["I13"]:
-                raise P1203StandaloneError("No video segments defined, check your input format")
-
-            segments = self.input_report["I13"]["segments"]
-
-            display_res = "1920x1080"
-            try:
-                display_res = self.input_report["IGen"]["displaySize"]
-            except Exception:
-                logger.warning("No display resolution specified, assuming full HD")
-
-            stream_id = None
-            try:
-                stream_id = self.input_report["I13"]["streamId"]
-            except Exception:
-                logger.warning("No stream ID specified")
-
-            self.video = self.Pv(
-                segments=segments,
-                display_res=display_res,
-                stream_id=stream_id
-            ).calculate()
-
-        # use existing O22 scores
-        elif 'O22' in self.input_report.keys():
-            self.video = {
-                "video": {
-                    "streamId": -1,
-                    "O22": self.input_report['O22']
+        with p1203metrics.measure(self.metrics, "Pv"):
+            # estimate quality from segments
+            if 'I13' in self.input_report.keys():
+                if 'segments' not in self.input_report["I13"]:
+                    raise P1203StandaloneError("No video segments defined, check your input format")
+
+                segments = self.input_report["I13"]["segments"]
+
+                display_res = "1920x1080"
+                try:
+                    display_res = self.input_report["IGen"]["displaySize"]
+                except Exception:
+                    logger.warning("No display resolution specified, assuming full HD")
+
+                stream_id = None
+                try:
+                    stream_id = self.input_report["I13"]["streamId"]
+                except Exception:
+                    logger.warning("No stream ID specified")
+
+                mode = self.mode
+                if self.budget is not None:
+                    # the budget selects the mode, so the Pv module has to support modes
+                    if not hasattr(self.Pv, "detect_mode"):
+                        raise P1203StandaloneError(
+                            "A time budget needs a Pv module with detect_mode() and a mode argument, "
+                            "{} does not support modes".format(self.Pv.__name__)
+                        )
+                    available_mode = self.Pv.detect_mode(segments)
+                    if mode is None or mode <= available_mode:
+                        mode = self.budget.select_mode(segments, available_mode if mode is None else mode)
+                    start = self.budget.clock()
+
+                # like metrics, only pass the mode when set, so that other Pv modules do not need to support it
+                pv_kwargs = self._module_kwargs()
+                if mode is not None:
+                    pv_kwargs["mode"] = mode
+                if self.engine is not None:
+                    pv_kwargs["engine"] = self.engine
+                self.video = self.Pv(
+                    segments=segments,
+                    display_res=display_res,
+                    stream_id=stream_id,
+                    **pv_kwargs
+                ).calculate()
+
+                if self.budget is not None:
+                    self.budget.record(segments, self.video["video"]["mode"], self.budget.clock() - start)
+
+            # use existing O22 scores
+            elif 'O22' in self.input_report.keys():
+                self.video = {
+                    "video": {
+                        "streamId": -1,
+                        "O22": self.input_report['O22']
+                    }
                 }
-            }
 
-        else:
-            raise P1203StandaloneError("No 'I13' or 'O22' found in input report")
+            else:
+                raise P1203StandaloneError("No 'I13' or 'O22' found in input report")
 
         if self.debug:
             print(json.dumps(self.video, indent=True, sort_keys=True))
@@ -159,23 +205,25 @@ class P1203Standalone:
         """
         logger.debug("Calculating integration module ...")
 
-        stalling = []
-        if "I23" in self.input_report.keys() and "stalling" in self.input_report["I23"].keys():
-            stalling = self.input_report["I23"]["stalling"]
+        with p1203metrics.measure(self.metrics, "Pq"):
+            stalling = []
+            if "I23" in self.input_report.keys() and "stalling" in self.input_report["I23"].keys():
+                stalling = self.input_report["I23"]["stalling"]
 
-        device = "pc"
-        try:
-            device = self.input_report["IGen"]["device"]
-        except Exception:
-            logger.warning("Device not defined in input report, assuming PC")
-
-        self.integration = self.Pq(
-            O21=self.audio["audio"]["O21"],
-            O22=self.video["video"]["O22"],
-            l_buff=[x[1] for x in stalling],
-            p_buff=[x[0] - stalling[0][0] for x in stalling],
-            device=device
-        ).calculate()
+            device = "pc"
+            try:
+                device = self.input_report["IGen"]["device"]
+            except Exception:
+                logger.warning("Device not defined in input report, assuming PC")
+
+            self.integration = self.Pq(
+                O21=self.audio["audio"]["O21"],
+                O22=self.video["video"]["O22"],
+                l_buff=[x[1] for x in stalling],
+                p_buff=[x[0] - stalling[0][0] for x in stalling],
+                device=device,
+                **self._module_kwargs()
+            ).calculate()
 
         return self.integration
 
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Array engine for the Pv frame loop, compiled with Numba if it is installed.
+
+P1203Pv feeds frame records through the measurement window one by one. This
+engine builds typed arrays of the frames instead, and runs the measurement
+window and the per-chunk aggregation in kernels that are compiled with Numba
+if it is available (otherwise they run as plain Python, which is slow and
+only useful for testing). The model functions are evaluated as in P1203Pv,
+so the O22 scores are the same to the last bit.
+
+The rounding in MeasurementWindow (round(x, 5) compared to an integer) is
+replaced by comparisons against the smallest float that rounds up to that
+integer, which gives the same decisions.
+
+Sessions the engine cannot reproduce exactly (QP values that are not
+integers, an output sample at the first frame of the window, an average QP of
+zero) are left to the Python engine: calculate_o22() returns None for them.
+"""
+
+import math
+
+import numpy as np
+
+from . import log
+from . import utils
+from .errors import P1203StandaloneError
+
+logger = log.setup_custom_logger('main')
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+ENGINES = ["auto", "python", "jit"]
+
+# same constants as in MeasurementWindow
+WINDOW_SIZE = 20
+HALF_WINDOW_SIZE = 10
+
+# round limits are stored for integers starting at -LIMIT_OFFSET
+LIMIT_OFFSET = HALF_WINDOW_SIZE
+_round_limits = np.zeros(0)
+
+
+def _jit(function):
+    """
+    Compile a kernel with Numba if it is available
+    """
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+def select_engine(engine):
+    """
+    Return the engine to use for the given engine option: "jit" if Numba is
+    installed and "auto" or "jit" was given, "python" otherwise
+
+    Arguments:
+        engine {str} -- "auto", "python" or "jit"
+    """
+    if engine not in ENGINES:
+        raise P1203StandaloneError("Unknown engine {}, must be one of {}".format(engine, ", ".join(ENGINES)))
+    if engine == "python":
+        return "python"
+    if not HAVE_NUMBA:
+        if engine == "jit":
+            logger.warning("Numba is not installed, using the Python engine")
+        return "python"
+    return "jit"
+
+
+def _round_limit(n):
+    """
+    Smallest float x for which round(x, 5) >= n
+    """
+    x = n - 0.000005
+    while round(x, 5) >= n:
+        x = float(np.nextafter(x, -np.inf))
+    while round(x, 5) < n:
+        x = float(np.nextafter(x, np.inf))
+    return x
+
+
+def round_limits(size):
+    """
+    Array with the round limits of the integers -LIMIT_OFFSET to size - LIMIT_OFFSET - 1,
+    i.e. round(x, 5) < n if and only if x < round_limits(...)[n + LIMIT_OFFSET]
+    """
+    global _round_limits
+    if len(_round_limits) < size:
+        _round_limits = np.array([_round_limit(n - LIMIT_OFFSET) for n in range(size)])
+    return _round_limits
+
+
+@_jit
+def window_kernel(dts, durations, limits):
+    """
+    Run the measurement window over the frames and return the output samples
+    as arrays of timestamps, first frame and end (exclusive) of the window.
+    This follows MeasurementWindow.add_frame() and stream_finished().
+    """
+    num_frames = len(durations)
+    total_duration = dts[num_frames - 1] + durations[num_frames - 1]
+    max_samples = int(math.floor(total_duration)) + 1
+    timestamps = np.empty(max_samples, np.int64)
+    window_starts = np.empty(max_samples, np.int64)
+    window_ends = np.empty(max_samples, np.int64)
+    num_samples = 0
+
+    window_start = 0
+    acc_frame_dur = 0.0
+    last_output = 0
+    for i in range(num_frames):
+        duration = durations[i]
+        if acc_frame_dur + duration > WINDOW_SIZE:
+            acc_frame_dur -= durations[window_start]
+            window_start += 1
+        acc_frame_dur += duration
+        # the accumulated duration is summed in the same order as the DTS
+        acc_pvs_dur = dts[i] + duration
+        if last_output == 0 and acc_pvs_dur < limits[HALF_WINDOW_SIZE + 1 + LIMIT_OFFSET]:
+            continue
+        if acc_pvs_dur - HALF_WINDOW_SIZE >= last_output + 1:
+            last_output += 1
+            timestamps[num_samples] = last_output
+            window_starts[num_samples] = window_start
+            window_ends[num_samples] = i + 1
+            num_samples += 1
+
+    final_sample_timestamp = int(math.floor(total_duration))
+    output_sample_timestamp = last_output + 1
+    while output_sample_timestamp <= final_sample_timestamp:
+        while dts[window_start] < limits[output_sample_timestamp - HALF_WINDOW_SIZE + LIMIT_OFFSET]:
+            window_start += 1
+        timestamps[num_samples] = output_sample_timestamp
+        window_starts[num_samples] = window_start
+        window_ends[num_samples] = num_frames
+        num_samples += 1
+        output_sample_timestamp += 1
+
+    return timestamps[:num_samples], window_starts[:num_samples], window_ends[:num_samples]
+
+
+@_jit
+def chunk_kernel(dts, run_starts, run_ends, timestamps, window_starts, window_ends):
+    """
+    Return the first and end (exclusive) frame of the chunk of each output sample,
+    i.e. the frames in the window with the same chunk hash as the last frame before
+    the output sample timestamp. The third value is False if an output sample falls
+    on the first frame of the window, which utils.get_chunk() handles differently.
+    """
+    num_samples = len(timestamps)
+    chunk_starts = np.empty(num_samples, np.int64)
+    chunk_ends = np.empty(num_samples, np.int64)
+    for k in range(num_samples):
+        window_start = window_starts[k]
+        window_end = window_ends[k]
+        frame = window_start + np.searchsorted(dts[window_start:window_end], timestamps[k]) - 1
+        if frame <= window_start:
+            return chunk_starts, chunk_ends, False
+        chunk_starts[k] = max(run_starts[frame], window_start)
+        chunk_ends[k] = min(run_ends[frame], window_end)
+    return chunk_starts, chunk_ends, True
+
+
+@_jit
+def avg_qp_kernel(chunk_starts, chunk_ends, is_iframe, qp_values, qp_offsets, mode):
+    """
+    Average QP of the non-I frames of each chunk, NaN if there are none. In mode 3,
+    the last QP value before an I frame is replaced by the one before it, or dropped
+    if it is the only one collected so far (see P1203Pv.video_model_function_mode3).
+    """
+    num_samples = len(chunk_starts)
+    avg_qp = np.empty(num_samples)
+    for k in range(num_samples):
+        qp_sum = 0
+        qp_count = 0
+        last = 0
+        second_last = 0
+        for frame in range(chunk_starts[k], chunk_ends[k]):
+            if is_iframe[frame]:
+                if mode == 3 and qp_count > 1:
+                    qp_sum += second_last - last
+                    last = second_last
+                elif mode == 3 and qp_count == 1:
+                    qp_sum = 0
+                    qp_count = 0
+            else:
+                for index in range(qp_offsets[frame], qp_offsets[frame + 1]):
+                    second_last = last
+                    last = qp_values[index]
+                    qp_sum += last
+                    qp_count += 1
+        if qp_count:
+            avg_qp[k] = qp_sum / qp_count
+        else:
+            avg_qp[k] = np.nan
+    return avg_qp
+
+
+def _changes(values):
+    """
+    Prefix count of positions where the value differs from the one before,
+    to check whether a range of frames has a common value
+    """
+    changed = np.zeros(len(values), dtype=np.int64)
+    if len(values) > 1:
+        changed[1:] = values[1:] != values[:-1]
+    return np.cumsum(changed)
+
+
+def _range_sums(values, starts, ends):
+    """
+    Sums of values[start:end] from integer prefix sums (exact)
+    """
+    prefix = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(values, out=prefix[1:])
+    return prefix[ends] - prefix[starts]
+
+
+def _shared_frames(segments):
+    """
+    Return the FrameColumns and the range of frames of the segments if their frames
+    are consecutive SegmentFrames on the same columns (see sharedreport), None otherwise
+    """
+    from .sharedreport import SegmentFrames
+
+    frames = [segment["frames"] for segment in segments]
+    if not all(isinstance(segment_frames, SegmentFrames) for segment_frames in frames):
+        return None
+    for previous, current in zip(frames, frames[1:]):
+        if current.columns is not frames[0].columns or current.start != previous.stop:
+            return None
+    return frames[0].columns, frames[0].start, frames[-1].stop
+
+
+def _frame_arrays(segments, mode):
+    """
+    Return the frame arrays needed in the given mode as dict with the keys
+    "is_iframe", "sizes" (mode 1, sizes as int()), "qp_values" and "qp_offsets"
+    (modes 2 and 3), or None if the Python engine has to be used.
+    Frames stored in shared memory are used without copying them.
+    """
+    valid_types = ["I", "P", "B", "Non-I"]
+    arrays = {}
+    shared = _shared_frames(segments)
+    if shared is not None:
+        columns, start, stop = shared
+        codes = columns.types[start:stop]
+        if "I" in columns.categories:
+            arrays["is_iframe"] = codes == columns.categories.index("I")
+        else:
+            arrays["is_iframe"] = np.zeros(stop - start, dtype=bool)
+        if mode == 1:
+            sizes = columns.sizes[start:stop]
+            arrays["sizes"] = sizes if sizes.dtype == np.int64 else np.trunc(sizes).astype(np.int64)
+        else:
+            invalid = [code for code, frame_type in enumerate(columns.categories) if frame_type not in valid_types]
+            if invalid:
+                wrong = np.flatnonzero(np.isin(codes, invalid))
+                if len(wrong):
+                    frame_type = columns.categories[codes[wrong[0]]]
+                    raise P1203StandaloneError("frame type " + str(frame_type) + " not valid; must be I/P/B or I/Non-I")
+            qp_offsets = columns.qp_values.offsets[start:stop + 1]
+            if not columns.qp_present[start:stop].all() or not np.diff(qp_offsets).all():
+                return None
+            if columns.qp_values.values.dtype != np.int64:
+                return None
+            arrays["qp_values"] = columns.qp_values.values
+            arrays["qp_offsets"] = qp_offsets
+        return arrays
+
+    frames = [frame for segment in segments for frame in segment["frames"]]
+    types = [frame["frameType"] for frame in frames]
+    arrays["is_iframe"] = np.array([frame_type == "I" for frame_type in types], dtype=bool)
+    if mode == 1:
+        arrays["sizes"] = np.array([int(frame["frameSize"]) for frame in frames], dtype=np.int64)
+    else:
+        for frame in frames:
+            if frame["frameType"] not in valid_types:
+                raise P1203StandaloneError("frame type " + str(frame["frameType"]) + " not valid; must be I/P/B or I/Non-I")
+            if not frame["qpValues"]:
+                return None
+        qp_lists = [frame["qpValues"] for frame in frames]
+        if not all(type(qp) is int for qp_list, iframe in zip(qp_lists, arrays["is_iframe"]) if not iframe for qp in qp_list):
+            return None
+        qp_counts = np.array([len(qp_list) for qp_list in qp_lists], dtype=np.int64)
+        arrays["qp_offsets"] = np.zeros(len(frames) + 1, dtype=np.int64)
+        np.cumsum(qp_counts, out=arrays["qp_offsets"][1:])
+        arrays["qp_values"] = np.array([qp for qp_list in qp_lists for qp in qp_list], dtype=np.int64)
+    return arrays
+
+
+def calculate_o22(segments, mode, display_res, metrics=None):
+    """
+    Calculate the O22 scores of the segments in the given mode, with the same
+    results as P1203Pv.calculate()
+
+    Arguments:
+        segments {list} -- list of segments according to specification
+        mode {int} -- mode to run, as selected by P1203Pv.validate()
+        display_res {str} -- display resolution as "wxh"
+        metrics {Metrics} -- optional metrics object for the frame and sample counters (default: {None})
+
+    Returns:
+        list -- O22 scores, or None if the session has to be run by the Python engine
+    """
+    from .frames import SegmentInfo
+    from .p1203Pv import P1203Pv
+
+    if mode == 0:
+        counts = [int(segment["duration"] * segment["fps"]) for segment in segments]
+    else:
+        counts = [len(segment["frames"]) for segment in segments]
+        for segment, num_frames in zip(segments, counts):
+            num_frames_assumed = int(segment["duration"] * segment["fps"])
+            if num_frames != num_frames_assumed:
+                logger.warning("Segment specifies " + str(num_frames) + " frames but based on calculations, there should be " + str(num_frames_assumed))
+    num_frames = sum(counts)
+    if num_frames == 0:
+        return None
+
+    frame_durations = [1.0 / segment["fps"] for segment in segments]
+    segment_index = np.repeat(np.arange(len(segments)), counts)
+    durations = np.repeat(np.array(frame_durations, dtype=np.float64), counts)
+    # same summation order as the DTS in P1203Pv.calculate()
+    dts = np.zeros(num_frames)
+    np.cumsum(durations[:-1], out=dts[1:])
+
+    # runs of frames with the same chunk hash
+    hashes = [
+        SegmentInfo(index, segment, duration).chunk_hashes["video"]
+        for index, (segment, duration, count) in enumerate(zip(segments, frame_durations, counts)) if count
+    ]
+    new_run = [True] + [hashes[i] != hashes[i - 1] for i in range(1, len(hashes))]
+    run_ids = np.repeat(np.cumsum(new_run) - 1, [count for count in counts if count])
+    run_bounds = np.flatnonzero(np.diff(np.concatenate([[-1], run_ids, [-1]])))
+    run_starts = run_bounds[:-1][run_ids]
+    run_ends = run_bounds[1:][run_ids]
+
+    total_duration = dts[-1] + durations[-1]
+    limits = round_limits(max(int(math.floor(total_duration)), HALF_WINDOW_SIZE + 1) + LIMIT_OFFSET + 1)
+    timestamps, window_starts, window_ends = window_kernel(dts, durations, limits)
+    chunk_starts, chunk_ends, ok = chunk_kernel(dts, run_starts, run_ends, timestamps, window_starts, window_ends)
+    if not ok:
+        return None
+    first_segments = segment_index[chunk_starts]
+    chunk_lengths = chunk_ends - chunk_starts
+    display_res_number = utils.resolution_to_number(display_res)
+    coding_res_numbers = [utils.resolution_to_number(segment["resolution"]) for segment in segments]
+
+    o22 = []
+    if mode == 0:
+        bitrates = [segment["bitrate"] for segment in segments]
+        bitrate_changes = _changes(np.array(bitrates, dtype=np.float64)[segment_index])
+        uniform = bitrate_changes[chunk_ends - 1] == bitrate_changes[chunk_starts]
+        means = {}
+        for k in range(len(timestamps)):
+            segment = first_segments[k]
+            if uniform[k]:
+                key = (chunk_lengths[k], bitrates[segment])
+                bitrate = means.get(key)
+                if bitrate is None:
+                    bitrate = np.mean(np.full(chunk_lengths[k], bitrates[segment]))
+                    means[key] = bitrate
+            else:
+                bitrate = np.mean([bitrates[s] for s in segment_index[chunk_starts[k]:chunk_ends[k]]])
+            score = P1203Pv.cached_video_model_function_mode0(
+                coding_res_numbers[segment], display_res_number, bitrate, segments[segment]["fps"]
+            )
+            o22.append(score)
+            o22.append(score)
+
+    else:
+        frame_arrays = _frame_arrays(segments, mode)
+        if frame_arrays is None:
+            return None
+        is_iframe = frame_arrays["is_iframe"]
+
+        if mode == 1:
+            sizes = frame_arrays["sizes"]
+            # utils.calculate_compensated_size()
+            compensated = np.where(
+                dts.astype(np.int64) == 0, sizes - 800, np.where(is_iframe, sizes - 55, sizes - 11)
+            )
+            compensated = np.maximum(compensated, 0)
+            size_sums = _range_sums(compensated, chunk_starts, chunk_ends)
+            i_size_sums = _range_sums(np.where(is_iframe, compensated, 0), chunk_starts, chunk_ends)
+            i_counts = _range_sums(is_iframe.astype(np.int64), chunk_starts, chunk_ends)
+            noni_counts = chunk_lengths - i_counts
+            noni_size_sums = size_sums - i_size_sums
+
+            duration_changes = _changes(durations)
+            uniform = duration_changes[chunk_ends - 1] == duration_changes[chunk_starts]
+            sums = {}
+            for k in range(len(timestamps)):
+                segment = first_segments[k]
+                if uniform[k]:
+                    key = (chunk_lengths[k], frame_durations[segment])
+                    duration = sums.get(key)
+                    if duration is None:
+                        duration = np.sum(np.full(chunk_lengths[k], frame_durations[segment]))
+                        sums[key] = duration
+                else:
+                    duration = np.sum([frame_durations[s] for s in segment_index[chunk_starts[k]:chunk_ends[k]]])
+                bitrate = int(size_sums[k]) * 8 / duration / 1000
+                # Chunk.iframe_ratio()
+                if i_counts[k] and noni_counts[k]:
+                    iframe_ratio = (float(int(i_size_sums[k])) / int(i_counts[k])) / (float(int(noni_size_sums[k])) / int(noni_counts[k]))
+                else:
+                    iframe_ratio = 0
+                score = P1203Pv.video_model_function_mode1(
+                    coding_res_numbers[segment], display_res_number, bitrate, segments[segment]["fps"], [],
+                    iframe_ratio=iframe_ratio
+                )
+                o22.append(score)
+                o22.append(score)
+
+        elif mode in [2, 3]:
+            qp_values = frame_arrays["qp_values"]
+            qp_offsets = frame_arrays["qp_offsets"]
+            avg_qp = avg_qp_kernel(chunk_starts, chunk_ends, is_iframe, qp_values, qp_offsets, mode)
+            quant = avg_qp / 51.0
+            if (quant == 0).any():
+                return None
+            model_function = P1203Pv.video_model_function_mode2 if mode == 2 else P1203Pv.video_model_function_mode3
+            for k in range(len(timestamps)):
+                segment = first_segments[k]
+                o22.append(model_function(
+                    coding_res_numbers[segment], display_res_number, segments[segment]["fps"], [],
+                    quant=float(quant[k])
+                ))
+
+        else:
+            raise P1203StandaloneError("Unsupported mode: {}".format(mode))
+
+    if metrics is not None:
+        metrics.increment("Pv.frames", num_frames)
+        metrics.increment("Pv.window_callbacks", len(timestamps))
+    return o22
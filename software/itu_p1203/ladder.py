@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Precomputed scores for the representations of a known bitrate ladder.
+
+In mode 0, the O22 score of an output second only depends on the
+representation played at that time (resolution, bitrate, frame rate) and the
+display size, and O21 only on the audio codec and bitrate. A LadderTable
+computes these scores once per representation, so that scoring sessions that
+only reference representation IDs becomes array indexing.
+"""
+
+import math
+
+import numpy as np
+
+from . import utils
+from .errors import P1203StandaloneError
+from .p1203Pa import P1203Pa
+from .p1203Pv import P1203Pv
+
+# audio samples per second generated by P1203Pa
+AUDIO_SAMPLE_RATE = 100
+
+
+def output_sample_segments(durations, frame_rates):
+    """
+    Return the index of the segment that is scored at each output second
+    1, 2, ..., as done by the measurement window: the frame scored at second t
+    is the last frame with a DTS before t.
+
+    Arguments:
+        durations {np.array} -- segment durations in seconds
+        frame_rates {np.array} -- frames per second of each segment
+
+    Returns:
+        np.array -- segment index per output second
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    frame_rates = np.asarray(frame_rates, dtype=np.float64)
+    num_frames = (durations * frame_rates).astype(np.int64)
+    frame_durations = np.repeat(1.0 / frame_rates, num_frames)
+    if not len(frame_durations):
+        return np.zeros(0, dtype=np.int64)
+
+    # np.cumsum adds up sequentially, like the DTS of the generated frames
+    frame_ends = np.cumsum(frame_durations)
+    dts = np.concatenate([[0.0], frame_ends[:-1]])
+    output_timestamps = np.arange(1, math.floor(frame_ends[-1]) + 1)
+    frame_index = np.searchsorted(dts, output_timestamps, side="left") - 1
+    return np.searchsorted(np.cumsum(num_frames), frame_index, side="right")
+
+
+class LadderTable:
+    """
+    Mode 0 video scores and audio scores of the representations of a bitrate ladder.
+
+    Video scores are the same as those of P1203Pv in mode 0 up to floating point
+    rounding: P1203Pv averages the bitrate over the frames of a chunk, which can
+    differ from the representation bitrate in the last bits. The device type
+    only matters for P1203Pq, so it is not part of the table.
+    """
+
+    def __init__(self, video=None, audio=None, display_sizes=["1920x1080"]):
+        """
+        Arguments:
+            video {dict} -- representation ID -> dict with keys "resolution" ("wxh"),
+                            "bitrate" (kBit/s), "fps" and "codec"
+            audio {dict} -- representation ID -> dict with keys "bitrate" (kBit/s) and "codec"
+            display_sizes {list} -- display resolutions ("wxh") to compute video scores for
+        """
+        video = video or {}
+        audio = audio or {}
+
+        self.display_sizes = list(display_sizes)
+        self.video_ids = list(video.keys())
+        self.video_codes = {rep_id: code for code, rep_id in enumerate(self.video_ids)}
+        self.video_fps = np.array([video[rep_id]["fps"] for rep_id in self.video_ids], dtype=np.float64)
+        self.video_table = np.zeros((len(self.display_sizes), len(self.video_ids)))
+        for code, rep_id in enumerate(self.video_ids):
+            representation = video[rep_id]
+            if representation["codec"] != "h264":
+                raise P1203StandaloneError("Unsupported codec: {}".format(representation["codec"]))
+            coding_res = utils.resolution_to_number(representation["resolution"])
+            for display_index, display_size in enumerate(self.display_sizes):
+                self.video_table[display_index, code] = P1203Pv.video_model_function_mode0(
+                    coding_res,
+                    utils.resolution_to_number(display_size),
+                    representation["bitrate"],
+                    representation["fps"]
+                )
+
+        self.audio_ids = list(audio.keys())
+        self.audio_codes = {rep_id: code for code, rep_id in enumerate(self.audio_ids)}
+        self.audio_table = np.zeros(len(self.audio_ids))
+        for code, rep_id in enumerate(self.audio_ids):
+            representation = audio[rep_id]
+            # same assumption as in P1203Pa
+            codec = "aaclc" if representation["codec"] == "aac" else representation["codec"]
+            self.audio_table[code] = P1203Pa.audio_model_function(codec, representation["bitrate"])
+
+    @staticmethod
+    def _encode(codes, ids, kind):
+        ids = np.asarray(ids, dtype=object)
+        try:
+            encoded = np.array([codes[rep_id] for rep_id in ids.ravel()], dtype=np.int64)
+        except KeyError as e:
+            raise P1203StandaloneError("Unknown {} representation {}".format(kind, e.args[0]))
+        return encoded.reshape(ids.shape)
+
+    def encode_video(self, ids):
+        """
+        Return the table codes (np.array of the same shape) of the given video representation IDs
+        """
+        return LadderTable._encode(self.video_codes, ids, "video")
+
+    def encode_audio(self, ids):
+        """
+        Return the table codes (np.array of the same shape) of the given audio representation IDs
+        """
+        return LadderTable._encode(self.audio_codes, ids, "audio")
+
+    def video_scores(self, codes, display_size="1920x1080"):
+        """
+        Look up the O22 scores of video representation codes, e.g. a (sessions, seconds) array
+        """
+        try:
+            display_index = self.display_sizes.index(display_size)
+        except ValueError:
+            raise P1203StandaloneError("Display size {} is not in the ladder table".format(display_size))
+        return self.video_table[display_index][codes]
+
+    def audio_scores(self, codes):
+        """
+        Look up the O21 scores of audio representation codes, e.g. a (sessions, seconds) array
+        """
+        return self.audio_table[codes]
+
+    def session_O22(self, segments, display_size="1920x1080"):
+        """
+        Calculate the mode 0 O22 scores of a session, in the same layout as
+        P1203Pv.calculate() (two entries per output second)
+
+        Arguments:
+            segments {list} -- video segments with at least "representation" and "duration"
+            display_size {str} -- display resolution
+
+        Returns:
+            np.array -- O22 scores
+        """
+        codes = self.encode_video([segment["representation"] for segment in segments])
+        durations = [segment["duration"] for segment in segments]
+        sample_codes = codes[output_sample_segments(durations, self.video_fps[codes])]
+        return np.repeat(self.video_scores(sample_codes, display_size), 2)
+
+    def session_O21(self, segments):
+        """
+        Calculate the O21 scores of a session, as P1203Pa.calculate()
+
+        Arguments:
+            segments {list} -- audio segments with at least "representation" and "duration"
+
+        Returns:
+            np.array -- O21 scores
+        """
+        codes = self.encode_audio([segment["representation"] for segment in segments])
+        durations = [segment["duration"] for segment in segments]
+        sample_codes = codes[output_sample_segments(durations, np.full(len(codes), AUDIO_SAMPLE_RATE))]
+        return self.audio_scores(sample_codes)
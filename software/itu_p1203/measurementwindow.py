@@ -23,6 +23,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import logging
 import math
 from . import log
 
@@ -37,12 +38,12 @@ class MeasurementWindow:
 
     def __init__(self):
         self.max_size = 20
-        self._frames = []  # actual measurement window
-        self._removed_frames = []  # removed old frames
+        self._frames = []  # actual measurement window; frames that leave it are dropped
         self._last_score_output_at = 0
         self._acc_frame_dur = 0  # accumulated frame duration inside the measurement window
         self._acc_pvs_dur = 0  # current accumulated time at end of measurement window, for the entire PVS
         self._frames_added_cnt = 0
+        self._score_callbacks_cnt = 0  # number of scores requested from the model
         self._half_window_size = int(self.max_size / 2)  # half of the window
 
     def set_score_callback(self, callback):
@@ -72,8 +73,10 @@ class MeasurementWindow:
         if self._acc_pvs_dur - self._half_window_size >= self._last_score_output_at + 1:
             next_score_output_at = self._last_score_output_at + 1
             if self._score_callback:
-                logger.debug("Boundaries: " + str(self.get_boundaries()))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Boundaries: " + str(self.get_boundaries()))
                 self._score_callback(next_score_output_at, self._frames)
+                self._score_callbacks_cnt += 1
             self._last_score_output_at = next_score_output_at
             return True
 
@@ -84,20 +87,21 @@ class MeasurementWindow:
         Adds a frame to the measurement window, removing older frames
         if necessary
 
-        frame: dict with keys "duration" and "dts"
+        frame: frames.Frame, or any object with the attributes "duration" and "dts"
         """
-        if not frame["duration"]:
+        duration = frame.duration
+        if not duration:
             raise SystemExit(
                 "Frame added to measurement window had no duration")
 
-        if self._acc_frame_dur + frame["duration"] > self.max_size:
+        if self._acc_frame_dur + duration > self.max_size:
             removed_frame = self._frames.pop(0)
-            self._removed_frames.append(removed_frame)
-            self._acc_frame_dur -= removed_frame["duration"]
+            self._acc_frame_dur -= removed_frame.duration
 
         self._frames.append(frame)
-        self._acc_frame_dur += frame["duration"]
-        self._acc_pvs_dur += frame["duration"]
+        self._acc_frame_dur += duration
+        self._acc_pvs_dur += duration
+        self._frames_added_cnt += 1
 
         # if a score should be calculated, tell the model that it should take
         # the frames and calculate the score.
@@ -120,15 +124,15 @@ class MeasurementWindow:
             # Remove frames from the beginning of the window [160.23, 180.23]
             # until it fulfills condition [t-10, 180.23], i.e. [161, 180.23]
             removed_duration = 0
-            while round(self._frames[0]["dts"], 5) < output_sample_timestamp - self._half_window_size:
-                # print round(self._frames[0]["dts"], 5), output_sample_timestamp - self._half_window_size
+            while round(self._frames[0].dts, 5) < output_sample_timestamp - self._half_window_size:
+                # print round(self._frames[0].dts, 5), output_sample_timestamp - self._half_window_size
                 removed_frame = self._frames.pop(0)
-                removed_duration += removed_frame["duration"]
-                self._removed_frames.append(removed_frame)
-                self._acc_frame_dur -= removed_frame["duration"]
+                removed_duration += removed_frame.duration
+                self._acc_frame_dur -= removed_frame.duration
 
             if self._score_callback:
                 self._score_callback(output_sample_timestamp, self._frames)
+                self._score_callbacks_cnt += 1
 
             # output next score at 172, and so on
             output_sample_timestamp += 1
@@ -146,11 +150,21 @@ class MeasurementWindow:
         """
         return self._acc_frame_dur
 
+    def get_stats(self):
+        """
+        Return the number of frames added and score callbacks fired so far
+        as a dict with keys "frames" and "window_callbacks"
+        """
+        return {
+            "frames": self._frames_added_cnt,
+            "window_callbacks": self._score_callbacks_cnt,
+        }
+
     def get_boundaries(self):
         """
         Return the DTS as [a, b] where a and b are the first and last frames
         """
-        return (self._frames[0]["dts"], self._frames[-1]["dts"])
+        return (self._frames[0].dts, self._frames[-1].dts)
 
     def print_content(self):
         """
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Collects wall times and counters of a model run.
+
+    Pass an instance to P1203Standalone (or to the Pa, Pv, Pq modules) to enable
+    instrumentation; without it, nothing is measured. Recorded values:
+
+    - timings in seconds: "Pa", "Pv", "Pq" for each stage, "Pa.get_chunk",
+      "Pv.get_chunk", "Pv.model_function" for the accumulated time spent in
+      the window callbacks, and "Pq.rfmodel" for the random forest
+    - counters: "<stage>.frames" for frames added to the measurement window,
+      "<stage>.window_callbacks" for scores requested by the window, and
+      "Pq.trees_evaluated"
+    """
+
+    def __init__(self, callback=None):
+        """
+        Arguments:
+            callback {callable} -- optional function called as callback(name, seconds)
+                                   whenever a stage measured with measure() finishes,
+                                   e.g. to export timings to a metrics system
+        """
+        if callback is not None and not callable(callback):
+            raise TypeError("Metrics callback must be callable")
+        self.callback = callback
+        self.timings = OrderedDict()
+        self.counters = OrderedDict()
+
+    @contextmanager
+    def measure(self, name):
+        """
+        Context manager that records the wall time of the enclosed block
+        under the given name and notifies the callback
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add_time(name, elapsed)
+            if self.callback is not None:
+                self.callback(name, elapsed)
+
+    def add_time(self, name, seconds):
+        """
+        Add a duration in seconds to the timing with the given name
+        """
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def increment(self, name, count=1):
+        """
+        Increment the counter with the given name
+        """
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def reset(self):
+        """
+        Clear all recorded values
+        """
+        self.timings.clear()
+        self.counters.clear()
+
+    def as_dict(self):
+        """
+        Return all recorded values as a dict with keys "timings" and "counters"
+        """
+        return {
+            "timings": dict(self.timings),
+            "counters": dict(self.counters),
+        }
+
+
+@contextmanager
+def measure(metrics, name):
+    """
+    Like Metrics.measure(), but does nothing if metrics is None
+    """
+    if metrics is None:
+        yield
+    else:
+        with metrics.measure(name):
+            yield
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Memoization of model functions that are called with the same arguments
+again and again, e.g. for every output second of a quality level, and for
+every session that uses the same bitrate ladder. The caches are bounded
+LRU caches shared by all sessions scored in a process.
+"""
+
+import functools
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 4096
+
+_CACHED_FUNCTIONS = OrderedDict()
+
+
+def memoize(name, maxsize=DEFAULT_MAXSIZE):
+    """
+    Decorator that caches the results of a pure function in an LRU cache of the
+    given size, registered under the given name for cache_stats(). Arguments of
+    different types (e.g. 1500 and 1500.0) are cached separately.
+    """
+    def decorator(function):
+        cached = functools.lru_cache(maxsize=maxsize, typed=True)(function)
+        _CACHED_FUNCTIONS[name] = cached
+        return cached
+    return decorator
+
+
+def cache_stats():
+    """
+    Return dict of cache name -> {"hits", "misses", "size", "maxsize", "hit_rate"}
+    for all memoized functions of this process
+    """
+    stats = OrderedDict()
+    for name, cached in _CACHED_FUNCTIONS.items():
+        info = cached.cache_info()
+        calls = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hit_rate": float(info.hits) / calls if calls else 0.0,
+        }
+    return stats
+
+
+def clear_caches():
+    """
+    Empty all caches and reset their statistics
+    """
+    for cached in _CACHED_FUNCTIONS.values():
+        cached.cache_clear()
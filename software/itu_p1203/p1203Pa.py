@@ -24,11 +24,16 @@ SOFTWARE.
 """
 
 import math
+import time
+from collections.abc import Sequence
 
 from . import log
+from . import modelcache
 from . import utils
 from .errors import P1203StandaloneError
+from .frames import Frame, SegmentInfo
 from .measurementwindow import MeasurementWindow
+from .trace import Trace
 
 logger = log.setup_custom_logger('main')
 
@@ -41,12 +46,13 @@ class P1203Pa(object):
     COEFFS_A3 = {'mp2': 15.48, 'ac3': 15.70, 'aaclc': 14.60, 'heaac': 20.06}
 
     @staticmethod
-    def audio_model_function(codec, bitrate):
+    def audio_model_function(codec, bitrate, trace=None):
         """
         Calculate MOS value based on codec and bitrate.
 
         - codec: used audio codec, must be one of mp2, ac3, aaclc, heaac
         - bitrate: used audio bitrate in kBit/s
+        - trace: collects the intermediate values if given
         """
         if codec not in P1203Pa.VALID_CODECS:
             raise P1203StandaloneError("Unsupported audio codec {}, use any of {}".format(codec, P1203Pa.VALID_CODECS))
@@ -54,8 +60,25 @@ class P1203Pa(object):
         q_cod_a = P1203Pa.COEFFS_A1[codec] * math.exp(P1203Pa.COEFFS_A2[codec] * bitrate) + P1203Pa.COEFFS_A3[codec]
         qa = 100 - q_cod_a
         mos_audio = utils.mos_from_r(qa)
+
+        if utils.diagnostics_enabled(trace):
+            utils.record_diagnostics(trace, {
+                'bitrate': bitrate,
+                'q_cod_a': q_cod_a,
+                'qa': qa,
+                'score': mos_audio
+            })
+
         return mos_audio
 
+    @staticmethod
+    @modelcache.memoize("Pa.audio_model_function")
+    def cached_audio_model_function(codec, bitrate):
+        """
+        audio_model_function() without diagnostics, memoized across sessions
+        """
+        return P1203Pa.audio_model_function(codec, bitrate)
+
     def model_callback(self, output_sample_timestamp, frames):
         """
         Function that receives frames from measurement window, to call the model
@@ -65,35 +88,60 @@ class P1203Pa(object):
             output_sample_timestamp {int} -- timestamp of the output sample (1, 2, ...)
             frames {list} -- list of frames from measurement window
         """
-        output_sample_index = [i for i, f in enumerate(frames) if f["dts"] < output_sample_timestamp][-1]
+        if self.metrics is not None:
+            start = time.perf_counter()
+
+        output_sample_index = utils.get_output_sample_index(frames, output_sample_timestamp)
         chunk = utils.get_chunk(frames, output_sample_index, type="audio")
 
+        if self.metrics is not None:
+            self.metrics.add_time("Pa.get_chunk", time.perf_counter() - start)
+
         # since for audio, only codec and bitrate change per chunk, we don't need individual frame stats,
         # we can can just calculate the score for the whole chunk
         first_frame = chunk[0]
-        score = P1203Pa.audio_model_function(first_frame["codec"], first_frame["bitrate"])
+        if utils.diagnostics_enabled(self.trace):
+            score = P1203Pa.audio_model_function(first_frame.codec, first_frame.bitrate, trace=self.trace)
+        else:
+            score = P1203Pa.cached_audio_model_function(first_frame.codec, first_frame.bitrate)
+        if self.trace is not None:
+            self.trace.update_last({"output_sample_timestamp": output_sample_timestamp})
         self.o21.append(score)
 
-    def calculate(self):
+    def calculate(self, diagnostics=False):
         """
         Calculate audio MOS
 
+        Arguments:
+            diagnostics {bool} -- also return the intermediate values per output sample (default: {False})
+
         Returns:
            dict {
                 "audio": {
                     "streamId": i11["streamId"],
                     "O21": o21,
+                    "diagnostics": {  # only if diagnostics is True
+                        "output_sample_timestamp": np.array, "bitrate": np.array,
+                        "q_cod_a": np.array, "qa": np.array, "score": np.array
+                    }
                 }
             }
         """
-        utils.check_segment_continuity(self.segments)
+        if isinstance(self.segments, Sequence):
+            utils.check_segment_continuity(self.segments)
+            segments = self.segments
+        else:
+            # an iterator, checked while it is read
+            segments = utils.checked_segments(self.segments)
+
+        self.trace = Trace() if diagnostics else None
 
         measurementwindow = MeasurementWindow()
         measurementwindow.set_score_callback(self.model_callback)
 
         dts = 0
         warning_shown = False
-        for segment in self.segments:
+        for segment_index, segment in enumerate(segments):
             # generate 100 audio samples per second, should be enough for precision
             sample_rate = 100
             num_frames = int(segment["duration"] * sample_rate)
@@ -105,34 +153,44 @@ class P1203Pa(object):
                     warning_shown = True
                 segment["codec"] = "aaclc"
 
+            segment_info = SegmentInfo(segment_index, segment, frame_duration)
             for i in range(int(num_frames)):
-                frame = {
-                    "duration": frame_duration,
-                    "dts": dts,
-                    "bitrate": segment["bitrate"],
-                    "codec": segment["codec"]
-                }
-                if "representation" in segment.keys():
-                    frame.update({"representation": segment["representation"]})
+                frame = Frame(segment_info, dts)
                 # feed frame to MeasurementWindow
                 measurementwindow.add_frame(frame)
                 dts += frame_duration
         measurementwindow.stream_finished()
 
-        return {
+        if self.metrics is not None:
+            for name, count in measurementwindow.get_stats().items():
+                self.metrics.increment("Pa." + name, count)
+
+        result = {
             "audio": {
                 "streamId": self.stream_id,
                 "O21": self.o21,
             }
         }
+        if diagnostics:
+            result["audio"]["diagnostics"] = self.trace.to_arrays()
+        return result
 
-    def __init__(self, segments, stream_id=None):
+    def __init__(self, segments, stream_id=None, metrics=None, sink=None):
         """
         Initialize Pa model with input JSON data
+
+        Arguments:
+            segments {list} -- list of segments according to specification, or an iterator over them
+                               to score a long session in constant memory (see streaming)
+            stream_id {str} -- stream ID (default: {None})
+            metrics {Metrics} -- optional metrics object to record timings and counters (default: {None})
+            sink {object} -- receives the O21 scores instead of a list, e.g. a streaming.FileSink (default: {None})
         """
         self.segments = segments
         self.stream_id = stream_id
-        self.o21 = []
+        self.metrics = metrics
+        self.trace = None
+        self.o21 = sink if sink is not None else []
 
 
 if __name__ == '__main__':
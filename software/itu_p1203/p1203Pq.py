@@ -22,9 +22,8 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from itertools import groupby
+import time
 
-from scipy import signal
 import numpy as np
 
 from . import log
@@ -38,7 +37,7 @@ logger = log.setup_custom_logger('main')
 
 class P1203Pq(object):
 
-    def __init__(self, O21, O22, l_buff=[], p_buff=[], device="pc"):
+    def __init__(self, O21, O22, l_buff=[], p_buff=[], device="pc", metrics=None):
         """Initialize P.1203 model
 
         Initialize the model with variables extracted from input JSON file
@@ -49,12 +48,92 @@ class P1203Pq(object):
             l_buff {list} -- durations of buffering events [default: []]]
             p_buff {list} -- locations of buffering events in media time (in seconds) [default: []]]
             device {str} -- pc or mobile
+            metrics {Metrics} -- optional metrics object to record timings and counters [default: None]
         """
         self.O21 = np.array(O21)
         self.O22 = np.array(O22)
         self.l_buff = l_buff
         self.p_buff = p_buff
         self.device = device
+        self.metrics = metrics
+
+    @staticmethod
+    def quality_direction_changes(O22, lengths=None, ma_order=5, step=3, thresh=0.2):
+        """
+        Detect changes of the quality direction according to Clause 8.1.2.4 and 8.1.2.5:
+        O22 is smoothed with a moving average (padded with the first and last
+        score), and every step-th smoothed score is compared with the one before
+        to classify the quality as going up (1), staying the same (0) or going down (-1).
+
+        Arguments:
+            O22 {np.array} -- O22 scores, or a 2-D array with one session per row
+            lengths {np.array} -- number of scores per row of a 2-D array whose rows
+                                  are padded to the same length (default: {None}, all scores)
+
+        Returns:
+            tuple -- (q_dir_changes_longest, q_dir_changes_tot): the longest period
+                     without a change of direction in seconds, and the number of
+                     direction changes; arrays with one value per row for 2-D input
+        """
+        O22 = np.asarray(O22, dtype=np.float64)
+        batch = O22.ndim == 2
+        if not batch:
+            O22 = O22[np.newaxis, :]
+        num_sessions, length = O22.shape
+        if lengths is not None:
+            # continue each row with its last score, as the padding of the moving average does
+            lengths = np.asarray(lengths, dtype=np.int64)
+            last_scores = O22[np.arange(num_sessions), lengths - 1]
+            O22 = np.where(np.arange(length) < lengths[:, np.newaxis], O22, last_scores[:, np.newaxis])
+        else:
+            lengths = np.full(num_sessions, length, dtype=np.int64)
+
+        # moving average; the kernel taps are added up in order, like np.convolve does
+        padded = np.concatenate([
+            np.repeat(O22[:, :1], ma_order - 1, axis=1),
+            O22,
+            np.repeat(O22[:, -1:], ma_order - 1, axis=1)
+        ], axis=1)
+        ma_length = padded.shape[1] - ma_order + 1
+        ma_weight = 1.0 / ma_order
+        ma_filtered = padded[:, 0:ma_length] * ma_weight
+        for k in range(1, ma_order):
+            ma_filtered = ma_filtered + padded[:, k:k + ma_length] * ma_weight
+
+        # direction of each step; a difference of exactly +/-thresh counts as down
+        next_scores = ma_filtered[:, step::step]
+        diff = next_scores - ma_filtered[:, 0::step][:, :next_scores.shape[1]]
+        QC = np.where(diff > thresh, 1, np.where((diff > -thresh) & (diff < thresh), 0, -1))
+        # number of steps of each row, without the padding
+        row_num_qc = np.maximum((lengths + ma_order - 1 - 1) // step, 0)
+        QC[np.arange(QC.shape[1]) >= row_num_qc[:, np.newaxis]] = 0
+
+        # a direction change is a non-zero direction that differs from the last
+        # non-zero one of the same session
+        num_qc = QC.shape[1]
+        nonzero = np.flatnonzero(QC)
+        rows = nonzero // num_qc if num_qc else nonzero
+        directions = QC.ravel()[nonzero]
+        changes = np.ones(len(nonzero), dtype=bool)
+        changes[1:] = (directions[1:] != directions[:-1]) | (rows[1:] != rows[:-1])
+        change_rows = rows[changes]
+        change_pos = nonzero[changes] - change_rows * num_qc
+        q_dir_changes_tot = np.bincount(change_rows, minlength=num_sessions)
+
+        # longest distance between changes, counting from the start and to the end
+        first_of_row = np.ones(len(change_rows), dtype=bool)
+        first_of_row[1:] = change_rows[1:] != change_rows[:-1]
+        previous_pos = np.where(first_of_row, 0, np.concatenate([[0], change_pos[:-1]]))
+        longest_period = row_num_qc.copy()
+        last_of_row = np.ones(len(change_rows), dtype=bool)
+        last_of_row[:-1] = first_of_row[1:]
+        longest_period[change_rows[last_of_row]] -= change_pos[last_of_row]
+        np.maximum.at(longest_period, change_rows, change_pos - previous_pos)
+        longest_period *= step
+
+        if batch:
+            return longest_period, q_dir_changes_tot
+        return int(longest_period[0]), int(q_dir_changes_tot[0])
 
     def calculate(self):
         """
@@ -123,42 +202,7 @@ class P1203Pq(object):
 
         # ---------------------------------------------------------------------
         # Clause 8.1.2.4 and 8.1.2.5
-        QC = []
-
-        ma_order = 5
-        ma_kernel = np.ones(ma_order) / ma_order
-        padding_beg = np.asarray([self.O22[0]] * (ma_order - 1))
-        padding_end = np.asarray([self.O22[-1]] * (ma_order - 1))
-        padded_O22 = np.append(np.append(padding_beg, self.O22), padding_end)
-        ma_filtered = signal.convolve(padded_O22, ma_kernel, mode='valid').tolist()
-
-        step = 3
-        for current_score, next_score in zip(ma_filtered[0::step], ma_filtered[step::step]):
-            thresh = 0.2
-            if (next_score - current_score) > thresh:
-                QC.append(1)
-            elif -thresh < (next_score - current_score) < thresh:
-                QC.append(0)
-            else:
-                QC.append(-1)
-
-        lens = []
-        for index, val in enumerate(QC):
-            if val != 0:
-                if lens and lens[-1][1] != val:
-                    lens.append([index, val])
-                if not lens:
-                    lens.append([index, val])
-        if lens:
-            lens.insert(0, [0, 0])
-            lens.append([len(QC), 0])
-            distances = [b[0] - a[0] for a, b in zip(lens, lens[1:])]
-            longest_period = max(distances) * step
-        else:
-            longest_period = len(QC) * step
-        q_dir_changes_longest = longest_period
-
-        q_dir_changes_tot = sum(1 for k, g in groupby([s for s in QC if s != 0]))
+        q_dir_changes_longest, q_dir_changes_tot = P1203Pq.quality_direction_changes(self.O22)
 
         # ---------------------------------------------------------------------
         # Eq. 19-21
@@ -243,7 +287,11 @@ class P1203Pq(object):
 
         # ---------------------------------------------------------------------
         # Eq. 28
-        rf_score = rfmodel.calculate(self.O21, self.O22, self.l_buff, self.p_buff, duration)
+        if self.metrics is not None:
+            start = time.perf_counter()
+        rf_score = rfmodel.calculate(self.O21, self.O22, self.l_buff, self.p_buff, duration, metrics=self.metrics)
+        if self.metrics is not None:
+            self.metrics.add_time("Pq.rfmodel", time.perf_counter() - start)
         O46 = 0.75 * np.maximum(np.minimum(mos, 5), 1) + 0.25 * rf_score
 
         return {
@@ -24,13 +24,21 @@ SOFTWARE.
 """
 
 import math
+import time
+from collections.abc import Sequence
+
 import numpy as np
-import json
 
+from . import jitengine
 from . import log
+from . import modelcache
 from . import utils
+from .chunkstats import ChunkStats
 from .errors import P1203StandaloneError
+from .frames import Frame, SegmentInfo
 from .measurementwindow import MeasurementWindow
+from .sharedreport import SegmentFrames
+from .trace import Trace
 
 logger = log.setup_custom_logger('main')
 
@@ -76,7 +84,7 @@ class P1203Pv(object):
         return utils.mos_from_r(qv)
 
     @staticmethod
-    def video_model_function_mode0(coding_res, display_res, bitrate_kbps_segment_size, framerate):
+    def video_model_function_mode0(coding_res, display_res, bitrate_kbps_segment_size, framerate, trace=None):
         """
         Mode 0 model
 
@@ -85,6 +93,7 @@ class P1203Pv(object):
             display_res {int} -- number of display resolution pixels
             bitrate_kbps_segment_size {float} -- bitrate in kBit/s
             framerate {float} -- frame rate
+            trace {Trace} -- collects the intermediate values if given [default: None]
 
         Returns:
             float -- O22 score
@@ -111,22 +120,32 @@ class P1203Pv(object):
         # degradation integration
         score = P1203Pv.degradation_integration(mos_cod_v, deg_cod_v, deg_scal_v, deg_frame_rate_v)
 
-        logger.debug(json.dumps({
-            'coding_res': round(coding_res, 2),
-            'display_res': round(display_res, 2),
-            'bitrate_kbps_segment_size': round(bitrate_kbps_segment_size, 2),
-            'framerate': round(framerate, 2),
-            'mos_cod_v': round(mos_cod_v, 2),
-            'deg_cod_v': round(deg_cod_v, 2),
-            'deg_scal_v': round(deg_scal_v, 2),
-            'deg_frame_rate_v': round(deg_frame_rate_v, 2),
-            'score': round(score, 2)
-        }, indent=True))
+        if utils.diagnostics_enabled(trace):
+            utils.record_diagnostics(trace, {
+                'coding_res': coding_res,
+                'display_res': display_res,
+                'bitrate_kbps_segment_size': bitrate_kbps_segment_size,
+                'framerate': framerate,
+                'quant': quant,
+                'mos_cod_v': mos_cod_v,
+                'deg_cod_v': deg_cod_v,
+                'deg_scal_v': deg_scal_v,
+                'deg_frame_rate_v': deg_frame_rate_v,
+                'score': score
+            })
 
         return score
 
     @staticmethod
-    def video_model_function_mode1(coding_res, display_res, bitrate_kbps_segment_size, framerate, frames, iframe_ratio=None):
+    @modelcache.memoize("Pv.video_model_function_mode0")
+    def cached_video_model_function_mode0(coding_res, display_res, bitrate_kbps_segment_size, framerate):
+        """
+        video_model_function_mode0() without diagnostics, memoized across sessions
+        """
+        return P1203Pv.video_model_function_mode0(coding_res, display_res, bitrate_kbps_segment_size, framerate)
+
+    @staticmethod
+    def video_model_function_mode1(coding_res, display_res, bitrate_kbps_segment_size, framerate, frames, iframe_ratio=None, trace=None):
         """
         Mode 1 model
 
@@ -137,6 +156,7 @@ class P1203Pv(object):
             framerate {float} -- frame rate
             frames {list} -- frames
             iframe_ratio {float} -- iframe ratio, only for debugging
+            trace {Trace} -- collects the intermediate values if given [default: None]
 
         Returns:
             float -- O22 score
@@ -188,24 +208,26 @@ class P1203Pv(object):
         # degradation integration
         score = P1203Pv.degradation_integration(mos_cod_v, deg_cod_v, deg_scal_v, deg_frame_rate_v)
 
-        logger.debug(json.dumps({
-            'coding_res': round(coding_res, 2),
-            'display_res': round(display_res, 2),
-            'bitrate_kbps_segment_size': round(bitrate_kbps_segment_size, 2),
-            'framerate': round(framerate, 2),
-            'mos_cod_v': round(mos_cod_v, 2),
-            'deg_cod_v': round(deg_cod_v, 2),
-            'iframe_ratio': round(iframe_ratio, 2),
-            'complexity': round(complexity, 2),
-            'deg_scal_v': round(deg_scal_v, 2),
-            'deg_frame_rate_v': round(deg_frame_rate_v, 2),
-            'score': round(score, 2)
-        }, indent=True))
+        if utils.diagnostics_enabled(trace):
+            utils.record_diagnostics(trace, {
+                'coding_res': coding_res,
+                'display_res': display_res,
+                'bitrate_kbps_segment_size': bitrate_kbps_segment_size,
+                'framerate': framerate,
+                'quant': quant,
+                'mos_cod_v': mos_cod_v,
+                'deg_cod_v': deg_cod_v,
+                'iframe_ratio': iframe_ratio,
+                'complexity': complexity,
+                'deg_scal_v': deg_scal_v,
+                'deg_frame_rate_v': deg_frame_rate_v,
+                'score': score
+            })
 
         return score
 
     @staticmethod
-    def video_model_function_mode2(coding_res, display_res, framerate, frames, quant=None, avg_qp_per_noni_frame=[]):
+    def video_model_function_mode2(coding_res, display_res, framerate, frames, quant=None, avg_qp_per_noni_frame=[], trace=None):
         """
         Mode 2 model
 
@@ -216,6 +238,7 @@ class P1203Pv(object):
             frames {list} -- frames
             quant {float} -- quant parameter, only used for debugging [default: None]
             avg_qp_per_noni_frame {list} -- average QP per non-I frame, only used for debugging [default: []]
+            trace {Trace} -- collects the intermediate values if given [default: None]
         Returns:
             float -- O22 score
         """
@@ -252,22 +275,23 @@ class P1203Pv(object):
         # degradation integration
         score = P1203Pv.degradation_integration(mos_cod_v, deg_cod_v, deg_scal_v, deg_frame_rate_v)
 
-        logger.debug(json.dumps({
-            'coding_res': round(coding_res, 2),
-            'display_res': round(display_res, 2),
-            'framerate': round(framerate, 2),
-            'quant': round(quant, 2),
-            'mos_cod_v': round(mos_cod_v, 2),
-            'deg_cod_v': round(deg_cod_v, 2),
-            'deg_scal_v': round(deg_scal_v, 2),
-            'deg_frame_rate_v': round(deg_frame_rate_v, 2),
-            'score': round(score, 2)
-        }, indent=True))
+        if utils.diagnostics_enabled(trace):
+            utils.record_diagnostics(trace, {
+                'coding_res': coding_res,
+                'display_res': display_res,
+                'framerate': framerate,
+                'quant': quant,
+                'mos_cod_v': mos_cod_v,
+                'deg_cod_v': deg_cod_v,
+                'deg_scal_v': deg_scal_v,
+                'deg_frame_rate_v': deg_frame_rate_v,
+                'score': score
+            })
 
         return score
 
     @staticmethod
-    def video_model_function_mode3(coding_res, display_res, framerate, frames, quant=None, avg_qp_per_noni_frame=[]):
+    def video_model_function_mode3(coding_res, display_res, framerate, frames, quant=None, avg_qp_per_noni_frame=[], trace=None):
         """
         Mode 3 model
 
@@ -278,6 +302,7 @@ class P1203Pv(object):
             frames {list} -- frames
             quant {float} -- quant parameter, only used for debugging [default: None]
             avg_qp_per_noni_frame {list} -- average QP per non-I frame, only used for debugging [default: []]
+            trace {Trace} -- collects the intermediate values if given [default: None]
         Returns:
             float -- O22 score
         """
@@ -323,17 +348,18 @@ class P1203Pv(object):
         # degradation integration
         score = P1203Pv.degradation_integration(mos_cod_v, deg_cod_v, deg_scal_v, deg_frame_rate_v)
 
-        logger.debug(json.dumps({
-            'coding_res': round(coding_res, 2),
-            'display_res': round(display_res, 2),
-            'framerate': round(framerate, 2),
-            'quant': round(quant, 2),
-            'mos_cod_v': round(mos_cod_v, 2),
-            'deg_cod_v': round(deg_cod_v, 2),
-            'deg_scal_v': round(deg_scal_v, 2),
-            'deg_frame_rate_v': round(deg_frame_rate_v, 2),
-            'score': round(score, 2)
-        }, indent=True))
+        if utils.diagnostics_enabled(trace):
+            utils.record_diagnostics(trace, {
+                'coding_res': coding_res,
+                'display_res': display_res,
+                'framerate': framerate,
+                'quant': quant,
+                'mos_cod_v': mos_cod_v,
+                'deg_cod_v': deg_cod_v,
+                'deg_scal_v': deg_scal_v,
+                'deg_frame_rate_v': deg_frame_rate_v,
+                'score': score
+            })
 
         return score
 
@@ -346,62 +372,113 @@ class P1203Pv(object):
             output_sample_timestamp {int} -- timestamp of the output sample (1, 2, ...)
             frames {list} -- list of all frames from measurement window
         """
-        logger.debug("Output score at timestamp " + str(output_sample_timestamp))
-        output_sample_index = [i for i, f in enumerate(frames) if f["dts"] < output_sample_timestamp][-1]
+        logger.debug("Output score at timestamp %s", output_sample_timestamp)
+        if self.metrics is not None:
+            start = time.perf_counter()
+
+        output_sample_index = utils.get_output_sample_index(frames, output_sample_timestamp)
+
+        # only get the relevant frames from the chunk; in all modes, the running
+        # sums of the chunk are used instead of its frames
+        # (get_chunk wraps around for index 0, which is not handled by the sums;
+        # QP averages are only taken from the sums if they are exact)
+        chunk = None
+        use_chunk_stats = self.mode in [0, 1] or self.chunk_stats.integer_qps
+        self.chunk_stats.sync_window(len(frames))
+        if use_chunk_stats and output_sample_index > 0:
+            chunk, first_index = self.chunk_stats.chunk_at(output_sample_index)
+            first_frame = frames[first_index]
+        else:
+            frames = utils.get_chunk(frames, output_sample_index, type="video")
+            first_frame = frames[0]
 
-        # only get the relevant frames from the chunk
-        frames = utils.get_chunk(frames, output_sample_index, type="video")
+        if self.metrics is not None:
+            chunk_done = time.perf_counter()
+            self.metrics.add_time("Pv.get_chunk", chunk_done - start)
 
-        first_frame = frames[0]
         if self.mode == 0:
             # average the bitrate for all of the segments
-            bitrate = np.mean([f["bitrate"] for f in frames])
-            score = P1203Pv.video_model_function_mode0(
-                utils.resolution_to_number(first_frame["resolution"]),
-                utils.resolution_to_number(self.display_res),
-                bitrate,
-                first_frame["fps"]
-            )
+            if chunk is not None:
+                bitrate = self.chunk_stats.chunk_mean_bitrate(chunk, frames)
+            else:
+                bitrate = np.mean([f.bitrate for f in frames])
+            if utils.diagnostics_enabled(self.trace):
+                score = P1203Pv.video_model_function_mode0(
+                    utils.resolution_to_number(first_frame.resolution),
+                    utils.resolution_to_number(self.display_res),
+                    bitrate,
+                    first_frame.fps,
+                    trace=self.trace
+                )
+            else:
+                score = P1203Pv.cached_video_model_function_mode0(
+                    utils.resolution_to_number(first_frame.resolution),
+                    utils.resolution_to_number(self.display_res),
+                    bitrate,
+                    first_frame.fps
+                )
             self.o22.append(score)
 
         elif self.mode == 1:
             # average the bitrate based on the frame sizes, as implemented
             # in submitted model code
-            compensated_sizes = [
-                utils.calculate_compensated_size(f["type"], f["size"], f["dts"]) for f in frames
-            ]
-            duration = np.sum([f["duration"] for f in frames])
-            bitrate = np.sum(compensated_sizes) * 8 / duration / 1000
+            if chunk is not None:
+                duration = self.chunk_stats.chunk_duration(chunk, frames)
+                bitrate = chunk.size_sum * 8 / duration / 1000
+                iframe_ratio = chunk.iframe_ratio()
+                # with a given ratio, the frames are not needed anymore
+                chunk_frames = []
+            else:
+                compensated_sizes = [
+                    utils.calculate_compensated_size(f.type, f.size, f.dts) for f in frames
+                ]
+                duration = np.sum([f.duration for f in frames])
+                bitrate = np.sum(compensated_sizes) * 8 / duration / 1000
+                iframe_ratio = None
+                chunk_frames = frames
             score = P1203Pv.video_model_function_mode1(
-                utils.resolution_to_number(first_frame["resolution"]),
+                utils.resolution_to_number(first_frame.resolution),
                 utils.resolution_to_number(self.display_res),
                 bitrate,
-                first_frame["fps"],
-                frames
+                first_frame.fps,
+                chunk_frames,
+                iframe_ratio=iframe_ratio,
+                trace=self.trace
             )
             self.o22.append(score)
 
-        elif self.mode == 2:
-            score = P1203Pv.video_model_function_mode2(
-                utils.resolution_to_number(first_frame["resolution"]),
-                utils.resolution_to_number(self.display_res),
-                first_frame["fps"],
-                frames
-            )
-
-        elif self.mode == 3:
-            score = P1203Pv.video_model_function_mode3(
-                utils.resolution_to_number(first_frame["resolution"]),
+        elif self.mode in [2, 3]:
+            if chunk is not None:
+                quant = chunk.avg_qp(self.mode) / 51.0
+                # the model functions recompute a quant of 0 from the frames
+                chunk_frames = [] if quant else frames[first_index:first_index + chunk.num_frames]
+            else:
+                quant = None
+                chunk_frames = frames
+            model_function = P1203Pv.video_model_function_mode2 if self.mode == 2 else P1203Pv.video_model_function_mode3
+            score = model_function(
+                utils.resolution_to_number(first_frame.resolution),
                 utils.resolution_to_number(self.display_res),
-                first_frame["fps"],
-                frames
+                first_frame.fps,
+                chunk_frames,
+                quant=quant or None,
+                trace=self.trace
             )
 
         else:
             raise P1203StandaloneError("Unsupported mode: {}".format(self.mode))
 
+        if self.metrics is not None:
+            self.metrics.add_time("Pv.model_function", time.perf_counter() - chunk_done)
+
         self.o22.append(score)
 
+        if self.trace is not None:
+            # keep one record per O22 sample
+            self.trace.update_last({"output_sample_timestamp": output_sample_timestamp})
+            while len(self.trace) < len(self.o22):
+                self.trace.repeat_last()
+
     def check_codec(self):
         """ check if the segments are using valid codecs,
             in P1203 only h264 is allowed
@@ -411,64 +488,147 @@ class P1203Pv(object):
             if c != "h264":
                 raise P1203StandaloneError("Unsupported codec: {}".format(c))
 
-    def calculate(self):
+    @staticmethod
+    def detect_mode(segments):
+        """
+        Detect the highest mode that can be run for the given segments, checking
+        the frame definitions in the same pass
+
+        Arguments:
+            segments {list} -- list of segments according to specification
+
+        Returns:
+            int -- 0 if a segment has no frame information, 3 if all frames have
+                   QP values, otherwise 1
+        """
+        mode = None
+        for segment in segments:
+            if "frames" not in segment:
+                return 0
+            if isinstance(segment["frames"], SegmentFrames):
+                # frames from shared memory always have a type and size
+                if not segment["frames"].all_have_qp_values():
+                    mode = 1
+                elif mode is None and len(segment["frames"]):
+                    mode = 3
+                continue
+            for frame in segment["frames"]:
+                if "frameType" not in frame or "frameSize" not in frame:
+                    raise P1203StandaloneError("Frame definition must have at least 'frameType' and 'frameSize'")
+                if "qpValues" not in frame:
+                    mode = 1
+                elif mode is None:
+                    mode = 3
+        return mode if mode is not None else 0
+
+    def validate(self):
+        """
+        Check the segments and select the mode to run, once per instance.
+        The requested mode is used if given, the highest available mode otherwise.
+
+        Returns:
+            int -- the selected mode
+        """
+        if self.streaming:
+            # segments are checked while they are read, see _streamed_segments()
+            if self.requested_mode is None:
+                raise P1203StandaloneError("The mode must be given when the segments are read from an iterator")
+            self.available_mode = self.requested_mode
+        elif self.available_mode is None:
+            utils.check_segment_continuity(self.segments)
+            self.available_mode = P1203Pv.detect_mode(self.segments)
+            # check for differing or wrong codecs
+            self.check_codec()
+
+        if self.requested_mode is None:
+            self.mode = self.available_mode
+        elif self.requested_mode not in [0, 1, 2, 3]:
+            raise P1203StandaloneError("Unsupported mode: {}".format(self.requested_mode))
+        elif self.requested_mode > self.available_mode:
+            raise P1203StandaloneError(
+                "Mode {} was requested, but the input only allows running up to mode {}".format(
+                    self.requested_mode, self.available_mode
+                )
+            )
+        else:
+            self.mode = self.requested_mode
+        return self.mode
+
+    def _streamed_segments(self):
+        """
+        Yield the segments of an iterator, with the checks that validate() runs
+        for a list of segments
+        """
+        for segment in utils.checked_segments(self.segments):
+            if segment["codec"] != "h264":
+                raise P1203StandaloneError("Unsupported codec: {}".format(segment["codec"]))
+            if self.mode > 0:
+                if "frames" not in segment:
+                    raise P1203StandaloneError("Mode {} was requested, but a segment has no frames".format(self.mode))
+                for frame in segment["frames"]:
+                    if "frameType" not in frame or "frameSize" not in frame:
+                        raise P1203StandaloneError("Frame definition must have at least 'frameType' and 'frameSize'")
+                    if self.mode > 1 and "qpValues" not in frame:
+                        raise P1203StandaloneError("Mode {} was requested, but a frame has no QP values".format(self.mode))
+            yield segment
+
+    def calculate(self, diagnostics=False):
         """
         Calculate video MOS
 
+        Arguments:
+            diagnostics {bool} -- also return the intermediate values per output sample (default: {False})
+
         Returns:
             dict {
                 "video": {
                     "streamId": i13["streamId"],
                     "mode": mode,
                     "O22": o22,
+                    "diagnostics": {  # only if diagnostics is True, one entry per O22 sample
+                        "output_sample_timestamp": np.array, "quant": np.array,
+                        "mos_cod_v": np.array, "deg_cod_v": np.array, "deg_scal_v": np.array,
+                        "deg_frame_rate_v": np.array, "score": np.array, ...
+                        # mode 1 additionally: "iframe_ratio", "complexity"
+                    }
                 }
             }
         """
 
-        utils.check_segment_continuity(self.segments)
+        self.validate()
+
+        # the array engine does not collect diagnostics, and needs all segments at once
+        if self.engine == "jit" and not diagnostics and not self.streaming:
+            o22 = jitengine.calculate_o22(self.segments, self.mode, self.display_res, metrics=self.metrics)
+            if o22 is not None:
+                if isinstance(self.o22, list):
+                    self.o22 = o22
+                else:
+                    for score in o22:
+                        self.o22.append(score)
+                return self._result(diagnostics)
+            logger.debug("Session not supported by the jit engine, using the Python engine")
+
+        self.trace = Trace() if diagnostics else None
+        self.chunk_stats = ChunkStats()
 
         measurementwindow = MeasurementWindow()
         measurementwindow.set_score_callback(self.model_callback)
 
-        # check which mode can be run
-        # TODO: make this switchable by command line option
-        self.mode = 0
-        for segment in self.segments:
-            if "frames" not in segment.keys():
-                self.mode = 0
-                break
-            if "frames" in segment:
-                for frame in segment["frames"]:
-                    if "frameType" not in frame.keys() or "frameSize" not in frame.keys():
-                        raise P1203StandaloneError("Frame definition must have at least 'frameType' and 'frameSize'")
-                    if "qpValues" in frame.keys():
-                        self.mode = 3
-                    else:
-                        self.mode = 1
-                        break
-
         logger.debug("Evaluating stream in mode " + str(self.mode))
 
-        # check for differing or wrong codecs
-        self.check_codec()
+        segments = self._streamed_segments() if self.streaming else self.segments
 
         # generate fake frames
         if self.mode == 0:
             dts = 0
-            for segment in self.segments:
+            for segment_index, segment in enumerate(segments):
                 num_frames = int(segment["duration"] * segment["fps"])
                 frame_duration = 1.0 / segment["fps"]
+                segment_info = SegmentInfo(segment_index, segment, frame_duration)
                 for i in range(int(num_frames)):
-                    frame = {
-                        "duration": frame_duration,
-                        "dts": dts,
-                        "bitrate": segment["bitrate"],
-                        "codec": segment["codec"],
-                        "fps": segment["fps"],
-                        "resolution": segment["resolution"]
-                    }
-                    if "representation" in segment.keys():
-                        frame.update({"representation": segment["representation"]})
+                    frame = Frame(segment_info, dts)
+                    self.chunk_stats.add_frame(frame)
                     # feed frame to MeasurementWindow
                     measurementwindow.add_frame(frame)
                     dts += frame_duration
@@ -476,58 +636,77 @@ class P1203Pv(object):
 
         # use frame info to infer frames and their DTS, add frame stats
         else:
+            use_qp_values = self.mode in [2, 3]
             dts = 0
-            for segment_index, segment in enumerate(self.segments):
+            for segment_index, segment in enumerate(segments):
                 num_frames_assumed = int(segment["duration"] * segment["fps"])
                 num_frames = len(segment["frames"])
                 if num_frames != num_frames_assumed:
                     logger.warning("Segment specifies " + str(num_frames) + " frames but based on calculations, there should be " + str(num_frames_assumed))
                 frame_duration = 1.0 / segment["fps"]
-                for i in range(int(num_frames)):
-                    frame = {
-                        "duration": frame_duration,
-                        "dts": dts,
-                        "bitrate": segment["bitrate"],
-                        "codec": segment["codec"],
-                        "fps": segment["fps"],
-                        "resolution": segment["resolution"],
-                        "size": segment["frames"][i]["frameSize"],
-                        "type": segment["frames"][i]["frameType"],
-                    }
-                    if "representation" in segment.keys():
-                        frame.update({"representation": segment["representation"]})
-                    if self.mode == 3:
-                        qp_values = segment["frames"][i]["qpValues"]
+                segment_info = SegmentInfo(segment_index, segment, frame_duration)
+                qp_values = None
+                for i, input_frame in enumerate(segment["frames"]):
+                    if use_qp_values:
+                        qp_values = input_frame["qpValues"]
                         if not qp_values:
                             raise P1203StandaloneError("No QP values for frame {i} of segment {segment_index}".format(**locals()))
-                        frame["qpValues"] = qp_values
+                    frame = Frame(segment_info, dts, input_frame["frameSize"], input_frame["frameType"], qp_values)
+                    self.chunk_stats.add_frame(frame)
                     # feed frame to MeasurementWindow
                     measurementwindow.add_frame(frame)
                     dts += frame_duration
             measurementwindow.stream_finished()
 
-        return {
+        if self.metrics is not None:
+            for name, count in measurementwindow.get_stats().items():
+                self.metrics.increment("Pv." + name, count)
+
+        return self._result(diagnostics)
+
+    def _result(self, diagnostics):
+        """
+        Return the result dict of calculate()
+        """
+        result = {
             "video": {
                 "streamId": self.stream_id,
                 "mode": self.mode,
                 "O22": self.o22,
             }
         }
+        if diagnostics:
+            result["video"]["diagnostics"] = self.trace.to_arrays()
+        return result
 
-    def __init__(self, segments, display_res="1920x1080", stream_id=None):
+    def __init__(self, segments, display_res="1920x1080", stream_id=None, metrics=None, mode=None, engine="auto", sink=None):
         """
         Initialize Pv model with input JSON data
 
         Arguments:
-            segments {list} -- list of segments according to specification
+            segments {list} -- list of segments according to specification, or an iterator over them
+                               to score a long session in constant memory (requires mode, see streaming)
             display_res {str} -- display resolution as "wxh" (default: "1920x1080")
             stream_id {str} -- stream ID (default: {None})
+            metrics {Metrics} -- optional metrics object to record timings and counters (default: {None})
+            mode {int} -- mode to run, must not be higher than the mode the segments allow;
+                          e.g. 0 to only use segment information of a mode 3 input (default: {None}, highest available)
+            engine {str} -- "python" to feed the frames through the measurement window, "jit" to use the
+                            compiled array engine, "auto" to use it if Numba is installed (default: {"auto"})
+            sink {object} -- receives the O22 scores instead of a list, e.g. a streaming.FileSink (default: {None})
         """
         self.segments = segments
+        self.streaming = not isinstance(segments, Sequence)
         self.display_res = display_res
         self.stream_id = stream_id
-        self.o22 = []
+        self.metrics = metrics
+        self.trace = None
+        self.chunk_stats = None
+        self.o22 = sink if sink is not None else []
+        self.requested_mode = mode
+        self.available_mode = None
         self.mode = None
+        self.engine = jitengine.select_engine(engine)
 
 
 if __name__ == '__main__':
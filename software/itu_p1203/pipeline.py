@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Two-stage pipeline for inputs that have to be extracted before they can be
+scored, e.g. video files that are run through ffprobe/ffmpeg. Extraction runs
+in threads (the work happens in subprocesses), scoring in a process pool. A
+bounded queue between the stages holds the extracted reports; when scoring
+falls behind, the queue fills up and extraction waits.
+"""
+
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from . import log
+
+logger = log.setup_custom_logger('main')
+
+
+def _put(ready, entry, stop):
+    """
+    Put an entry into the queue, blocking while it is full unless the pipeline is stopped
+
+    Returns:
+        bool -- False if the pipeline was stopped before the entry could be put
+    """
+    while not stop.is_set():
+        try:
+            ready.put(entry, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def run_pipeline(items, extract, score, extract_workers=1, score_workers=1, queue_size=None, score_executor=None, release=None, before_score=None, after_score=None):
+    """
+    Extract and score all items, with the two stages running concurrently.
+
+    At most score_workers items are scored at the same time and at most
+    queue_size extracted items wait for scoring, so that only a bounded number
+    of reports is held in memory.
+
+    Arguments:
+        items {list} -- inputs, e.g. file names
+        extract {function} -- extract(item) -> payload, run in a thread
+        score {function} -- score(item, payload) -> result, run in score_executor;
+                            must be picklable for a process pool
+        extract_workers {int} -- number of extraction threads
+        score_workers {int} -- number of items scored at the same time
+        queue_size {int} -- number of extracted items that may wait for scoring (default: {None}, 2 * score_workers)
+        score_executor {concurrent.futures.Executor} -- executor for scoring
+                                                        (default: {None}, process pool with score_workers processes)
+        release {function} -- release(payload) is called once a payload is not needed anymore,
+                              i.e. after it was scored or when the pipeline stops (default: {None})
+        before_score {function} -- before_score(item) -> item passed to score, called just before
+                                   the item is handed to score_executor (default: {None})
+        after_score {function} -- after_score(item, result) -> result, called as soon as an item
+                                  was scored (default: {None})
+
+    Returns:
+        list -- results in the order of the items
+
+    Raises:
+        the first exception raised by extract or score
+    """
+    items = list(items)
+    if extract_workers < 1 or score_workers < 1:
+        raise ValueError("Need at least one worker per stage")
+    if queue_size is None:
+        queue_size = 2 * score_workers
+
+    pending = queue.Queue()
+    for index in range(len(items)):
+        pending.put(index)
+    ready = queue.Queue(maxsize=max(queue_size, 1))
+    stop = threading.Event()
+
+    def extraction_worker():
+        while not stop.is_set():
+            try:
+                index = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                entry = (index, extract(items[index]), None)
+            except Exception as e:
+                entry = (index, None, e)
+            if not _put(ready, entry, stop) and entry[2] is None and release is not None:
+                release(entry[1])
+
+    threads = [
+        threading.Thread(target=extraction_worker, name="extract-{}".format(i), daemon=True)
+        for i in range(min(extract_workers, len(items)))
+    ]
+    for thread in threads:
+        thread.start()
+
+    results = [None] * len(items)
+    in_flight = {}
+
+    def collect(return_when):
+        done, _ = wait(list(in_flight), return_when=return_when)
+        for future in done:
+            index, payload = in_flight.pop(future)
+            if release is not None:
+                release(payload)
+            results[index] = future.result()
+            if after_score is not None:
+                results[index] = after_score(items[index], results[index])
+
+    executor = score_executor if score_executor is not None else ProcessPoolExecutor(score_workers)
+    try:
+        for _ in range(len(items)):
+            index, payload, error = ready.get()
+            if error is not None:
+                raise error
+            # backpressure: do not take more items from the queue than can be scored
+            while len(in_flight) >= score_workers:
+                collect(FIRST_COMPLETED)
+            logger.debug("Scoring {} ({} waiting)".format(items[index], ready.qsize()))
+            item = before_score(items[index]) if before_score is not None else items[index]
+            in_flight[executor.submit(score, item, payload)] = (index, payload)
+        while in_flight:
+            collect(FIRST_COMPLETED)
+    finally:
+        stop.set()
+        if score_executor is None:
+            executor.shutdown(wait=True)
+        if release is not None:
+            # payloads may only be released once nothing uses them anymore
+            wait(list(in_flight))
+            for thread in threads:
+                thread.join()
+            for _, payload in in_flight.values():
+                release(payload)
+            while not ready.empty():
+                _, payload, error = ready.get()
+                if error is None:
+                    release(payload)
+
+    return results
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Audiovisual integration (P1203Pq) for many sessions at once.
+
+The O21/O22 series of the sessions may have different lengths. They are
+padded to a common length and processed with array operations over all
+sessions, and the random forest is evaluated once on the stacked features.
+The results are the same as those of P1203Pq.calculate() per session.
+"""
+
+import time
+
+import numpy as np
+
+from . import rfmodel
+from . import utils
+from .errors import P1203StandaloneError
+from .featurestore import RaggedColumn
+from .p1203Pq import P1203Pq
+
+
+def as_padded(series, lengths=None):
+    """
+    Return series of different lengths as padded 2-D float64 array and lengths
+
+    Arguments:
+        series -- list of sequences, a RaggedColumn, or a padded 2-D array
+        lengths {np.array} -- number of values per row if series is a padded array
+
+    Returns:
+        tuple -- (np.array of shape (sessions, max length), np.array of lengths)
+    """
+    if isinstance(series, RaggedColumn):
+        lengths = series.lengths()
+        padded = np.zeros((len(series), lengths.max() if len(series) else 0))
+        padded[np.arange(padded.shape[1]) < lengths[:, np.newaxis]] = series.values
+        return padded, lengths
+    if lengths is not None:
+        padded = np.asarray(series, dtype=np.float64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if padded.ndim != 2 or len(lengths) != len(padded) or (lengths > padded.shape[1]).any():
+            raise P1203StandaloneError("Padded series must be a 2-D array with one length per row")
+        return padded, lengths
+    lengths = np.array([len(values) for values in series], dtype=np.int64)
+    padded = np.zeros((len(series), lengths.max() if len(series) else 0))
+    for row, values in enumerate(series):
+        padded[row, :lengths[row]] = values
+    return padded, lengths
+
+
+def _stalling_stats(l_buff, p_buff, duration):
+    """
+    Number of stalls, weighted total stalling length and average stalling
+    interval according to Clause 8.1.1.1, as in P1203Pq.calculate()
+    """
+    c_ref7 = 0.48412879
+    c_ref8 = 10
+
+    total_stall_len = sum(
+        [l * utils.exponential(1, c_ref7, 0, c_ref8, duration - p)
+         for p, l in zip(p_buff, l_buff)]
+    )
+
+    avg_stall_interval = 0
+    num_stalls = len(l_buff)
+    if num_stalls > 1:
+        avg_stall_interval = sum([b - a for a, b in zip(p_buff, p_buff[1:])]) / (len(l_buff) - 1)
+    return num_stalls, total_stall_len, avg_stall_interval
+
+
+def calculate_batch(O21, O22, l_buff, p_buff, O21_lengths=None, O22_lengths=None, metrics=None):
+    """
+    Calculate O23, O34, O35 and O46 for many sessions
+
+    Arguments:
+        O21 -- O21 scores per session: list of lists, RaggedColumn, or padded 2-D array
+               with O21_lengths; sessions without scores are assumed to have constant
+               high quality audio
+        O22 -- O22 scores per session, same formats as O21
+        l_buff {list} -- list of the durations of the buffering events of each session
+        p_buff {list} -- list of the locations of the buffering events of each session
+        O21_lengths {np.array} -- number of O21 scores per session if O21 is padded
+        O22_lengths {np.array} -- number of O22 scores per session if O22 is padded
+        metrics {Metrics} -- optional metrics object to record timings and counters
+
+    Returns:
+        dict {
+            "O23": np.array,
+            "O34": RaggedColumn (one row of duration values per session),
+            "O35": np.array,
+            "O46": np.array
+        }
+    """
+    O21, O21_len = as_padded(O21, O21_lengths)
+    O22, O22_len = as_padded(O22, O22_lengths)
+    num_sessions = len(O22)
+    if len(O21) != num_sessions or len(l_buff) != num_sessions or len(p_buff) != num_sessions:
+        raise P1203StandaloneError("O21, O22, l_buff and p_buff must have one entry per session")
+    if (O22_len == 0).any():
+        raise P1203StandaloneError("O22 has no scores; Pq model is not valid without video.")
+
+    # ---------------------------------------------------------------------
+    # Clause 3.2.2
+    has_audio = O21_len > 0
+    width = max(O21.shape[1], O22.shape[1])
+    columns = np.arange(width)
+    O21 = np.pad(O21, ((0, 0), (0, width - O21.shape[1])))
+    O22 = np.pad(O22, ((0, 0), (0, width - O22.shape[1])))
+    O21[~has_audio] = np.where(columns < O22_len[~has_audio, np.newaxis], 5.0, 0.0)
+    O21_len = np.where(has_audio, O21_len, O22_len)
+    duration = np.minimum(O21_len, O22_len)
+    in_duration = columns < duration[:, np.newaxis]
+    in_O22 = columns < O22_len[:, np.newaxis]
+
+    # ---------------------------------------------------------------------
+    # Clause 8.1.1.1
+    stalling = [_stalling_stats(l, p, d) for l, p, d in zip(l_buff, p_buff, duration.tolist())]
+    num_stalls = np.array([stats[0] for stats in stalling], dtype=np.int64)
+    total_stall_len = np.array([stats[1] for stats in stalling], dtype=np.float64)
+    avg_stall_interval = np.array([stats[2] for stats in stalling], dtype=np.float64)
+
+    # ---------------------------------------------------------------------
+    # Clause 8.1.2.2
+    vid_qual_spread = np.where(in_O22, O22, -np.inf).max(axis=1) - np.where(in_O22, O22, np.inf).min(axis=1)
+
+    # ---------------------------------------------------------------------
+    # Clause 8.1.2.3
+    diff = O22[:, 1:] - O22[:, :-1]
+    changed = ((diff > 0.2) | (diff < -0.2)) & in_duration[:, 1:]
+    vid_qual_change_rate = changed.sum(axis=1).astype(np.float64) / duration
+
+    # ---------------------------------------------------------------------
+    # Clause 8.1.2.4 and 8.1.2.5
+    q_dir_changes_longest, q_dir_changes_tot = P1203Pq.quality_direction_changes(O22, lengths=O22_len)
+
+    # ---------------------------------------------------------------------
+    # Eq. 19-21
+    av1 = -0.00069084
+    av2 = 0.15374283
+    av3 = 0.97153861
+    av4 = 0.02461776
+    t1 = 0.00666620027943848
+    t2 = 0.0000404018840273729
+    t3 = 0.156497800436237
+    t4 = 0.143179744942738
+    t5 = 0.0238641564518876
+    O34 = np.maximum(np.minimum(av1 + av2 * O21 + av3 * O22 + av4 * O21 * O22, 5), 1)
+    t = np.minimum(columns, duration[:, np.newaxis])  # the padding is not used
+    w1 = t1 + t2 * np.exp((t / duration[:, np.newaxis].astype(np.float64)) / t3)
+    w2 = t4 - t5 * O34
+    # running sums add up in order, like the loop over t
+    O35_numerator = np.cumsum(np.where(in_duration, w1 * w2 * O34, 0.0), axis=1)[:, -1]
+    O35_denominator = np.cumsum(np.where(in_duration, w1 * w2, 0.0), axis=1)[:, -1]
+    O35_baseline = O35_numerator / O35_denominator
+
+    # ---------------------------------------------------------------------
+    # Clause 8.1.2.1
+    c1 = 1.87403625
+    c2 = 7.85416481
+    c23 = 0.01853820
+    # (clipped at the end of each session, so that the padding does not overflow)
+    w_diff = utils.exponential(11, c1, 0, c2, np.maximum(duration[:, np.newaxis] - columns - 1, 0))
+    O34_diff = (O34 - O35_baseline[:, np.newaxis]) * w_diff
+    # Eq. 6
+    neg_perc = rfmodel._percentile_by_length(O34_diff, duration, 10)
+    # Eq. 7
+    negative_bias = np.maximum(0, -neg_perc) * c23
+
+    # ---------------------------------------------------------------------
+    # Eq. 29
+    s1 = 9.35158684
+    s2 = 0.91890815
+    s3 = 11.0567558
+    stalling_impact = np.exp(- num_stalls / s1) * \
+        np.exp(- total_stall_len / duration / s2) * \
+        np.exp(- avg_stall_interval / duration / s3)
+    # Eq. 31
+    O23 = 1 + 4 * stalling_impact
+
+    # ---------------------------------------------------------------------
+    # Clause 8.3
+
+    # Eq. 24
+    comp1 = 0.67756080
+    comp2 = -8.05533303
+    osc_test = ((q_dir_changes_longest / duration) < 0.25) & (q_dir_changes_longest < 30)
+    # Eq. 27
+    q_diff = np.maximum(0.0, 1 + np.log10(vid_qual_spread + 0.001))
+    # Eq. 23
+    osc_comp = np.where(osc_test, np.maximum(0.0, np.minimum(q_diff * np.exp(comp1 * q_dir_changes_tot + comp2), 1.5)), 0)
+
+    # Eq. 26
+    comp3 = 0.17332553
+    comp4 = -0.01035647
+    adapt_test = (q_dir_changes_longest / duration) < 0.25
+    adapt_comp = np.where(adapt_test, np.maximum(0.0, np.minimum(comp3 * vid_qual_spread * vid_qual_change_rate + comp4, 0.5)), 0)
+
+    # Eq. 18
+    O35 = O35_baseline - negative_bias - osc_comp - adapt_comp
+
+    # ---------------------------------------------------------------------
+    # Eq. 28
+    mos = 1.0 + (O35 - 1.0) * stalling_impact
+
+    # ---------------------------------------------------------------------
+    # Eq. 28
+    if metrics is not None:
+        start = time.perf_counter()
+    rf_features = rfmodel.feature_matrix(O21, O22, l_buff, p_buff, duration, O21_len, O22_len)
+    rf_score = rfmodel.execute_trees(rf_features, path=rfmodel.tree_path(), metrics=metrics)
+    if metrics is not None:
+        metrics.add_time("Pq.rfmodel", time.perf_counter() - start)
+    O46 = 0.75 * np.maximum(np.minimum(mos, 5), 1) + 0.25 * rf_score
+
+    O34_offsets = np.zeros(num_sessions + 1, dtype=np.int64)
+    np.cumsum(duration, out=O34_offsets[1:])
+    return {
+        "O23": O23,
+        "O34": RaggedColumn(O34[in_duration], O34_offsets),
+        "O35": O35,
+        "O46": O46,
+    }
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Persistent cache of whole-session outputs.
+
+Entries are keyed by a hash of the canonical form of the input report (keys
+sorted, no whitespace), the software version and the options that change the
+output (mode, modules, output fields). Each entry is one JSON file in a
+directory, written to a temporary file first and then renamed, so that
+several processes can share a cache directory: readers see either a
+complete entry or none. The least recently used entries are removed when
+the cache grows beyond its size or entry limit.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections.abc import Sequence
+
+from . import __version__
+from . import log
+
+logger = log.setup_custom_logger('main')
+
+FORMAT_VERSION = 1
+
+# temporary files of writers that did not finish are removed after this many seconds
+STALE_SECONDS = 3600
+
+
+def _json_default(value):
+    """
+    Convert numpy values and frame sequences (see sharedreport) for json.dumps()
+    """
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, Sequence):
+        return list(value)
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+
+def canonical_report(report):
+    """
+    Return the canonical JSON form of an input report: keys sorted, no whitespace.
+    Reports that only differ in key order, formatting or comments have the same form.
+    """
+    return json.dumps(report, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=_json_default)
+
+
+class ResultCache:
+    """
+    Directory of cached session outputs, see the module docstring
+    """
+
+    # size limits are checked on the first write and then every CHECK_INTERVAL writes
+    CHECK_INTERVAL = 32
+
+    def __init__(self, path, max_bytes=None, max_entries=None):
+        """
+        Arguments:
+            path {str} -- cache directory, created if it does not exist
+            max_bytes {int} -- maximum summed size of the entries (default: {None}, unlimited)
+            max_entries {int} -- maximum number of entries (default: {None}, unlimited)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._writes_since_check = None
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(report, **options):
+        """
+        Return the cache key of an input report.
+
+        Arguments:
+            report {dict} -- input report
+            options -- everything else that changes the output, e.g. mode=1, only_pv=False,
+                       modules={"Pv": "itu_p1203.p1203Pv.P1203Pv", ...}; must be JSON serializable
+        """
+        header = json.dumps({
+            "format": FORMAT_VERSION,
+            "version": __version__,
+            "options": options,
+        }, sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha256(header.encode("utf-8"))
+        digest.update(b"\n")
+        digest.update(canonical_report(report).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + ".json")
+
+    def get(self, key):
+        """
+        Return the cached output for the key, or None
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if not isinstance(entry, dict) or entry.get("key") != key:
+            self.misses += 1
+            return None
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry["output"]
+
+    def put(self, key, output):
+        """
+        Store the output for the key, replacing an existing entry
+
+        Returns:
+            bool -- False if the output could not be serialized
+        """
+        try:
+            data = json.dumps({"key": key, "output": output}, default=_json_default)
+        except (TypeError, ValueError) as e:
+            logger.debug("Output not cached: {}".format(e))
+            return False
+
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.writes += 1
+
+        if self._writes_since_check is None or self._writes_since_check + 1 >= self.CHECK_INTERVAL:
+            self.evict()
+        else:
+            self._writes_since_check += 1
+        return True
+
+    def _entries(self):
+        """
+        Return (last use, size, path) of all entries, removing stale temporary files
+        """
+        entries = []
+        now = time.time()
+        for directory in os.scandir(self.path):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith(".json"):
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                elif entry.name.endswith(".tmp") and now - stat.st_mtime > STALE_SECONDS:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is within its limits
+        """
+        self._writes_since_check = 0
+        if self.max_bytes is None and self.max_entries is None:
+            return
+        entries = sorted(self._entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        num_entries = len(entries)
+        for _, size, path in entries:
+            if (self.max_bytes is None or total_bytes <= self.max_bytes) and \
+               (self.max_entries is None or num_entries <= self.max_entries):
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                # already removed by another process
+                pass
+            total_bytes -= size
+            num_entries -= 1
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        """
+        Return the hits, misses, writes and evictions of this process as dict
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
@@ -27,14 +27,61 @@ import numpy as np
 import os
 
 
-def execute_trees(features, path):
-    res_all = []
-    for fn in os.listdir(path):
-        if fn.endswith(".csv") and fn.startswith("tree"):
-            tree_matrix = np.genfromtxt(os.path.join(path, fn), delimiter=',', dtype=float)
-            res = execute_tree(features, tree_matrix)
-            res_all.append(res)
-    res_mean = np.mean(res_all, axis=0)
+# tree arrays per tree directory, loaded once per process
+_TREES = {}
+
+
+def load_trees(path):
+    """
+    Load the trees of the random forest from the tree*.csv files in path, in
+    directory listing order. Each tree is returned as a tuple of arrays
+    (feature_ids, thresholds, left_children, right_children) indexed by node,
+    where leaves have feature ID -1 and their value as threshold.
+    """
+    if path not in _TREES:
+        trees = []
+        for fn in os.listdir(path):
+            if fn.endswith(".csv") and fn.startswith("tree"):
+                tree_matrix = np.genfromtxt(os.path.join(path, fn), delimiter=',', dtype=float)
+                trees.append((
+                    tree_matrix[:, 1].astype(np.int64),
+                    tree_matrix[:, 2].copy(),
+                    tree_matrix[:, 3].astype(np.int64),
+                    tree_matrix[:, 4].astype(np.int64),
+                ))
+        _TREES[path] = trees
+    return _TREES[path]
+
+
+def execute_trees(features, path, metrics=None):
+    """
+    Return the mean prediction of the trees in path for a feature vector, or
+    one prediction per row of a 2-D feature matrix
+    """
+    features = np.asarray(features, dtype=np.float64)
+    single = features.ndim == 1
+    if single:
+        features = features[np.newaxis, :]
+    rows = np.arange(len(features))
+
+    trees = load_trees(path)
+    # one column per tree, so that the mean of each row adds up like np.mean() of a list
+    res_all = np.empty((len(features), len(trees)))
+    for tree_index, (feature_ids, thresholds, left_children, right_children) in enumerate(trees):
+        node = np.zeros(len(features), dtype=np.int64)
+        while True:
+            feature_id = feature_ids[node]
+            inner = feature_id != -1
+            if not inner.any():
+                break
+            go_left = features[rows, feature_id] < thresholds[node]
+            node = np.where(inner, np.where(go_left, left_children[node], right_children[node]), node)
+        res_all[:, tree_index] = thresholds[node]
+    if metrics is not None:
+        metrics.increment("Pq.trees_evaluated", len(trees))
+    res_mean = np.mean(res_all, axis=1)
+    if single:
+        return res_mean[0]
     return res_mean
 
 
@@ -96,7 +143,10 @@ def get_rebuf_stats(l_buff, p_buff, duration):
         return [num_rebuf, len_rebuf, num_rebuf_per_length, len_rebuf_per_length, time_of_last_rebuf]
 
 
-def calculate(O21, O22, l_buff, p_buff, duration):
+def features(O21, O22, l_buff, p_buff, duration):
+    """
+    Return the 14 features of the random forest as float64 array
+    """
     if len(l_buff) and len(p_buff):
         if p_buff[0] == [0]:
             initial_buffering_length = l_buff[0]
@@ -114,15 +164,160 @@ def calculate(O21, O22, l_buff, p_buff, duration):
     sec_moses_feature_audio = scale_moses(O21_rounded, 2)
     sec_mos_stat = np.percentile(O22_rounded, [1, 5, 10]).tolist()
 
-    tree_path = os.path.abspath(
-                    os.path.join(
-                        os.path.dirname(__file__),
-                        "trees"
-                    )
-                )
+    return np.array((rebuf_stats + sec_moses_feature_video + sec_mos_stat + sec_moses_feature_audio + [duration])).astype('float64')
+
+
+def scale_moses_batch(sec_mos, lengths, num_splits):
+    """
+    scale_moses() for many sessions at once
+
+    The running averages are updated for all sessions in each step, with the same
+    operations as in scale_moses(), so that the results are the same to the last bit.
+
+    Arguments:
+        sec_mos {np.array} -- scores per second, one session per row, padded
+        lengths {np.array} -- number of scores per row
+        num_splits {int} -- number of values per session
+
+    Returns:
+        np.array -- (sessions, num_splits) array
+    """
+    num_sessions = len(sec_mos)
+    rows = np.arange(num_sessions)
+    split_duration = 1.0 * lengths / num_splits
+    previous_mos = np.zeros(num_sessions)
+    previous_time = np.zeros(num_sessions)
+    mos_samples = np.zeros((num_sessions, num_splits))
+    num_samples = np.zeros(num_sessions, dtype=np.int64)
+
+    for i in range(sec_mos.shape[1]):
+        active = i < lengths
+        mos = sec_mos[:, i]
+        split = active & (previous_time + 1 >= split_duration)
+        split_rows = rows[split]
+        mos_samples[split_rows, np.minimum(num_samples[split_rows], num_splits - 1)] = \
+            ((previous_time[split] * previous_mos[split]) + (split_duration[split] - previous_time[split]) * mos[split]) / split_duration[split]
+        num_samples += split
+
+        cont = active & ~split
+        previous_mos = np.where(split, mos, np.where(cont, ((previous_mos * previous_time) + mos * 1) / (previous_time + 1), previous_mos))
+        previous_time = np.where(split, previous_time + 1 - split_duration, np.where(cont, previous_time + 1, previous_time))
+
+    # fill up with the last average
+    missing = np.arange(num_splits) >= num_samples[:, np.newaxis]
+    mos_samples[missing] = np.broadcast_to(previous_mos[:, np.newaxis], mos_samples.shape)[missing]
+    return mos_samples
+
+
+def get_rebuf_stats_batch(l_buff, p_buff, duration):
+    """
+    get_rebuf_stats() for many sessions at once
+
+    Arguments:
+        l_buff {list} -- durations of the buffering events of each session
+        p_buff {list} -- locations of the buffering events of each session
+        duration {np.array} -- duration of each session
+
+    Returns:
+        np.array -- (sessions, 5) array
+    """
+    num_sessions = len(p_buff)
+    num_stalls = np.array([len(p) for p in p_buff], dtype=np.int64)
+    width = num_stalls.max() if num_sessions else 0
+    locations = np.zeros((num_sessions, width))
+    lengths = np.zeros((num_sessions, width))
+    for row, (l, p) in enumerate(zip(l_buff, p_buff)):
+        locations[row, :len(p)] = p
+        lengths[row, :len(p)] = l[:len(p)]
+
+    columns = np.arange(width)
+    no_rebuf = (num_stalls == 0) | ((num_stalls == 1) & (locations[:, 0] == 0) if width else True)
+    events = (locations != 0) & (columns < num_stalls[:, np.newaxis])
+    last_event = np.where(events, columns, -1).max(axis=1, initial=-1)
+    if ((last_event < 0) & ~no_rebuf).any():
+        raise IndexError("No buffering event after the start")
+
+    num_rebuf = events.sum(axis=1)
+    # running sums add up in order, like sum() over the events
+    len_rebuf = np.cumsum(np.where(events, lengths, 0.0), axis=1)[:, -1] if width else np.zeros(num_sessions)
+    num_rebuf_per_length = 1.0 * num_rebuf / duration
+    len_rebuf_per_length = 1.0 * len_rebuf / duration
+    time_of_last_rebuf = duration - locations[np.arange(num_sessions), np.maximum(last_event, 0)] if width else duration
+
+    stats = np.column_stack([num_rebuf, len_rebuf, num_rebuf_per_length, len_rebuf_per_length, time_of_last_rebuf])
+    stats[no_rebuf] = np.column_stack([
+        np.zeros((num_sessions, 4)), np.asarray(duration, dtype=np.float64)
+    ])[no_rebuf]
+    return stats
+
+
+def _percentile_by_length(values, lengths, q):
+    """
+    np.percentile() of the first lengths[i] values of each row; rows of the same
+    length are computed together, which gives the same result as one call per row
+    """
+    result = np.zeros((len(values),) + np.shape(q))
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)
+        result[rows] = np.moveaxis(np.percentile(values[rows, :length], q, axis=1), 0, -1)
+    return result
+
+
+def feature_matrix(O21, O22, l_buff, p_buff, duration, O21_lengths=None, O22_lengths=None):
+    """
+    Return the features of the random forest for many sessions as (sessions, 14)
+    float64 matrix, the same as features() per session
+
+    Arguments:
+        O21 {np.array} -- O21 scores, one session per row, padded
+        O22 {np.array} -- O22 scores, one session per row, padded
+        l_buff {list} -- durations of the buffering events of each session
+        p_buff {list} -- locations of the buffering events of each session
+        duration {np.array} -- duration of each session
+        O21_lengths {np.array} -- number of O21 scores per row (default: {None}, all)
+        O22_lengths {np.array} -- number of O22 scores per row (default: {None}, all)
+    """
+    O21 = np.atleast_2d(np.asarray(O21, dtype=np.float64))
+    O22 = np.atleast_2d(np.asarray(O22, dtype=np.float64))
+    num_sessions = len(O22)
+    duration = np.broadcast_to(np.asarray(duration, dtype=np.int64), (num_sessions,))
+    if O21_lengths is None:
+        O21_lengths = np.full(num_sessions, O21.shape[1])
+    if O22_lengths is None:
+        O22_lengths = np.full(num_sessions, O22.shape[1])
+
+    initial_buffering_length = np.array([
+        l[0] if len(l) and len(p) and p[0] == [0] else 0
+        for l, p in zip(l_buff, p_buff)
+    ], dtype=np.float64)
+    rebuf_stats = get_rebuf_stats_batch(l_buff, p_buff, duration)
+    rebuf_stats[:, 1] = 1.0 * initial_buffering_length / 3.0 + rebuf_stats[:, 1]
+    rebuf_stats[:, 3] = 1.0 * initial_buffering_length / duration / 3.0 + rebuf_stats[:, 3]
+
+    O21_rounded = np.around(O21, decimals=3)
+    O22_rounded = np.around(O22, decimals=3)
+    sec_moses_feature_video = scale_moses_batch(O22_rounded, O22_lengths, 3)
+    sec_moses_feature_audio = scale_moses_batch(O21_rounded, O21_lengths, 2)
+    sec_mos_stat = _percentile_by_length(O22_rounded, O22_lengths, [1, 5, 10])
+
+    return np.column_stack([
+        rebuf_stats, sec_moses_feature_video, sec_mos_stat, sec_moses_feature_audio, duration
+    ]).astype('float64')
+
+
+def tree_path():
+    return os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "trees"
+        )
+    )
+
 
+def calculate(O21, O22, l_buff, p_buff, duration, metrics=None):
     rf_score = execute_trees(
-        np.array((rebuf_stats + sec_moses_feature_video + sec_mos_stat + sec_moses_feature_audio + [duration])).astype('float64'),
-        path=tree_path
+        features(O21, O22, l_buff, p_buff, duration),
+        path=tree_path(),
+        metrics=metrics
     )
     return rf_score
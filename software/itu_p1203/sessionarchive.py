@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Packed archive of the per-session model outputs of one mode.
+
+Holds the same data as a folder with O21O22-<pvs_id>.json and
+046-<pvs_id>-<device>.json files (see data/README.md) in a single file:
+
+    magic (8 bytes) | header length (uint64, little endian) | JSON header | arrays
+
+The header contains the session IDs (the index), the string columns, and
+for each array its dtype, shape and byte offset. Arrays are aligned to
+64 bytes, so the whole file can be memory-mapped and sessions are read
+by offset without parsing anything else. Per-second scores are stored as
+ragged columns (see featurestore.RaggedColumn).
+
+Usage:
+    python3 -m itu_p1203.sessionarchive pack data/mode0 data/mode0.p1203a
+    python3 -m itu_p1203.sessionarchive unpack data/mode0.p1203a data/mode0
+"""
+
+import glob
+import json
+import os
+import re
+import struct
+
+import numpy as np
+
+from .errors import P1203StandaloneError
+from .featurestore import RaggedColumn
+
+MAGIC = b"P1203SA1"
+ALIGNMENT = 64
+
+# per-device values of the O46 files, besides the per-second O34 scores
+O46_SCALARS = ["O23", "O35", "O46"]
+
+
+def _align(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_archive(path, ids, columns, strings=None):
+    """
+    Write an archive.
+
+    Arguments:
+        path {str} -- output file
+        ids {list} -- session IDs, one per row
+        columns {dict} -- column name -> numeric np.array with one entry per session,
+                          or RaggedColumn with one row per session
+        strings {dict} -- column name -> list of strings, one per session [default: None]
+    """
+    ids = [str(i) for i in ids]
+    if len(set(ids)) != len(ids):
+        raise P1203StandaloneError("Session IDs of an archive must be unique")
+    strings = strings or {}
+
+    arrays = []
+    header = {"ids": ids, "strings": {}, "arrays": {}, "ragged": []}
+    for name, values in strings.items():
+        if len(values) != len(ids):
+            raise P1203StandaloneError("String column {} has {} rows, expected {}".format(name, len(values), len(ids)))
+        header["strings"][name] = [str(v) for v in values]
+    for name, column in columns.items():
+        if len(column) != len(ids):
+            raise P1203StandaloneError("Column {} has {} rows, expected {}".format(name, len(column), len(ids)))
+        if isinstance(column, RaggedColumn):
+            header["ragged"].append(name)
+            arrays.append((name + "/values", column.values))
+            arrays.append((name + "/offsets", column.offsets))
+        else:
+            arrays.append((name, np.asarray(column)))
+
+    position = 0
+    for name, array in arrays:
+        array = np.ascontiguousarray(array)
+        if array.dtype.kind not in "biuf":
+            raise P1203StandaloneError("Column {} is not numeric".format(name))
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": position}
+        position = _align(position + array.nbytes)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays:
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + position)
+
+
+class SessionArchive:
+    """
+    Read access to an archive written by write_archive() or pack_json_dir()
+    """
+
+    def __init__(self, path, mmap=True):
+        """
+        Arguments:
+            path {str} -- archive file
+            mmap {bool} -- memory-map the file instead of reading it [default: True]
+        """
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise P1203StandaloneError("{} is not a session archive".format(path))
+            header_length = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(header_length).decode("utf-8"))
+        data_start = _align(len(MAGIC) + 8 + header_length)
+
+        if mmap:
+            buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            buffer = np.fromfile(path, dtype=np.uint8)
+
+        self.path = path
+        self.ids = header["ids"]
+        self.index = {pvs_id: row for row, pvs_id in enumerate(self.ids)}
+        self.strings = header["strings"]
+        self._arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            start = data_start + spec["offset"]
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            self._arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+        self._ragged = set(header["ragged"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, pvs_id):
+        return pvs_id in self.index
+
+    def columns(self):
+        names = [name for name in self._arrays if "/" not in name]
+        return names + sorted(self._ragged) + list(self.strings.keys())
+
+    def column(self, name):
+        """
+        Return a column for all sessions: np.array, RaggedColumn or list of strings
+        """
+        if name in self._ragged:
+            return RaggedColumn(self._arrays[name + "/values"], self._arrays[name + "/offsets"])
+        if name in self.strings:
+            return self.strings[name]
+        return self._arrays[name]
+
+    def values(self, pvs_id, name):
+        """
+        Return the value(s) of one column for one session; for ragged columns
+        a view into the archive
+        """
+        try:
+            row = self.index[pvs_id]
+        except KeyError:
+            raise P1203StandaloneError("Session {} is not in {}".format(pvs_id, self.path))
+        if name in self._ragged:
+            offsets = self._arrays[name + "/offsets"]
+            return self._arrays[name + "/values"][offsets[row]:offsets[row + 1]]
+        if name in self.strings:
+            return self.strings[name][row]
+        return self._arrays[name][row]
+
+    def devices(self):
+        """
+        Devices for which O46 outputs are stored
+        """
+        return sorted(name.split(".", 1)[1] for name in self._arrays if name.startswith("O46."))
+
+    def session(self, pvs_id):
+        """
+        Return the session in the layout of the O21O22-<pvs_id>.json files
+        """
+        return {
+            "O21": self.values(pvs_id, "O21").tolist(),
+            "O22": self.values(pvs_id, "O22").tolist(),
+            "I23": self.values(pvs_id, "I23").tolist(),
+            "IGen": {
+                "displaySize": self.values(pvs_id, "IGen.displaySize"),
+                "device": self.values(pvs_id, "IGen.device"),
+            },
+        }
+
+    def O46_output(self, pvs_id, device):
+        """
+        Return the outputs for one device in the layout of the
+        046-<pvs_id>-<device>.json files
+        """
+        output = {
+            "O23": float(self.values(pvs_id, "O23." + device)),
+            "O34": self.values(pvs_id, "O34." + device).tolist(),
+            "O35": float(self.values(pvs_id, "O35." + device)),
+            "O46": float(self.values(pvs_id, "O46." + device)),
+            "O22": self.values(pvs_id, "O22").tolist(),
+            "O21": self.values(pvs_id, "O21").tolist(),
+            "mode": self.values(pvs_id, "mode"),
+        }
+        return output
+
+
+def _ragged(rows, dtype=np.float64):
+    lengths = np.array([len(row) for row in rows], dtype=np.int64)
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    values = np.array([value for row in rows for value in row], dtype=dtype)
+    return RaggedColumn(values, offsets)
+
+
+def pack_json_dir(json_dir, path):
+    """
+    Pack the O21O22-*.json and 046-*-<device>.json files of a folder (e.g. data/mode0)
+    into an archive
+
+    Returns:
+        int -- number of sessions
+    """
+    session_files = sorted(glob.glob(os.path.join(json_dir, "O21O22-*.json")))
+    if not session_files:
+        raise P1203StandaloneError("No O21O22-*.json files in {}".format(json_dir))
+    ids = [re.match(r"O21O22-(.+)\.json$", os.path.basename(f)).group(1) for f in session_files]
+
+    sessions = []
+    for session_file in session_files:
+        with open(session_file) as f:
+            sessions.append(json.load(f))
+
+    stalls = [[event for event in session["I23"]] for session in sessions]
+    stall_values = [value for events in stalls for event in events for value in event]
+    stall_dtype = np.int64 if all(isinstance(v, int) for v in stall_values) else np.float64
+    I23 = _ragged(stalls, dtype=stall_dtype)
+    if I23.values.ndim == 1:
+        I23 = RaggedColumn(I23.values.reshape(-1, 2), I23.offsets)
+
+    columns = {
+        "O21": _ragged([session["O21"] for session in sessions]),
+        "O22": _ragged([session["O22"] for session in sessions]),
+        "I23": I23,
+    }
+    strings = {
+        "IGen.displaySize": [session["IGen"]["displaySize"] for session in sessions],
+        "IGen.device": [session["IGen"]["device"] for session in sessions],
+    }
+
+    devices = set()
+    for output_file in glob.glob(os.path.join(json_dir, "046-*.json")):
+        match = re.match(r"046-(.+)-([^-]+)\.json$", os.path.basename(output_file))
+        if match and match.group(1) in ids:
+            devices.add(match.group(2))
+
+    modes = [""] * len(ids)
+    for device in sorted(devices):
+        outputs = []
+        for row, pvs_id in enumerate(ids):
+            output_file = os.path.join(json_dir, "046-{}-{}.json".format(pvs_id, device))
+            if not os.path.isfile(output_file):
+                raise P1203StandaloneError("Missing {}, all sessions need outputs for the same devices".format(output_file))
+            with open(output_file) as f:
+                outputs.append(json.load(f))
+            modes[row] = outputs[-1]["mode"]
+        for name in O46_SCALARS:
+            columns[name + "." + device] = np.array([output[name] for output in outputs], dtype=np.float64)
+        columns["O34." + device] = _ragged([output["O34"] for output in outputs])
+    if devices:
+        strings["mode"] = modes
+
+    write_archive(path, ids, columns, strings)
+    return len(ids)
+
+
+def unpack_json_dir(path, json_dir):
+    """
+    Write the sessions of an archive as O21O22-*.json and 046-*-<device>.json files
+
+    Returns:
+        int -- number of sessions
+    """
+    archive = SessionArchive(path)
+    os.makedirs(json_dir, exist_ok=True)
+    devices = archive.devices()
+    for pvs_id in archive.ids:
+        with open(os.path.join(json_dir, "O21O22-{}.json".format(pvs_id)), "w") as f:
+            json.dump(archive.session(pvs_id), f)
+        for device in devices:
+            with open(os.path.join(json_dir, "046-{}-{}.json".format(pvs_id, device)), "w") as f:
+                json.dump(archive.O46_output(pvs_id, device), f)
+    return len(archive)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert between folders of per-session JSON outputs and packed session archives",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    pack = subparsers.add_parser("pack", help="pack a folder like data/mode0 into an archive")
+    pack.add_argument("json_dir", type=str, help="folder with O21O22-*.json and 046-*.json files")
+    pack.add_argument("archive", type=str, help="output archive")
+    unpack = subparsers.add_parser("unpack", help="write the JSON files of an archive")
+    unpack.add_argument("archive", type=str, help="input archive")
+    unpack.add_argument("json_dir", type=str, help="output folder")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        count = pack_json_dir(args.json_dir, args.archive)
+    elif args.command == "unpack":
+        count = unpack_json_dir(args.archive, args.json_dir)
+    else:
+        parser.print_help()
+        return 1
+    print("{} sessions".format(count))
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
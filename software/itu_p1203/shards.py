@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Splitting a batch of inputs across several machines, and merging the outputs.
+
+Each input is assigned to one of N shards by a hash of its path, so every
+machine that is given the same input list selects its part of it without
+any coordination. The outputs of the shards (JSON files as printed by the
+CLI) are combined with merge_results(), or from the command line:
+
+    python3 -m itu_p1203.shards merge shard-*.json -o results.json
+"""
+
+import hashlib
+import json
+import os
+
+from .errors import P1203StandaloneError
+
+
+def parse_shard(value):
+    """
+    Parse a shard specification "i/N", with 1 <= i <= N
+
+    Returns:
+        tuple -- shard index (starting at 1) and number of shards
+    """
+    try:
+        index, count = [int(part) for part in value.split("/")]
+    except ValueError:
+        raise P1203StandaloneError("Invalid shard {}, must be i/N, e.g. 1/4".format(value))
+    if count < 1 or not 1 <= index <= count:
+        raise P1203StandaloneError("Invalid shard {}, must be i/N with 1 <= i <= N".format(value))
+    return index, count
+
+
+def shard_of(input_file, count):
+    """
+    Return the shard (starting at 1) that an input file belongs to, out of count shards
+    """
+    path = os.path.normpath(input_file).encode("utf-8")
+    return int(hashlib.sha1(path).hexdigest(), 16) % count + 1
+
+
+def select_shard(input_files, index, count):
+    """
+    Return the input files that belong to shard index out of count, in their original order
+    """
+    return [input_file for input_file in input_files if shard_of(input_file, count) == index]
+
+
+def merge_results(results, expected=None):
+    """
+    Combine the outputs of several shards into one.
+
+    Arguments:
+        results {list} -- dicts of input file -> output, as printed by the CLI
+        expected {list} -- if given, all input files that must be part of the merged output
+
+    Returns:
+        dict -- input file -> output
+    """
+    merged = {}
+    for result in results:
+        for input_file, output in result.items():
+            if input_file in merged and merged[input_file] != output:
+                raise P1203StandaloneError("Different outputs for {} in two shards".format(input_file))
+            merged[input_file] = output
+    if expected is not None:
+        missing = [input_file for input_file in expected if input_file not in merged]
+        if missing:
+            raise P1203StandaloneError("{} inputs have no output, e.g. {}".format(len(missing), missing[0]))
+    return merged
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Assign inputs to shards and merge shard outputs of p1203-standalone --shard",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    merge = subparsers.add_parser("merge", help="combine the JSON outputs of all shards")
+    merge.add_argument("results", type=str, nargs="+", help="JSON output of each shard")
+    merge.add_argument("-o", "--output", type=str, default=None, help="output file, stdout if not set")
+    merge.add_argument("--expect", type=str, nargs="+", default=None, help="input files that must all have an output")
+    assign = subparsers.add_parser("assign", help="print the input files of one shard")
+    assign.add_argument("shard", type=str, help="shard i/N")
+    assign.add_argument("input", type=str, nargs="+", help="all input files")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "merge":
+            results = []
+            for result_file in args.results:
+                try:
+                    with open(result_file) as f:
+                        results.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    raise P1203StandaloneError("Could not read shard output {}: {}".format(result_file, e))
+            merged = json.dumps(merge_results(results, args.expect), indent=True, sort_keys=True)
+            if args.output is None:
+                print(merged)
+            else:
+                with open(args.output, "w") as f:
+                    f.write(merged + "\n")
+        elif args.command == "assign":
+            index, count = parse_shard(args.shard)
+            for input_file in select_shard(args.input, index, count):
+                print(input_file)
+        else:
+            parser.print_help()
+            return 1
+    except P1203StandaloneError:
+        # already logged
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
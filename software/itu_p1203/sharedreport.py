@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Transport of input reports to worker processes through shared memory.
+
+The frames of the video segments (types, sizes and QP values) make up
+nearly all of a mode 1 or mode 3 report. share_report() stores them as
+columns in one shared memory block and returns a small, picklable handle with
+the rest of the report. Workers open the handle with open_shared_report()
+and get the report back, with the frames of each segment as a read-only
+sequence of frame dicts (SegmentFrames) on top of the shared arrays,
+without copying or unpickling them. The array engine of Pv reads the
+columns directly.
+
+Frames are only stored as columns if they have no other keys than
+"frameType", "frameSize" and "qpValues" and if all sizes (and all QP values)
+are either integers or floats (or all sizes integers written as strings), so
+that the frame dicts come back unchanged.
+Otherwise the frames stay in the handle.
+"""
+
+import contextlib
+import copy
+from collections.abc import Sequence
+
+import numpy as np
+
+from . import log
+from .errors import P1203StandaloneError
+from .featurestore import RaggedColumn
+
+logger = log.setup_custom_logger('main')
+
+FRAME_KEYS = {"frameType", "frameSize", "qpValues"}
+
+# shared memory blocks created by this process, by name
+_owned = {}
+
+
+def _shared_memory():
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise P1203StandaloneError("Shared memory transport requires Python 3.8 or newer")
+    return shared_memory
+
+
+def shared_memory_available():
+    """
+    Return True if multiprocessing.shared_memory can be used
+    """
+    try:
+        _shared_memory()
+    except P1203StandaloneError:
+        return False
+    return True
+
+
+class FrameColumns:
+    """
+    Frames of all segments of a report, concatenated
+    """
+
+    def __init__(self, types, categories, sizes, qp_present, qp_values, sizes_as_str=False):
+        """
+        Arguments:
+            types {np.array} -- frame type per frame, as codes into categories
+            categories {list} -- frame type strings
+            sizes {np.array} -- frame size per frame
+            qp_present {np.array} -- True for frames with a "qpValues" key
+            qp_values {RaggedColumn} -- QP values per frame
+            sizes_as_str {bool} -- return the (integer) sizes as strings, as in the input report
+        """
+        self.types = types
+        self.categories = list(categories)
+        self.sizes = sizes
+        self.sizes_as_str = sizes_as_str
+        self.qp_present = qp_present
+        self.qp_values = qp_values
+
+    def close(self):
+        """
+        Drop the arrays, e.g. before the memory they are stored in is freed
+        """
+        self.types = self.sizes = self.qp_present = self.qp_values = None
+
+    def frame(self, index):
+        """
+        Return the frame dict of the frame with the given index
+        """
+        if self.types is None:
+            raise P1203StandaloneError("The frames of this report are not available anymore")
+        frame = {
+            "frameType": self.categories[self.types[index]],
+            "frameSize": str(self.sizes[index]) if self.sizes_as_str else self.sizes[index].item(),
+        }
+        if self.qp_present[index]:
+            frame["qpValues"] = self.qp_values[index].tolist()
+        return frame
+
+
+class SegmentFrames(Sequence):
+    """
+    Read-only list of the frame dicts of one segment, built on access from FrameColumns
+    """
+
+    def __init__(self, columns, start, stop):
+        self.columns = columns
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        return self.columns.frame(self.start + index)
+
+    def __iter__(self):
+        for index in range(self.start, self.stop):
+            yield self.columns.frame(index)
+
+    def all_have_qp_values(self):
+        """
+        Return True if every frame has a "qpValues" key
+        """
+        return bool(self.columns.qp_present[self.start:self.stop].all())
+
+
+class SharedReportHandle:
+    """
+    Picklable reference to a report in shared memory, see share_report()
+    """
+
+    def __init__(self, name, layout, categories, sizes_as_str, frame_ranges, skeleton):
+        self.name = name
+        self.layout = layout  # array name -> (dtype, byte offset, length)
+        self.categories = categories
+        self.sizes_as_str = sizes_as_str
+        self.frame_ranges = frame_ranges  # (start, stop) per video segment, None if its frames are in the skeleton
+        self.skeleton = skeleton  # the report without the frames stored in shared memory
+
+
+def _uniform_type(values, allow_str=False):
+    """
+    int or float if all values are of that type (bools excluded), str if allowed
+    and all values are integers written as strings, None otherwise
+    """
+    if all(type(value) is int for value in values):
+        return int
+    if all(type(value) is float for value in values):
+        return float
+    if allow_str and all(type(value) is str and value.isdigit() and str(int(value)) == value for value in values):
+        return str
+    return None
+
+
+def _columnar_segments(segments):
+    """
+    Return the indices of the segments whose frames can be stored as columns,
+    and the number types of the sizes and QP values
+    """
+    candidates = [
+        index for index, segment in enumerate(segments)
+        if isinstance(segment.get("frames"), list) and all(
+            isinstance(frame, dict) and set(frame.keys()) <= FRAME_KEYS and
+            "frameType" in frame and "frameSize" in frame and isinstance(frame["frameType"], str) and
+            isinstance(frame.get("qpValues", []), list)
+            for frame in segment["frames"]
+        )
+    ]
+    frames = [frame for index in candidates for frame in segments[index]["frames"]]
+    size_type = _uniform_type([frame["frameSize"] for frame in frames], allow_str=True)
+    qp_type = _uniform_type([qp for frame in frames for qp in frame.get("qpValues", [])])
+    if size_type is None or qp_type is None:
+        return [], None, None
+    return candidates, size_type, qp_type
+
+
+def share_report(report):
+    """
+    Store the video frames of a report in a new shared memory block
+
+    Arguments:
+        report {dict} -- input report
+
+    Returns:
+        SharedReportHandle -- handle to pass to workers; call release_report()
+                              once all workers are done with it
+    """
+    shared_memory = _shared_memory()
+
+    segments = report.get("I13", {}).get("segments", [])
+    columnar, size_type, qp_type = _columnar_segments(segments)
+    frames = [frame for index in columnar for frame in segments[index]["frames"]]
+
+    categories = sorted(set(frame["frameType"] for frame in frames))
+    codes = {category: code for code, category in enumerate(categories)}
+    qp_lists = [frame.get("qpValues", []) for frame in frames]
+    qp_offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+    np.cumsum([len(qp_list) for qp_list in qp_lists], out=qp_offsets[1:])
+    arrays = {
+        "types": np.array([codes[frame["frameType"]] for frame in frames], dtype=np.uint8 if len(categories) <= 256 else np.int32),
+        "sizes": np.array(
+            [int(frame["frameSize"]) if size_type is str else frame["frameSize"] for frame in frames],
+            dtype=np.float64 if size_type is float else np.int64
+        ),
+        "qp_present": np.array(["qpValues" in frame for frame in frames], dtype=bool),
+        "qp_values": np.array([qp for qp_list in qp_lists for qp in qp_list], dtype=np.int64 if qp_type is int else np.float64),
+        "qp_offsets": qp_offsets,
+    }
+
+    layout = {}
+    size = 0
+    for name, array in arrays.items():
+        # keep every array 8-byte aligned
+        size = (size + 7) // 8 * 8
+        layout[name] = (array.dtype.str, size, len(array))
+        size += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, array in arrays.items():
+        dtype, offset, length = layout[name]
+        np.ndarray(length, dtype=dtype, buffer=block.buf, offset=offset)[:] = array
+
+    frame_ranges = [None] * len(segments)
+    start = 0
+    skeleton = copy.copy(report)
+    if segments:
+        skeleton["I13"] = copy.copy(report["I13"])
+        skeleton["I13"]["segments"] = list(segments)
+        for index in columnar:
+            stop = start + len(segments[index]["frames"])
+            frame_ranges[index] = (start, stop)
+            start = stop
+            segment = dict(segments[index])
+            del segment["frames"]
+            skeleton["I13"]["segments"][index] = segment
+
+    _owned[block.name] = block
+    logger.debug("Shared {} frames of a report in {} bytes".format(len(frames), size))
+    return SharedReportHandle(block.name, layout, categories, size_type is str, frame_ranges, skeleton)
+
+
+def release_report(handle):
+    """
+    Free the shared memory of a report shared by this process
+    """
+    block = _owned.pop(handle.name, None)
+    if block is None:
+        return
+    block.close()
+    block.unlink()
+
+
+@contextlib.contextmanager
+def open_shared_report(handle):
+    """
+    Open a report shared with share_report(), e.g. in a worker process:
+
+        with open_shared_report(handle) as report:
+            output = P1203Standalone(report).calculate_complete()
+
+    The frames are views on the shared memory, so the report must not be used
+    after the block is closed at the end of the with statement.
+    """
+    shared_memory = _shared_memory()
+    block = shared_memory.SharedMemory(name=handle.name)
+    columns = None
+    try:
+        arrays = {
+            name: np.ndarray(length, dtype=dtype, buffer=block.buf, offset=offset)
+            for name, (dtype, offset, length) in handle.layout.items()
+        }
+        columns = FrameColumns(
+            arrays["types"], handle.categories, arrays["sizes"], arrays["qp_present"],
+            RaggedColumn(arrays["qp_values"], arrays["qp_offsets"]), handle.sizes_as_str
+        )
+        del arrays
+
+        report = copy.copy(handle.skeleton)
+        if "I13" in report:
+            report["I13"] = copy.copy(report["I13"])
+            report["I13"]["segments"] = [
+                dict(segment, frames=SegmentFrames(columns, *frame_range)) if frame_range is not None else segment
+                for segment, frame_range in zip(report["I13"]["segments"], handle.frame_ranges)
+            ]
+        yield report
+    finally:
+        # the report may still be referenced, but the shared arrays must not
+        if columns is not None:
+            columns.close()
+        report = columns = None
+        try:
+            block.close()
+        except BufferError:
+            logger.warning("Frames of shared report {} are still referenced, not closing it".format(handle.name))
+
+
+def _score_shared_report(args):
+    handle, kwargs = args
+    from .itu_p1203 import P1203Standalone
+    with open_shared_report(handle) as report:
+        return P1203Standalone(report, **kwargs).calculate_complete()
+
+
+def score_reports(reports, processes=None, **kwargs):
+    """
+    Score input reports in a process pool, passing them to the workers through
+    shared memory instead of pickling them
+
+    Arguments:
+        reports {list} -- input reports
+        processes {int} -- number of worker processes (default: {None}, CPU count)
+        kwargs -- passed to P1203Standalone, e.g. mode=0
+
+    Returns:
+        list -- output of P1203Standalone.calculate_complete() per report
+    """
+    import multiprocessing
+
+    handles = []
+    try:
+        for report in reports:
+            handles.append(share_report(report))
+        with multiprocessing.Pool(processes=processes) as pool:
+            return pool.map(_score_shared_report, [(handle, kwargs) for handle in handles])
+    finally:
+        for handle in handles:
+            release_report(handle)
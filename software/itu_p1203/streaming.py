@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Scoring very long sessions in constant memory.
+
+P1203Pa and P1203Pv accept an iterator over the segments instead of a list.
+Each segment is then read when it is needed and dropped once its frames have
+left the measurement window, so that only the frames of the last 20 seconds
+are kept. The mode has to be given, since it cannot be detected without
+reading the whole session first. The scores can be written to a sink instead
+of being kept in a list:
+
+    with FileSink("o22.txt") as sink:
+        P1203Pv(read_segments("video.jsonl"), mode=1, sink=sink).calculate()
+
+A sink is any object with append(score) and len(); note that in modes 0 and
+1, P1203Pv appends every score twice, as it does to its O22 list.
+"""
+
+import json
+
+import numpy as np
+
+from .errors import P1203StandaloneError
+
+
+def read_segments(path):
+    """
+    Yield the segments of a JSON lines file, one segment (as in "I11" or "I13") per line
+
+    Arguments:
+        path {str} -- input file
+    """
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise P1203StandaloneError("Invalid segment in line {} of {}: {}".format(line_number, path, e))
+
+
+class FileSink:
+    """
+    Writes each score as one line of text
+    """
+
+    def __init__(self, file):
+        """
+        Arguments:
+            file {str or file} -- output path, or a file object opened for writing text
+        """
+        if isinstance(file, str):
+            self._file = open(file, "w")
+            self._owned = True
+        else:
+            self._file = file
+            self._owned = False
+        self._count = 0
+
+    def append(self, score):
+        self._file.write(repr(float(score)) + "\n")
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """
+        Flush the output, and close it if it was opened by the sink
+        """
+        if self._owned:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArrayChunkSink:
+    """
+    Collects scores in float64 arrays of a fixed size and passes each full
+    array to a callback, e.g. to append it to a file or a database
+    """
+
+    def __init__(self, on_chunk, chunk_size=3600):
+        """
+        Arguments:
+            on_chunk {callable} -- called with a np.array of scores; all but the last have chunk_size scores
+            chunk_size {int} -- number of scores per array (default: {3600})
+        """
+        if chunk_size < 1:
+            raise P1203StandaloneError("Chunk size must be at least 1")
+        self._on_chunk = on_chunk
+        self._chunk = np.empty(chunk_size, dtype=np.float64)
+        self._filled = 0
+        self._count = 0
+
+    def append(self, score):
+        self._chunk[self._filled] = score
+        self._filled += 1
+        self._count += 1
+        if self._filled == len(self._chunk):
+            self.flush()
+
+    def __len__(self):
+        return self._count
+
+    def flush(self):
+        """
+        Pass the scores collected so far to the callback
+        """
+        if self._filled:
+            self._on_chunk(self._chunk[:self._filled].copy())
+            self._filled = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import numpy as np
+
+
+class Trace:
+    """
+    Collects the intermediate values of the model functions, one record per
+    call, column by column.
+
+    Pass an instance as `trace` to the model functions, e.g.
+    P1203Pv.video_model_function_mode0(..., trace=trace), and read the
+    columns with to_arrays().
+    """
+
+    def __init__(self):
+        self._columns = {}
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, record):
+        """
+        Add one record (dict of column name -> number). Columns that are
+        missing in a record, or only appear later, are filled with NaN.
+        """
+        for name, value in record.items():
+            column = self._columns.get(name)
+            if column is None:
+                column = [np.nan] * self._length
+                self._columns[name] = column
+            column.append(float(value))
+        self._length += 1
+        for column in self._columns.values():
+            if len(column) < self._length:
+                column.append(np.nan)
+
+    def update_last(self, record):
+        """
+        Set values of the last record, adding columns if needed
+        """
+        if not self._length:
+            raise IndexError("Trace has no records to update")
+        for name, value in record.items():
+            column = self._columns.get(name)
+            if column is None:
+                column = [np.nan] * self._length
+                self._columns[name] = column
+            column[-1] = float(value)
+
+    def repeat_last(self):
+        """
+        Add a copy of the last record
+        """
+        if not self._length:
+            raise IndexError("Trace has no records to repeat")
+        for column in self._columns.values():
+            column.append(column[-1])
+        self._length += 1
+
+    def columns(self):
+        """
+        Return the column names in the order they were first recorded
+        """
+        return list(self._columns.keys())
+
+    def to_arrays(self):
+        """
+        Return the records as dict of column name -> float64 array
+        """
+        return {name: np.array(column, dtype=np.float64) for name, column in self._columns.items()}
@@ -25,6 +25,7 @@ SOFTWARE.
 
 import re
 import json
+import logging
 import os
 import sys
 import numpy as np
@@ -181,6 +182,23 @@ def check_segment_continuity(segments):
     logger.debug("Checked segment continuity")
 
 
+def checked_segments(segments):
+    """
+    Yield the segments of an iterator, warning about gaps between them like
+    check_segment_continuity(), without keeping more than one segment
+
+    Arguments:
+        segments {iterable} -- segments
+    """
+    last_segment_end = None
+    for segment in segments:
+        this_segment_start = segment["start"]
+        if last_segment_end is not None and last_segment_end != this_segment_start:
+            logger.warning("Segment starts at {this_segment_start} but last one ended at {last_segment_end}".format(**locals()))
+        last_segment_end = segment["start"] + segment["duration"]
+        yield segment
+
+
 def get_chunk_hash(frame, type="video"):
     """
     Return a hash value that uniquely identifies a given frame belonging to
@@ -194,7 +212,11 @@ def get_chunk_hash(frame, type="video"):
     Returns:
         str -- representation ID or hash of the quality level
     """
-    if "representation" in frame.keys():
+    segment = getattr(frame, "segment", None)
+    if segment is not None:
+        # a frames.Frame, the hash is the same for all frames of the segment
+        return segment.chunk_hashes[type]
+    if "representation" in frame:
         return frame["representation"]
     if type == "video":
         return hash(str(frame["bitrate"]) + str(frame["codec"]) + str(frame["fps"]))
@@ -204,12 +226,35 @@ def get_chunk_hash(frame, type="video"):
         raise P1203StandaloneError("Wrong type for frame: " + str(type))
 
 
+def get_output_sample_index(frames, output_sample_timestamp):
+    """
+    Return the index of the last frame with a DTS before the output sample timestamp
+
+    Arguments:
+        frames {list} -- list of frames.Frame, sorted by DTS
+        output_sample_timestamp {int} -- output sample timestamp
+
+    Returns:
+        int -- frame index
+    """
+    lo, hi = 0, len(frames)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if frames[mid].dts < output_sample_timestamp:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo == 0:
+        raise IndexError("No frame before output sample timestamp {}".format(output_sample_timestamp))
+    return lo - 1
+
+
 def get_chunk(frames, output_sample_index, type="video"):
     """
     Get chunk with frames with same quality as the frame at the output sample time
 
     Arguments:
-        frames {list} -- list of frame dicts, each carrying at least the keys: "codec", "bitrate", "framerate"
+        frames {list} -- list of frames.Frame, or of frame dicts with at least the keys "codec", "bitrate", "fps"
         output_sample_index {int} -- output sample timestamp index
         type {str} -- type of operation (video or audio) (default: {"video"})
 
@@ -248,6 +293,30 @@ def get_chunk(frames, output_sample_index, type="video"):
     return [frames[w] for w in window]
 
 
+def diagnostics_enabled(trace):
+    """
+    Return True if intermediate model values are needed, i.e. if a trace
+    is given or debug logging is enabled. Check this before building a
+    diagnostic record, so that no work is done otherwise.
+    """
+    return trace is not None or logger.isEnabledFor(logging.DEBUG)
+
+
+def record_diagnostics(trace, record):
+    """
+    Add a record of intermediate model values to the trace (if given) and
+    to the debug log (if enabled)
+
+    Arguments:
+        trace {Trace} -- trace to append to, or None
+        record {dict} -- dict of value name -> number
+    """
+    if trace is not None:
+        trace.append(record)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps({key: round(value, 2) for key, value in record.items()}, indent=True))
+
+
 def read_json_without_comments(input_file):
     """
     Parses a JSON file, stripping C-style comments.
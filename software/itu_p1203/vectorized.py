@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017-2018 Deutsche Telekom AG, Technische Universität Berlin, Technische
+Universität Ilmenau, LM Ericsson
+
+Permission is hereby granted, free of charge, to use the software for research
+purposes.
+
+Any other use of the software, including commercial use, merging, publishing,
+distributing, sublicensing, and/or selling copies of the Software, is
+forbidden. For a commercial license, please contact the respective rights
+holders of the standards ITU-T Rec. P.1203, ITU-T Rec. P.1203.1, ITU-T Rec.
+P.1203.2, and ITU-T Rec. P.1203.3. See https://www.itu.int/en/ITU-T/ipr/Pages/default.aspx
+for more information.
+
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS LICENSE.
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Array versions of the Pv and Pa model functions.
+
+Each function takes numpy arrays (or anything that broadcasts, e.g. one
+value per output sample) instead of single values and computes the same
+formulas as P1203Pv.video_model_function_modeN and
+P1203Pa.audio_model_function for all elements at once.
+"""
+
+import numpy as np
+
+from . import utils
+from .errors import P1203StandaloneError
+from .p1203Pa import P1203Pa
+from .p1203Pv import P1203Pv
+
+
+def _as_float_array(x):
+    return np.asarray(x, dtype=np.float64)
+
+
+def mos_from_r(Q):
+    """
+    Array version of utils.mos_from_r
+    """
+    Q = _as_float_array(Q)
+    MOS = utils.MOS_MIN + (utils.MOS_MAX - utils.MOS_MIN) * Q / 100.0 + Q * \
+        (Q - 60.0) * (100.0 - Q) * 0.000007
+    # like min(MOS_MAX, max(MOS, MOS_MIN)) in the scalar version, NaN ends up as MOS_MAX
+    return np.fmin(utils.MOS_MAX, np.maximum(MOS, utils.MOS_MIN))
+
+
+def r_from_mos(MOS):
+    """
+    Array version of utils.r_from_mos
+    """
+    MOS = np.clip(_as_float_array(MOS), utils.MOS_MIN, utils.MOS_MAX)
+    return np.interp(MOS, utils.R_FROM_MOS_KEYS, utils.R_FROM_MOS_VALUES)
+
+
+def degradation_due_to_upscaling(coding_res, display_res):
+    """
+    Array version of P1203Pv.degradation_due_to_upscaling
+    """
+    scale_factor = _as_float_array(display_res) / _as_float_array(coding_res)
+    scale_factor = np.maximum(scale_factor, 1)
+    u1 = 72.61
+    u2 = 0.32
+    deg_scal_v = u1 * np.log10(u2 * (scale_factor - 1.0) + 1.0)
+    return utils.constrain(deg_scal_v, 0.0, 100.0)
+
+
+def degradation_due_to_frame_rate_reduction(deg_cod_v, deg_scal_v, framerate):
+    """
+    Array version of P1203Pv.degradation_due_to_frame_rate_reduction
+    """
+    framerate = _as_float_array(framerate)
+    t1 = 30.98
+    t2 = 1.29
+    t3 = 64.65
+    deg_frame_rate_v = np.where(
+        framerate < 24,
+        (100 - deg_cod_v - deg_scal_v) * (t1 - t2 * framerate) / (t3 + framerate),
+        0.0
+    )
+    return utils.constrain(deg_frame_rate_v, 0.0, 100.0)
+
+
+def degradation_integration(deg_cod_v, deg_scal_v, deg_frame_rate_v):
+    """
+    Array version of P1203Pv.degradation_integration
+    """
+    deg_all = utils.constrain(deg_cod_v + deg_scal_v + deg_frame_rate_v, 0.0, 100.0)
+    qv = 100 - deg_all
+    return mos_from_r(qv)
+
+
+def _integrate(mos_cod_v, coding_res, display_res, framerate):
+    deg_cod_v = 100.0 - r_from_mos(mos_cod_v)
+    deg_cod_v = utils.constrain(deg_cod_v, 0.0, 100.0)
+    deg_scal_v = degradation_due_to_upscaling(coding_res, display_res)
+    deg_frame_rate_v = degradation_due_to_frame_rate_reduction(deg_cod_v, deg_scal_v, framerate)
+    return degradation_integration(deg_cod_v, deg_scal_v, deg_frame_rate_v)
+
+
+def video_model_function_mode0(coding_res, display_res, bitrate_kbps_segment_size, framerate):
+    """
+    Mode 0 model for arrays, see P1203Pv.video_model_function_mode0
+
+    Returns:
+        np.array -- O22 scores
+    """
+    coding_res = _as_float_array(coding_res)
+    bitrate = _as_float_array(bitrate_kbps_segment_size)
+    framerate = _as_float_array(framerate)
+
+    a1 = 11.9983519
+    a2 = -2.99991847
+    a3 = 41.2475074001
+    a4 = 0.13183165961
+    q1 = 4.66
+    q2 = -0.07
+    q3 = 4.06
+    quant = a1 + a2 * np.log(a3 + np.log(bitrate) + np.log(bitrate * bitrate / (coding_res * framerate) + a4))
+    mos_cod_v = q1 + q2 * np.exp(q3 * quant)
+    mos_cod_v = utils.constrain(mos_cod_v, 1.0, 5.0)
+
+    return _integrate(mos_cod_v, coding_res, display_res, framerate)
+
+
+def video_model_function_mode1(coding_res, display_res, bitrate_kbps_segment_size, framerate, iframe_ratio):
+    """
+    Mode 1 model for arrays, see P1203Pv.video_model_function_mode1; the
+    I-frame ratio has to be given per element
+
+    Returns:
+        np.array -- O22 scores
+    """
+    coding_res = _as_float_array(coding_res)
+    bitrate = _as_float_array(bitrate_kbps_segment_size)
+    framerate = _as_float_array(framerate)
+    # a missing ratio means there were not both I- and non-I frames
+    iframe_ratio = np.nan_to_num(_as_float_array(iframe_ratio))
+
+    a1 = 5.00011566
+    a3 = 41.3585049
+    a2 = -1.19630824
+    a4 = 0
+    q1 = 4.66
+    q2 = -0.07
+    q3 = 4.06
+    quant = a1 + a2 * np.log(a3 + np.log(bitrate) + np.log(bitrate * bitrate / (coding_res * framerate) + a4))
+    mos_cod_v = q1 + q2 * np.exp(q3 * quant)
+    mos_cod_v = utils.constrain(mos_cod_v, 1.0, 5.0)
+
+    c0 = -0.91562479
+    c1 = 0
+    c2 = -3.28579526
+    c3 = 20.4098663
+    mos_cod_v = mos_cod_v + utils.sigmoid(c0, c1, c2, c3, iframe_ratio)
+
+    return _integrate(mos_cod_v, coding_res, display_res, framerate)
+
+
+def video_model_function_quant(coding_res, display_res, framerate, quant):
+    """
+    Mode 2 and mode 3 model for arrays, see P1203Pv.video_model_function_mode2/3;
+    takes the quantization parameter (average non-I QP / 51) per element
+
+    Returns:
+        np.array -- O22 scores
+    """
+    quant = _as_float_array(quant)
+    mos_cod_v = P1203Pv.VIDEO_COEFFS[0] + P1203Pv.VIDEO_COEFFS[1] * np.exp(P1203Pv.VIDEO_COEFFS[2] * quant)
+    mos_cod_v = np.maximum(np.minimum(mos_cod_v, 5), 1)
+    return _integrate(mos_cod_v, coding_res, display_res, framerate)
+
+
+def audio_model_function(codec, bitrate):
+    """
+    Audio model for arrays, see P1203Pa.audio_model_function
+
+    Arguments:
+        codec {str or array of str} -- audio codec(s)
+        bitrate {array} -- bitrates in kBit/s
+
+    Returns:
+        np.array -- O21 scores
+    """
+    bitrate = _as_float_array(bitrate)
+    codec = np.broadcast_to(np.asarray(codec), bitrate.shape)
+    invalid = set(np.unique(codec)) - set(P1203Pa.VALID_CODECS)
+    if invalid:
+        raise P1203StandaloneError("Unsupported audio codec {}, use any of {}".format(sorted(invalid)[0], P1203Pa.VALID_CODECS))
+
+    a1 = np.empty(bitrate.shape)
+    a2 = np.empty(bitrate.shape)
+    a3 = np.empty(bitrate.shape)
+    for name in P1203Pa.VALID_CODECS:
+        mask = codec == name
+        a1[mask] = P1203Pa.COEFFS_A1[name]
+        a2[mask] = P1203Pa.COEFFS_A2[name]
+        a3[mask] = P1203Pa.COEFFS_A3[name]
+
+    q_cod_a = a1 * np.exp(a2 * bitrate) + a3
+    qa = 100 - q_cod_a
+    return mos_from_r(qa)
+
+
+def avg_noni_qp(is_iframe, qp_values, offsets, mode=3):
+    """
+    Average QP of the non-I frames per sample, as computed from the frames in
+    P1203Pv.video_model_function_mode2/3, for the frames of many samples at once.
+
+    In mode 3, the QP of the last non-I frame before an I frame is replaced by the
+    QP of the non-I frame before it; if it is the only non-I frame collected so
+    far, it is dropped instead.
+
+    Arguments:
+        is_iframe {np.array} -- True for each I frame, frames of all samples concatenated
+        qp_values {np.array} -- QP per frame, same layout
+        offsets {np.array} -- start of each sample's frames, plus the total number of frames
+        mode {int} -- 2 or 3
+
+    Returns:
+        np.array -- average QP per sample, NaN for samples without non-I frames
+    """
+    if mode not in [2, 3]:
+        raise P1203StandaloneError("Average non-I QP is only defined for mode 2 and 3")
+    is_iframe = np.asarray(is_iframe, dtype=bool)
+    qp_values = _as_float_array(qp_values)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    num_samples = len(offsets) - 1
+    lengths = np.diff(offsets)
+    sample_of_frame = np.repeat(np.arange(num_samples), lengths)
+    is_noni = ~is_iframe
+    keep = is_noni.copy()
+    values = qp_values
+
+    if mode == 3 and len(is_iframe):
+        # split the frames of each sample into runs that end with an I frame
+        # (or with the end of the sample)
+        run_start = np.zeros(len(is_iframe), dtype=bool)
+        run_start[offsets[:-1][lengths > 0]] = True
+        run_start[1:] |= is_iframe[:-1]
+        run_of_frame = np.cumsum(run_start) - 1
+        num_runs = run_of_frame[-1] + 1
+        run_noni = np.bincount(run_of_frame, weights=is_noni, minlength=num_runs)
+        run_ended_by_i = np.bincount(run_of_frame, weights=is_iframe, minlength=num_runs) > 0
+        run_sample = sample_of_frame[run_start]
+
+        # a single non-I frame before an I frame is dropped, as long as no run
+        # with more non-I frames came before it in the same sample
+        long_run = run_ended_by_i & (run_noni >= 2)
+        long_runs_before = np.cumsum(long_run) - long_run
+        first_run_of_sample = np.flatnonzero(np.r_[True, run_sample[1:] != run_sample[:-1]])
+        long_runs_before -= np.repeat(long_runs_before[first_run_of_sample], np.diff(np.r_[first_run_of_sample, num_runs]))
+        dropped_run = run_ended_by_i & (run_noni == 1) & (long_runs_before == 0)
+        keep &= ~dropped_run[run_of_frame]
+
+        # otherwise, the last non-I frame of a run ended by an I frame takes the
+        # value of the kept non-I frame before it; for consecutive replaced
+        # frames, that is the value of the last frame that was not replaced
+        replaced_run = run_ended_by_i & (run_noni >= 1) & ~dropped_run
+        noni_run = run_of_frame[is_noni]
+        last_noni = np.zeros(len(is_iframe), dtype=bool)
+        last_noni[np.flatnonzero(is_noni)[np.r_[noni_run[1:] != noni_run[:-1], True][:len(noni_run)]]] = True
+        replaced = last_noni & replaced_run[run_of_frame] & keep
+
+        # since the first kept frame of a sample is never replaced, this stays within the sample
+        kept_index = np.flatnonzero(keep)
+        is_replaced = replaced[kept_index]
+        source = np.maximum.accumulate(np.where(is_replaced, 0, np.arange(len(kept_index))))
+        values = qp_values.copy()
+        values[kept_index] = qp_values[kept_index][source]
+
+    sums = np.bincount(sample_of_frame[keep], weights=values[keep], minlength=num_samples)
+    counts = np.bincount(sample_of_frame[keep], minlength=num_samples)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
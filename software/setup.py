@@ -33,7 +33,10 @@ setup(
     # url='https://example.com/',
     packages=['itu_p1203'],
     include_package_data=True,
-    install_requires=["numpy", "scipy", "pandas"],
+    install_requires=["numpy", "pandas"],
+    extras_require={
+        "jit": ["numba"],
+    },
     package_data={
         '': ['itu_p1203/trees/*']
     },
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import os
+import subprocess
 import sys
 import unittest
 
@@ -82,6 +83,786 @@ class TestP1203Parts(unittest.TestCase):
 
         self.assertTrue(failed == 0)
 
+    def test_metrics(self):
+        """
+        Collect stage timings and counters of a complete model run
+        """
+        from itu_p1203 import Metrics
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        test_data = utils.read_json_without_comments(basedir + "examples/mode1.json")
+
+        finished_stages = []
+        metrics = Metrics(callback=lambda name, seconds: finished_stages.append(name))
+        result = P1203Standalone(test_data, metrics=metrics).calculate_complete()
+        recorded = metrics.as_dict()
+
+        self.assertEqual(finished_stages, ["Pa", "Pv", "Pq"])
+        for name in ["Pa", "Pv", "Pq", "Pv.get_chunk", "Pv.model_function", "Pq.rfmodel"]:
+            self.assertGreater(recorded["timings"][name], 0)
+        self.assertEqual(recorded["counters"]["Pv.frames"], sum(len(s["frames"]) for s in test_data["I13"]["segments"]))
+        self.assertEqual(recorded["counters"]["Pq.trees_evaluated"], 20)
+        self.assertGreater(recorded["counters"]["Pv.window_callbacks"], 0)
+
+        # results do not depend on instrumentation
+        self.assertEqual(result["O46"], P1203Standalone(test_data).calculate_complete()["O46"])
+
+    def test_mode_selection(self):
+        """
+        Detect the available mode once, and run a lower mode on request
+        """
+        import copy
+        from itu_p1203.errors import P1203StandaloneError
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        test_data = utils.read_json_without_comments(basedir + "examples/mode1.json")
+        segments = test_data["I13"]["segments"]
+        self.assertEqual(P1203Pv.detect_mode(segments), 1)
+
+        # mode 0 on a mode 1 report is the same as dropping the frame information
+        without_frames = copy.deepcopy(test_data)
+        for segment in without_frames["I13"]["segments"]:
+            del segment["frames"]
+        forced = P1203Standalone(test_data, mode=0).calculate_complete()
+        self.assertEqual(forced["mode"], 0)
+        self.assertEqual(forced["O46"], P1203Standalone(without_frames).calculate_complete()["O46"])
+
+        with self.assertRaises(P1203StandaloneError):
+            P1203Pv(segments, mode=3).calculate()
+
+        with_qps = copy.deepcopy(segments)
+        for segment in with_qps:
+            for frame in segment["frames"]:
+                frame["qpValues"] = [30, 32]
+        self.assertEqual(P1203Pv.detect_mode(with_qps), 3)
+        pv = P1203Pv(with_qps, mode=2)
+        self.assertEqual(pv.calculate()["video"]["mode"], 2)
+        self.assertEqual(pv.available_mode, 3)
+        self.assertEqual(P1203Pv(with_qps, mode=1).calculate()["video"]["O22"], P1203Pv(segments).calculate()["video"]["O22"])
+
+    def test_scoring_budget(self):
+        """
+        Lower the video mode of sessions that do not fit into the time budget
+        """
+        from itu_p1203 import ScoringBudget
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        test_data = utils.read_json_without_comments(basedir + "examples/mode1.json")
+
+        budget = ScoringBudget(3600, sessions=3)
+        self.assertEqual(P1203Standalone(test_data, budget=budget).calculate_complete()["mode"], 1)
+        self.assertEqual(budget.sessions_left, 2)
+
+        # a mode 1 session that is estimated to take too long falls back to mode 0
+        budget.frame_costs[1] = 3600
+        result = P1203Standalone(test_data, budget=budget).calculate_complete()
+        self.assertEqual(result["mode"], 0)
+        self.assertEqual(result["O46"], P1203Standalone(test_data, mode=0).calculate_complete()["O46"])
+
+        # the estimates follow the measured costs
+        self.assertLess(budget.frame_costs[0], 1)
+        self.assertEqual(ScoringBudget.count_frames(test_data["I13"]["segments"], 1),
+                         sum(len(s["frames"]) for s in test_data["I13"]["segments"]))
+
+        # the mode is detected by the Pv module in use
+        class Mode0Pv(P1203Pv):
+            @staticmethod
+            def detect_mode(segments):
+                return 0
+
+        result = P1203Standalone(test_data, Pv=Mode0Pv, budget=ScoringBudget(3600)).calculate_complete()
+        self.assertEqual(result["mode"], 0)
+
+        # Pv modules without modes cannot be used with a budget
+        class ConstantPv:
+            def __init__(self, segments, display_res="1920x1080", stream_id=None):
+                pass
+
+        from itu_p1203.errors import P1203StandaloneError
+        with self.assertRaises(P1203StandaloneError):
+            P1203Standalone(test_data, Pv=ConstantPv, budget=ScoringBudget(3600)).calculate_complete()
+
+    def test_scoring_budget_workers(self):
+        """
+        Share one time budget between worker processes
+        """
+        import functools
+        import time
+        from itu_p1203 import ScoringBudget
+        from itu_p1203.__main__ import _budget_for_worker, _merge_budget, _score_pipeline_item
+        from itu_p1203.pipeline import run_pipeline
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        input_file = basedir + "examples/mode1.json"
+        score = functools.partial(_score_pipeline_item, None, False, False, False, False, {}, False, None, None)
+
+        budget = ScoringBudget(3600, sessions=4, workers=2)
+        copy = budget.for_worker()
+        self.assertEqual(copy._deadline, budget._deadline)
+        self.assertEqual(budget.sessions_left, 4)
+
+        results = run_pipeline([(input_file, budget)] * 4, lambda item: None, score, score_workers=2,
+                               before_score=_budget_for_worker, after_score=_merge_budget)
+        self.assertEqual([output["mode"] for _, output in results], [1] * 4)
+        # the measurements of the workers came back
+        self.assertEqual(budget.sessions_left, 1)
+        self.assertNotEqual(budget.frame_costs[1], ScoringBudget.DEFAULT_FRAME_COSTS[1])
+
+        # estimates of the parent are used by sessions handed out later
+        budget = ScoringBudget(3600, sessions=2, workers=2)
+        budget.frame_costs[1] = 3600
+        results = run_pipeline([(input_file, budget)] * 2, lambda item: None, score, score_workers=2,
+                               before_score=_budget_for_worker, after_score=_merge_budget)
+        self.assertEqual([output["mode"] for _, output in results], [0, 0])
+
+        # the deadline is shared, so time spent waiting counts
+        budget = ScoringBudget(0.05, sessions=1, workers=2)
+        copy = budget.for_worker()
+        time.sleep(0.1)
+        self.assertLess(copy.remaining(), 0)
+
+    def test_model_cache(self):
+        """
+        Memoized mode 0 and audio model functions give the same scores
+        """
+        from itu_p1203 import modelcache
+        from itu_p1203 import P1203Pa
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        test_data = utils.read_json_without_comments(basedir + "examples/mode0.json")
+
+        modelcache.clear_caches()
+        first = P1203Standalone(test_data).calculate_complete()
+        second = P1203Standalone(test_data).calculate_complete()
+        self.assertEqual(first["O46"], second["O46"])
+
+        stats = modelcache.cache_stats()
+        for name in ["Pv.video_model_function_mode0", "Pa.audio_model_function"]:
+            self.assertGreater(stats[name]["hits"], stats[name]["misses"])
+            self.assertLessEqual(stats[name]["size"], stats[name]["maxsize"])
+
+        # the diagnostics path is not cached and gives the same values
+        segments = test_data["I13"]["segments"]
+        traced = P1203Pv(segments).calculate(diagnostics=True)["video"]["O22"]
+        self.assertEqual(traced, P1203Pv(segments).calculate()["video"]["O22"])
+        self.assertEqual(P1203Pa.cached_audio_model_function("aaclc", 96), P1203Pa.audio_model_function("aaclc", 96))
+
+    def test_ladder_table(self):
+        """
+        Score sessions of a known bitrate ladder by table lookup
+        """
+        import numpy as np
+        from itu_p1203 import LadderTable, P1203Pa
+        from itu_p1203.errors import P1203StandaloneError
+
+        video = {
+            "360p": {"resolution": "640x360", "bitrate": 400, "fps": 25, "codec": "h264"},
+            "720p": {"resolution": "1280x720", "bitrate": 1500.5, "fps": 30, "codec": "h264"},
+            "1080p": {"resolution": "1920x1080", "bitrate": 4500, "fps": 24, "codec": "h264"},
+        }
+        audio = {"low": {"bitrate": 64, "codec": "aac"}, "high": {"bitrate": 128, "codec": "aaclc"}}
+        table = LadderTable(video, audio, display_sizes=["1920x1080", "1280x720"])
+
+        video_segments, audio_segments = [], []
+        start = 0
+        for rep_id, audio_id, duration in [("360p", "low", 5.48), ("1080p", "low", 4), ("720p", "high", 3.2), ("360p", "high", 8)]:
+            video_segments.append(dict(video[rep_id], representation=rep_id, duration=duration, start=start))
+            audio_segments.append(dict(audio[audio_id], representation=audio_id, duration=duration, start=start))
+            start += duration
+
+        for display_size in table.display_sizes:
+            o22 = P1203Pv([dict(s) for s in video_segments], display_res=display_size).calculate()["video"]["O22"]
+            np.testing.assert_allclose(table.session_O22(video_segments, display_size), o22, rtol=1e-12)
+        o21 = P1203Pa([dict(s) for s in audio_segments]).calculate()["audio"]["O21"]
+        self.assertEqual(table.session_O21(audio_segments).tolist(), o21)
+
+        # a batch of sessions as (sessions, seconds) codes
+        codes = table.encode_video([["360p", "720p"], ["1080p", "1080p"]])
+        self.assertEqual(table.video_scores(codes).shape, (2, 2))
+        with self.assertRaises(P1203StandaloneError):
+            table.encode_video(["4k"])
+
+    def test_quality_direction_changes(self):
+        """
+        Longest period without and number of quality direction changes, per session and batched
+        """
+        import numpy as np
+        from itu_p1203 import P1203Pq
+
+        sessions = [
+            [1.0] * 12 + [4.0] * 12 + [1.0] * 12,
+            [3.0] * 36,
+            [1.0, 5.0] * 18,
+            list(np.linspace(1, 5, 36)),
+        ]
+        expected = [(18, 2), (39, 0), (9, 9), (36, 1)]
+        for O22, result in zip(sessions, expected):
+            self.assertEqual(P1203Pq.quality_direction_changes(O22), result)
+
+        longest, total = P1203Pq.quality_direction_changes(np.array(sessions))
+        self.assertEqual(list(zip(longest.tolist(), total.tolist())), expected)
+
+    def test_pq_batch(self):
+        """
+        Integrate sessions of different lengths at once, with the same results as P1203Pq
+        """
+        import glob
+        from itu_p1203 import P1203Pq
+        from itu_p1203 import pqbatch
+        from itu_p1203.featurestore import RaggedColumn
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../../data/'
+        O21, O22, l_buff, p_buff = [], [], [], []
+        for json_file in sorted(glob.glob(basedir + "mode*/O21O22-*.json"))[::40]:
+            data = utils.read_json_without_comments(json_file)
+            O21.append(data["O21"])
+            O22.append(data["O22"])
+            l_buff.append([l for l, p in data.get("I23", [])])
+            p_buff.append([p for l, p in data.get("I23", [])])
+        # no audio, stalling, longer audio than video
+        O21 += [[], [4.5] * 30, [3.0] * 25]
+        O22 += [[3.1, 4.2, 1.5] * 7, [2.0] * 12 + [4.0] * 12, [3.5, 3.8] * 6]
+        l_buff += [[], [2, 1.5, 4], [1]]
+        p_buff += [[], [0, 5, 17], [6]]
+
+        result = pqbatch.calculate_batch(O21, O22, l_buff, p_buff)
+        for i in range(len(O22)):
+            expected = P1203Pq(O21[i], O22[i], l_buff[i], p_buff[i]).calculate()
+            self.assertEqual(result["O46"][i], expected["O46"])
+            self.assertEqual(result["O35"][i], expected["O35"])
+            self.assertEqual(result["O23"][i], expected["O23"])
+            self.assertEqual(result["O34"][i].tolist(), expected["O34"])
+
+        # the same series as offsets into a flat buffer
+        ragged = pqbatch.calculate_batch(RaggedColumn.from_lists(O21), RaggedColumn.from_lists(O22), l_buff, p_buff)
+        self.assertEqual(ragged["O46"].tolist(), result["O46"].tolist())
+
+    def test_rf_feature_matrix(self):
+        """
+        Build the random forest features of several sessions at once, the same as per session
+        """
+        import numpy as np
+        from itu_p1203 import rfmodel
+        from itu_p1203.pqbatch import as_padded
+
+        O21 = [[4.408] * 30, [3.1, 4.2] * 10, [2.5] * 7]
+        O22 = [list(np.linspace(1, 5, 31)), [3.1, 4.2, 1.5] * 7, [2.2, 4.7, 3.3] * 5]
+        l_buff = [[], [2, 1.5, 4], [1.2]]
+        p_buff = [[], [0, 5, 17], [6]]
+        duration = [30, 20, 7]
+
+        O21_padded, O21_lengths = as_padded(O21)
+        O22_padded, O22_lengths = as_padded(O22)
+        matrix = rfmodel.feature_matrix(O21_padded, O22_padded, l_buff, p_buff, duration, O21_lengths, O22_lengths)
+        self.assertEqual(matrix.shape, (3, 14))
+        self.assertEqual(matrix.dtype, np.float64)
+        for i in range(3):
+            expected = rfmodel.features(np.array(O21[i]), np.array(O22[i]), l_buff[i], p_buff[i], duration[i])
+            self.assertEqual(matrix[i].tolist(), expected.tolist())
+
+    def test_pipeline(self):
+        """
+        Extract and score items concurrently, with a bounded number of extracted items
+        """
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from itu_p1203.errors import P1203StandaloneError
+        from itu_p1203.pipeline import run_pipeline
+
+        lock = threading.Lock()
+        extracted = []
+        scored = []
+
+        def extract(item):
+            with lock:
+                extracted.append(item)
+                # extraction may only run ahead of scoring by the queue, the item
+                # taken from it and the items being scored
+                self.assertLessEqual(len(extracted) - len(scored), 2 + 1 + 2 + 1)
+            return item * 10
+
+        def score(item, payload):
+            time.sleep(0.01)
+            with lock:
+                scored.append(item)
+            return payload + 1
+
+        with ThreadPoolExecutor(2) as executor:
+            results = run_pipeline(range(20), extract, score, extract_workers=1, score_workers=2, queue_size=2, score_executor=executor)
+        self.assertEqual(results, [i * 10 + 1 for i in range(20)])
+
+        def failing_extract(item):
+            if item == 3:
+                raise P1203StandaloneError("extraction failed")
+            return item
+
+        with ThreadPoolExecutor(2) as executor:
+            with self.assertRaises(P1203StandaloneError):
+                run_pipeline(range(6), failing_extract, score, extract_workers=2, score_workers=2, score_executor=executor)
+
+    def test_jit_engine(self):
+        """
+        The array engine gives the same O22 scores as the measurement window, compiled or not
+        """
+        import copy
+        import numpy as np
+        from itu_p1203 import jitengine
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        for example, modes in [("mode0.json", [0]), ("mode0_with_representation_ids.json", [0]), ("mode1.json", [0, 1, 2, 3])]:
+            test_data = utils.read_json_without_comments(basedir + "examples/" + example)
+            segments = copy.deepcopy(test_data["I13"]["segments"])
+            if 3 in modes:
+                # varying QP values per frame, some frames with several values
+                for segment in segments:
+                    for index, frame in enumerate(segment["frames"]):
+                        frame["qpValues"] = [20 + index % 13] * (1 + index % 3)
+            for mode in modes:
+                expected = P1203Pv(segments, test_data["IGen"]["displaySize"], mode=mode, engine="python").calculate()
+                o22 = jitengine.calculate_o22(segments, mode, test_data["IGen"]["displaySize"])
+                self.assertEqual(o22, expected["video"]["O22"])
+
+        # non-integer QPs are left to the Python engine
+        segments[0]["frames"][1]["qpValues"] = [30.5]
+        self.assertIsNone(jitengine.calculate_o22(segments, 3, "1920x1080"))
+
+        self.assertEqual(jitengine.select_engine("python"), "python")
+        self.assertEqual(jitengine.select_engine("auto"), "jit" if jitengine.HAVE_NUMBA else "python")
+
+        # round(x, 5) < n is the same as x < limit of n
+        limits = jitengine.round_limits(40)
+        for n in range(-jitengine.LIMIT_OFFSET, 40 - jitengine.LIMIT_OFFSET):
+            limit = limits[n + jitengine.LIMIT_OFFSET]
+            self.assertGreaterEqual(round(limit, 5), n)
+            self.assertLess(round(float(np.nextafter(limit, -np.inf)), 5), n)
+
+    def test_shared_report(self):
+        """
+        Pass reports to other processes through shared memory, with the same results
+        """
+        import copy
+        from itu_p1203 import sharedreport
+        from itu_p1203.errors import P1203StandaloneError
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        test_data = utils.read_json_without_comments(basedir + "examples/mode1.json")
+        with_qps = copy.deepcopy(test_data)
+        for segment in with_qps["I13"]["segments"]:
+            for index, frame in enumerate(segment["frames"]):
+                frame["qpValues"] = [25 + index % 7, 30]
+        reports = [test_data, with_qps, utils.read_json_without_comments(basedir + "examples/mode0.json")]
+
+        handle = sharedreport.share_report(with_qps)
+        try:
+            with sharedreport.open_shared_report(handle) as report:
+                segments = report["I13"]["segments"]
+                self.assertIsInstance(segments[0]["frames"], sharedreport.SegmentFrames)
+                self.assertEqual(list(segments[0]["frames"]), with_qps["I13"]["segments"][0]["frames"])
+                self.assertEqual(segments[1]["frames"][-1], with_qps["I13"]["segments"][1]["frames"][-1])
+                self.assertEqual(P1203Pv.detect_mode(segments), 3)
+            # the frames are not available after closing the report
+            with self.assertRaises(P1203StandaloneError):
+                segments[0]["frames"][0]
+        finally:
+            sharedreport.release_report(handle)
+
+        outputs = sharedreport.score_reports(reports, processes=2)
+        for report, output in zip(reports, outputs):
+            expected = P1203Standalone(report).calculate_complete()
+            self.assertEqual(output["O46"], expected["O46"])
+            self.assertEqual(output["O34"], expected["O34"])
+
+    def test_result_cache(self):
+        """
+        Serve outputs of reports scored before from the result cache
+        """
+        import copy
+        import tempfile
+        from itu_p1203.__main__ import extract_from_single_file
+        from itu_p1203.resultcache import ResultCache
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        input_file = basedir + "examples/mode1.json"
+        test_data = utils.read_json_without_comments(input_file)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResultCache(cache_dir)
+            _, output = extract_from_single_file(input_file, None, cache=cache)
+            self.assertEqual(cache.stats()["writes"], 1)
+            _, cached = extract_from_single_file(input_file, None, cache=cache)
+            self.assertEqual(cache.stats()["hits"], 1)
+            self.assertEqual(cached["O46"], output["O46"])
+            self.assertEqual(cached["O34"], output["O34"])
+
+            # key order does not matter, options and report contents do
+            reordered = dict(reversed(list(test_data.items())))
+            self.assertEqual(cache.key(reordered, mode=1), cache.key(test_data, mode=1))
+            self.assertNotEqual(cache.key(test_data, mode=0), cache.key(test_data, mode=1))
+            changed = copy.deepcopy(test_data)
+            changed["I13"]["segments"][0]["bitrate"] += 1
+            self.assertNotEqual(cache.key(changed, mode=1), cache.key(test_data, mode=1))
+
+            # broken entries are misses
+            key = cache.key(test_data, mode=1)
+            cache.put(key, {"O46": 1.0})
+            with open(cache._entry_path(key), "w") as entry_file:
+                entry_file.write("{")
+            self.assertIsNone(cache.get(key))
+
+        # reports in shared memory are hashed before they are shared, not in the worker
+        from itu_p1203 import sharedreport
+        from itu_p1203.__main__ import _cache_key, _score_pipeline_item
+
+        class WorkerCache(ResultCache):
+            def key(self, report, **options):
+                raise AssertionError("key computed in the worker")
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            key = _cache_key(ResultCache(cache_dir), test_data, None, False, False, False, False, {}, False, None)
+            cache = WorkerCache(cache_dir)
+            handle = sharedreport.share_report(test_data)
+            try:
+                for _ in range(2):
+                    (_, shared_output), _ = _score_pipeline_item(
+                        None, False, False, False, False, {}, False, None, cache, (input_file, None), (handle, key)
+                    )
+                    self.assertEqual(shared_output["O46"], output["O46"])
+            finally:
+                sharedreport.release_report(handle)
+            self.assertEqual(cache.stats()["writes"], 1)
+            self.assertEqual(cache.stats()["hits"], 1)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResultCache(cache_dir, max_entries=3)
+            cache.CHECK_INTERVAL = 1
+            for index in range(5):
+                cache.put(cache.key({"index": index}), {"O46": index})
+            self.assertIsNone(cache.get(cache.key({"index": 0})))
+            self.assertEqual(cache.get(cache.key({"index": 4})), {"O46": 4})
+            self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_shards(self):
+        """
+        Split inputs into shards by path and merge the shard outputs
+        """
+        from itu_p1203 import shards
+        from itu_p1203.errors import P1203StandaloneError
+
+        self.assertEqual(shards.parse_shard("2/4"), (2, 4))
+        for value in ["0/4", "5/4", "1", "a/b"]:
+            with self.assertRaises(P1203StandaloneError):
+                shards.parse_shard(value)
+
+        inputs = ["sessions/{}.json".format(i) for i in range(50)]
+        selected = [shards.select_shard(inputs, index, 4) for index in range(1, 5)]
+        self.assertEqual(sorted(sum(selected, [])), sorted(inputs))
+        self.assertTrue(all(selected))
+        self.assertEqual(shards.select_shard(["./sessions/3.json"], shards.shard_of("sessions/3.json", 4), 4), ["./sessions/3.json"])
+
+        merged = shards.merge_results([{"a": {"O46": 1.0}}, {"b": {"O46": 2.0}, "a": {"O46": 1.0}}], expected=["a", "b"])
+        self.assertEqual(merged, {"a": {"O46": 1.0}, "b": {"O46": 2.0}})
+        with self.assertRaises(P1203StandaloneError):
+            shards.merge_results([{"a": {"O46": 1.0}}, {"a": {"O46": 2.0}}])
+        with self.assertRaises(P1203StandaloneError):
+            shards.merge_results([{"a": {"O46": 1.0}}], expected=["a", "b"])
+
+    def test_streaming(self):
+        """
+        Score segments read from an iterator, writing the scores to a sink
+        """
+        import copy
+        import io
+        import numpy as np
+        from itu_p1203 import P1203Pa
+        from itu_p1203.errors import P1203StandaloneError
+        from itu_p1203.streaming import ArrayChunkSink, FileSink
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        test_data = utils.read_json_without_comments(basedir + "examples/mode1.json")
+        video_segments = test_data["I13"]["segments"]
+        audio_segments = test_data["I11"]["segments"]
+
+        for mode in [0, 1]:
+            expected = P1203Pv(copy.deepcopy(video_segments), mode=mode, engine="python").calculate()["video"]["O22"]
+            output = P1203Pv(iter(copy.deepcopy(video_segments)), mode=mode).calculate()["video"]["O22"]
+            self.assertEqual(output, expected)
+
+            chunks = []
+            with ArrayChunkSink(chunks.append, chunk_size=4) as sink:
+                P1203Pv(iter(copy.deepcopy(video_segments)), mode=mode, sink=sink).calculate()
+            self.assertEqual(len(sink), len(expected))
+            self.assertEqual(np.concatenate(chunks).tolist(), expected)
+
+        expected = P1203Pa(copy.deepcopy(audio_segments)).calculate()["audio"]["O21"]
+        output = io.StringIO()
+        with FileSink(output) as sink:
+            P1203Pa(iter(copy.deepcopy(audio_segments)), sink=sink).calculate()
+        self.assertEqual([float(line) for line in output.getvalue().split()], expected)
+
+        # the mode cannot be detected from an iterator
+        with self.assertRaises(P1203StandaloneError):
+            P1203Pv(iter(video_segments)).calculate()
+        with self.assertRaises(P1203StandaloneError):
+            P1203Pv(iter(video_segments), mode=3).calculate()
+
+    def test_model_function_trace(self):
+        """
+        Collect intermediate values of the model functions as arrays
+        """
+        from itu_p1203 import Trace
+
+        trace = Trace()
+        scores = [
+            P1203Pv.video_model_function_mode0(1920*1080, 1920*1080, 2801.27587623, 30, trace=trace),
+            P1203Pv.video_model_function_mode0(852*480, 1920*1080, 629.203792838, 30, trace=trace),
+            P1203Pv.video_model_function_mode1(426*240, 1920*1080, 132.874928749, 30, [], 22.5031055901, trace=trace),
+        ]
+        columns = trace.to_arrays()
+
+        self.assertEqual(len(trace), 3)
+        self.assertEqual(columns["score"].tolist(), scores)
+        for name in ["mos_cod_v", "deg_cod_v", "deg_scal_v", "deg_frame_rate_v", "quant"]:
+            self.assertEqual(len(columns[name]), 3)
+        self.assertGreater(columns["deg_scal_v"][1], 0)
+        # only mode 1 has an I-frame ratio
+        self.assertTrue(all(v != v for v in columns["iframe_ratio"][:2]))
+        self.assertAlmostEqual(columns["iframe_ratio"][2], 22.5031055901)
+
+    def test_vectorized_model_functions(self):
+        """
+        Array versions of the model functions give the per-sample scores
+        """
+        from itu_p1203 import P1203Pa
+        from itu_p1203 import vectorized
+
+        coding_res = [1920*1080, 852*480, 426*240]
+        bitrate = [2801.27587623, 629.203792838, 132.874928749]
+        framerate = [30, 24, 15]
+        iframe_ratio = [7.5, 0, 22.5031055901]
+        quant = [0.5, 0.7, float("nan")]
+
+        scores = vectorized.video_model_function_mode0(coding_res, 1920*1080, bitrate, framerate)
+        self.assertEqual(scores.tolist(), [
+            P1203Pv.video_model_function_mode0(c, 1920*1080, b, f) for c, b, f in zip(coding_res, bitrate, framerate)
+        ])
+        scores = vectorized.video_model_function_mode1(coding_res, 1920*1080, bitrate, framerate, iframe_ratio)
+        self.assertEqual(scores.tolist(), [
+            P1203Pv.video_model_function_mode1(c, 1920*1080, b, f, [], i)
+            for c, b, f, i in zip(coding_res, bitrate, framerate, iframe_ratio)
+        ])
+        scores = vectorized.video_model_function_quant(coding_res, 1920*1080, framerate, quant)
+        for score, c, f, q in zip(scores, coding_res, framerate, quant):
+            self.assertAlmostEqual(score, P1203Pv.video_model_function_mode3(c, 1920*1080, f, [], quant=q), places=12)
+        scores = vectorized.audio_model_function(["aaclc", "heaac", "ac3"], [96, 48, 192])
+        for score, codec, b in zip(scores, ["aaclc", "heaac", "ac3"], [96, 48, 192]):
+            self.assertAlmostEqual(score, P1203Pa.audio_model_function(codec, b), places=12)
+
+    def test_feature_store(self):
+        """
+        Ragged per-frame columns survive a round trip through a feature store
+        and give the same mode 3 score as the frame dicts
+        """
+        import tempfile
+        from itu_p1203 import featurestore
+        from itu_p1203 import vectorized
+
+        samples = [
+            (["I", "P", "B", "P", "I", "P"], [20, 30, 32, 34, 22, 36]),
+            (["P", "I", "B", "B"], [30, 21, 33, 35]),
+            ([], []),
+        ]
+        path = os.path.join(tempfile.mkdtemp(), "features.npz")
+        featurestore.write_feature_store(path, {
+            "sample_index": [0, 1, 2],
+            "types": featurestore.RaggedColumn.from_lists([types for types, _ in samples]),
+            "qp": featurestore.RaggedColumn.from_lists([qps for _, qps in samples]),
+        })
+        store = featurestore.read_feature_store(path)
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store["qp"][1].tolist(), [30, 21, 33, 35])
+        avg_qp = vectorized.avg_noni_qp(store["types"].equals("I"), store["qp"].values, store["qp"].offsets, mode=3)
+        for (types, qps), qp in zip(samples[:2], avg_qp):
+            frames = [{"type": t, "qpValues": [q]} for t, q in zip(types, qps)]
+            self.assertAlmostEqual(
+                P1203Pv.video_model_function_mode3(1920*1080, 1920*1080, 24, frames),
+                P1203Pv.video_model_function_mode3(1920*1080, 1920*1080, 24, [], quant=qp / 51.0),
+                places=12
+            )
+        self.assertTrue(avg_qp[2] != avg_qp[2])
+
+        # list cells are Python literals; only empty cells are invalid rows
+        from itu_p1203.errors import P1203StandaloneError
+        self.assertEqual(featurestore.parse_list("['I', 'P']"), ["I", "P"])
+        self.assertEqual(featurestore.parse_list("(31.5, 32)"), [31.5, 32])
+        self.assertEqual(featurestore.parse_list("[None, True]"), [None, True])
+        self.assertEqual(featurestore.parse_list("[\"it's\"]"), ["it's"])
+        self.assertEqual(featurestore.parse_list("[inf, -inf]"), [float("inf"), float("-inf")])
+        self.assertTrue(featurestore.parse_list("[nan]")[0] != featurestore.parse_list("[nan]")[0])
+        self.assertIsNone(featurestore.parse_list(float("nan")))
+        for value in ["[1,", "3", "__import__('os')", 3.5]:
+            with self.assertRaises(P1203StandaloneError):
+                featurestore.parse_list(value)
+
+        # in lenient columns, unparseable cells are invalid rows, and rows with
+        # non-finite values can be told apart (mode 2 falls back to mode 1 for both)
+        csv_dir = tempfile.mkdtemp()
+        with open(os.path.join(csv_dir, "pvs.csv"), "w") as csv_file:
+            csv_file.write('sample_index,types,qp\n0,"[\'I\', \'P\']","[30, 31]"\n1,"[\'I\']","[30,"\n2,"[\'I\', \'P\', \'P\']","[30, nan, 31]"\n')
+        csv_path = os.path.join(csv_dir, "pvs.csv")
+        with self.assertRaises(P1203StandaloneError):
+            featurestore.convert_csv_files([csv_path], os.path.join(csv_dir, "strict.npz"), ["types", "qp"])
+        store = featurestore.convert_csv_files([csv_path], os.path.join(csv_dir, "lenient.npz"), ["types", "qp"], ["qp"])
+        self.assertEqual(store["qp"].valid.tolist(), [True, False, True])
+        self.assertEqual(store["types"].valid.tolist(), [True, True, True])
+        self.assertEqual(store["qp"].finite_rows().tolist(), [True, True, False])
+        self.assertEqual(store["types"].finite_rows().tolist(), [True, True, True])
+
+    def test_session_archive(self):
+        """
+        Packing and unpacking per-session JSON outputs gives the same files
+        """
+        import json
+        import tempfile
+        from itu_p1203 import sessionarchive
+
+        json_dir = tempfile.mkdtemp()
+        session = {"O21": [4.5, 4.5, 4.4], "O22": [3.1, 3.2, 3.25], "I23": [[0, 2], [3, 1]], "IGen": {"displaySize": "1920x1080", "device": ""}}
+        output = {"O23": 4.0, "O34": [3.0, 3.1, 3.2], "O35": 3.1, "O46": 3.05, "O22": session["O22"], "O21": session["O21"], "mode": "3"}
+        contents = {
+            "O21O22-TR04_SRC001_HRC01.json": json.dumps(session),
+            "046-TR04_SRC001_HRC01-pc.json": json.dumps(output),
+        }
+        for name, content in contents.items():
+            with open(os.path.join(json_dir, name), "w") as f:
+                f.write(content)
+
+        archive_path = os.path.join(json_dir, "mode3.p1203a")
+        sessionarchive.pack_json_dir(json_dir, archive_path)
+        archive = sessionarchive.SessionArchive(archive_path)
+        self.assertEqual(archive.values("TR04_SRC001_HRC01", "O22").tolist(), session["O22"])
+        self.assertEqual(archive.devices(), ["pc"])
+
+        out_dir = tempfile.mkdtemp()
+        sessionarchive.unpack_json_dir(archive_path, out_dir)
+        for name, content in contents.items():
+            with open(os.path.join(out_dir, name)) as f:
+                self.assertEqual(f.read(), content)
+
+    def test_chunk_stats(self):
+        """
+        Running chunk sums and QP averages match the frames returned by
+        get_chunk for every window
+        """
+        import numpy as np
+        from itu_p1203.chunkstats import ChunkStats
+        from itu_p1203.frames import Frame, SegmentInfo
+        from itu_p1203.measurementwindow import MeasurementWindow
+
+        chunk_stats = ChunkStats()
+        checked = []
+
+        def callback(output_sample_timestamp, frames):
+            index = utils.get_output_sample_index(frames, output_sample_timestamp)
+            chunk_frames = utils.get_chunk(frames, index, type="video")
+            chunk_stats.sync_window(len(frames))
+            chunk, first_index = chunk_stats.chunk_at(index)
+            sizes = [utils.calculate_compensated_size(f["type"], f["size"], f["dts"]) for f in chunk_frames]
+            self.assertIs(frames[first_index], chunk_frames[0])
+            self.assertEqual(chunk.size_sum, sum(sizes))
+            self.assertEqual(chunk.num_frames, len(chunk_frames))
+            self.assertEqual(chunk_stats.chunk_duration(chunk, frames), np.sum([f["duration"] for f in chunk_frames]))
+            for mode, model_function in [(2, P1203Pv.video_model_function_mode2), (3, P1203Pv.video_model_function_mode3)]:
+                self.assertEqual(
+                    model_function(1920*1080, 1920*1080, 24, [], quant=chunk.avg_qp(mode) / 51.0),
+                    model_function(1920*1080, 1920*1080, 24, chunk_frames)
+                )
+            checked.append(output_sample_timestamp)
+
+        window = MeasurementWindow()
+        window.set_score_callback(callback)
+        dts = 0
+        for segment in range(30):
+            fps = [24, 25, 30][segment % 3]
+            segment_info = SegmentInfo(segment, {"fps": fps, "codec": "h264", "bitrate": 500 * (1 + segment % 4)}, 1.0 / fps)
+            for i in range(fps * 2):
+                frame = Frame(
+                    segment_info, dts, str(1000 + i), "I" if i % (7 + segment) == 0 else "P",
+                    [20 + i % 13] * (1 + i % 3),
+                )
+                chunk_stats.add_frame(frame)
+                window.add_frame(frame)
+                dts += frame.duration
+        window.stream_finished()
+        self.assertGreater(len(checked), 50)
+
+    def test_frame_records(self):
+        """
+        Frame records read like the frame dicts they replace
+        """
+        from itu_p1203.frames import Frame, SegmentInfo
+
+        segment = {"bitrate": 2000, "codec": "h264", "fps": 25, "resolution": "1280x720", "duration": 1}
+        segment_info = SegmentInfo(0, segment, 0.04)
+        frames = [Frame(segment_info, i * 0.04, 3000 + i, "I" if i == 0 else "P") for i in range(25)]
+        frame_dicts = [
+            {"duration": 0.04, "dts": i * 0.04, "bitrate": 2000, "codec": "h264", "fps": 25,
+             "resolution": "1280x720", "size": 3000 + i, "type": "I" if i == 0 else "P"}
+            for i in range(25)
+        ]
+
+        self.assertEqual(frames[3]["dts"], frame_dicts[3]["dts"])
+        self.assertEqual(frames[3]["resolution"], "1280x720")
+        self.assertEqual(sorted(frames[3].keys()), sorted(frame_dicts[3].keys()))
+        self.assertNotIn("qpValues", frames[3])
+        self.assertIsNone(frames[3].get("qpValues"))
+        for key in ["foo", "segment", "__class__"]:
+            with self.assertRaises(KeyError):
+                frames[3][key]
+            self.assertNotIn(key, frames[3])
+        for chunk_type in ["video", "audio"]:
+            self.assertEqual(utils.get_chunk_hash(frames[3], chunk_type), utils.get_chunk_hash(frame_dicts[3], chunk_type))
+        self.assertEqual(
+            P1203Pv.video_model_function_mode1(1280*720, 1920*1080, 2000, 25, frames),
+            P1203Pv.video_model_function_mode1(1280*720, 1920*1080, 2000, 25, frame_dicts)
+        )
+
+    def test_calculate_diagnostics(self):
+        """
+        Pa and Pv return intermediate values aligned with O21/O22
+        """
+        from itu_p1203 import P1203Pa
+
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        test_data = utils.read_json_without_comments(basedir + "examples/mode1.json")
+
+        video = P1203Pv(test_data["I13"]["segments"], test_data["IGen"]["displaySize"]).calculate(diagnostics=True)["video"]
+        for name in ["deg_cod_v", "deg_scal_v", "deg_frame_rate_v", "iframe_ratio", "quant", "output_sample_timestamp"]:
+            self.assertEqual(len(video["diagnostics"][name]), len(video["O22"]))
+        self.assertEqual(video["diagnostics"]["score"].tolist(), video["O22"])
+
+        audio = P1203Pa(test_data["I11"]["segments"]).calculate(diagnostics=True)["audio"]
+        self.assertEqual(audio["diagnostics"]["score"].tolist(), audio["O21"])
+
+        self.assertNotIn("diagnostics", P1203Pv(test_data["I13"]["segments"]).calculate()["video"])
+
+    def test_lazy_imports(self):
+        """
+        Importing the package or the CLI module must not load the model code,
+        the extractor or scipy
+        """
+        basedir = os.path.dirname(os.path.realpath(__file__)) + '/../'
+        code = (
+            "import sys, itu_p1203, itu_p1203.__main__; "
+            "print(','.join(m for m in ['numpy', 'scipy', 'itu_p1203.extractor', 'itu_p1203.p1203Pv'] if m in sys.modules))"
+        )
+        loaded = subprocess.check_output([sys.executable, "-c", code], cwd=basedir, universal_newlines=True).strip()
+        self.assertEqual(loaded, "")
+
+        from itu_p1203 import P1203Pq
+        self.assertTrue(callable(P1203Pq))
+
 
 if __name__ == '__main__':
     unittest.main()